@@ -1,15 +1,19 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, g, Response
 import json
 import os
+import time
 import pandas as pd
 from etl_pipeline import run_etl_pipeline
-from warehouse.warehouse_manager import WarehouseManager
+from scheduler import RunLock
+from warehouse.warehouse_manager import create_warehouse
+from warehouse.base_warehouse import UnsupportedOperation
 from utils import dataframe_to_json, clean_analytics_data
+import metrics
 
 app = Flask(__name__)
 
 # Initialize warehouse
-warehouse = WarehouseManager()
+warehouse = create_warehouse()
 
 # Store data in memory for the dashboard
 dashboard_data = {
@@ -18,6 +22,28 @@ dashboard_data = {
     'last_run': None
 }
 
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for the latency histogram"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    """Observe request latency per route pattern, so path parameters do not create new series"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route,
+                                             method=request.method, status=response.status_code)
+    return response
+
+def unsupported_response(error):
+    """501 for warehouse features the configured backend does not provide"""
+    return jsonify({
+        'error': str(error),
+        'success': False
+    }), 501
+
 @app.route('/')
 def index():
     """Main dashboard page"""
@@ -31,6 +57,13 @@ def simple():
 @app.route('/run_etl')
 def run_etl():
     """Run the ETL pipeline and return results"""
+    # Same lock as the scheduler and cli.py, so a dashboard run cannot overlap another run
+    lock = RunLock()
+    if not lock.acquire():
+        return jsonify({
+            'error': 'Another ETL run is in progress',
+            'success': False
+        }), 409
     try:
         result = run_etl_pipeline()
         
@@ -63,12 +96,14 @@ def run_etl():
             'summary': dashboard_data['summary'],
             'success': True
         })
-        
+    
     except Exception as e:
         return jsonify({
             'error': f'ETL pipeline failed: {str(e)}',
             'success': False
         })
+    finally:
+        lock.release()
 
 @app.route('/get_data')
 def get_data():
@@ -91,7 +126,7 @@ def get_data():
             'summary': dashboard_data['summary'],
             'success': True
         })
-        
+    
     except Exception as e:
         return jsonify({
             'error': f'Error retrieving data: {str(e)}',
@@ -135,7 +170,9 @@ def warehouse_data(table_name):
     """Get data from specific warehouse table"""
     try:
         limit = request.args.get('limit', 100, type=int)
-        data = warehouse.get_data(table_name, limit)
+        # snapshot=1 reads the latest snapshot so large reads never touch the live file
+        snapshot = request.args.get('snapshot', 0, type=int) == 1
+        data = warehouse.get_data(table_name, limit, snapshot=snapshot)
         
         if data.empty:
             return jsonify({
@@ -151,13 +188,92 @@ def warehouse_data(table_name):
             'count': len(json_data),
             'success': True
         })
-        
+    
     except Exception as e:
         return jsonify({
             'error': f'Error retrieving data from {table_name}: {str(e)}',
             'success': False
         })
 
+@app.route('/warehouse/news/search')
+def warehouse_news_search():
+    """Ranked full-text search over news headlines"""
+    try:
+        query = request.args.get('q', '')
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        results = warehouse.search_news(query, page=page, per_page=per_page)
+        results['success'] = True
+        return jsonify(results)
+    except UnsupportedOperation as e:
+        return unsupported_response(e)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error searching news: {str(e)}',
+            'success': False
+        })
+
+@app.route('/warehouse/weather/trend')
+def warehouse_weather_trend():
+    """Weather trend per city from the hourly/daily rollups"""
+    try:
+        resolution = request.args.get('resolution')
+        if resolution and resolution.isdigit():
+            resolution = int(resolution)
+        trend = warehouse.get_weather_trend(
+            city=request.args.get('city'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            resolution=resolution,
+            max_points=request.args.get('max_points', 500, type=int)
+        )
+        return jsonify({
+            'data': dataframe_to_json(trend),
+            'count': len(trend),
+            'success': True
+        })
+    except UnsupportedOperation as e:
+        return unsupported_response(e)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error getting weather trend: {str(e)}',
+            'success': False
+        })
+
+@app.route('/warehouse/query_stats')
+def warehouse_query_stats():
+    """Timing statistics and slow queries for warehouse SQL"""
+    try:
+        return jsonify({
+            'statements': warehouse.get_query_stats(),
+            'slow_queries': warehouse.get_slow_queries(),
+            'success': True
+        })
+    except UnsupportedOperation as e:
+        return unsupported_response(e)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error getting query statistics: {str(e)}',
+            'success': False
+        })
+
+@app.route('/warehouse/snapshot', methods=['POST'])
+def warehouse_snapshot():
+    """Take a new read-only snapshot of the warehouse"""
+    try:
+        path = warehouse.create_snapshot()
+        return jsonify({
+            'snapshot': path,
+            'success': True
+        })
+    except UnsupportedOperation as e:
+        return unsupported_response(e)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error creating snapshot: {str(e)}',
+            'success': False
+        })
+
 @app.route('/clear_data', methods=['POST'])
 def clear_data():
     """Clear the stored data and warehouse"""
@@ -181,7 +297,7 @@ def clear_data():
             'message': 'Data cleared successfully from memory, files, and warehouse',
             'success': True
         })
-        
+    
     except Exception as e:
         return jsonify({
             'error': f'Error clearing data: {str(e)}',
@@ -207,6 +323,16 @@ def health_check():
             'timestamp': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
         }), 500
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics in the Prometheus text format"""
+    try:
+        metrics.update_warehouse_rows(warehouse.get_warehouse_summary())
+    except Exception as e:
+        app.logger.warning(f"Could not read warehouse row counts for metrics: {e}")
+    metrics.update_cache_hit_ratios()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/test')
 def test():
     """Simple test endpoint"""
@@ -221,6 +347,7 @@ if __name__ == '__main__':
     print("Simple Dashboard: http://localhost:5000/simple")
     print("Test endpoint: http://localhost:5000/test")
     print("Health check: http://localhost:5000/health")
+    print("Prometheus metrics: http://localhost:5000/metrics")
     print("Press Ctrl+C to stop the server")
     
     try:
@@ -0,0 +1,129 @@
+"""
+Parallel backfill of historic data
+
+A date range is split into one partition per day. Each partition loads
+the files kept under data/history/<YYYY-MM-DD>/ through the normal
+pipeline, in a pool of worker processes, under its own run_id
+(backfill-<YYYY-MM-DD>) and with its file outputs in
+output/backfill/<YYYY-MM-DD>/.
+
+Progress is the partitions' pipeline_runs rows. Partitions that already
+succeeded are skipped, and a partition that failed or was interrupted
+resumes from its checkpoints, which skip warehouse loads that already
+completed. Warehouse rows carry their partition's run_id and are stamped
+as loaded on the partition's day; a load that completed but was not
+checkpointed replaces the partition's rows in one transaction. Re-running
+the same backfill therefore continues where it stopped without loading
+any partition twice.
+
+cli.py backfill holds the RunLock, so a backfill does not overlap
+scheduled or manual runs against the same warehouse.
+"""
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_OUTPUT_DIR = os.path.join('output', 'backfill')
+
+def partition_dates(start, end):
+    """Days from start to end inclusive, as YYYY-MM-DD strings"""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if end < start:
+        raise ValueError(f"Backfill range ends ({end.date()}) before it starts ({start.date()})")
+    return [day.strftime('%Y-%m-%d') for day in pd.date_range(start, end, freq='D')]
+
+def partition_run_id(run_date):
+    return f'backfill-{run_date}'
+
+def partition_files(run_date, history_dir):
+    """{dataset: path} of a day's historic files, without those of datasets the pipeline cannot transform"""
+    from etl_pipeline import DATASET_TRANSFORMS
+    from extract.history_extractor import history_files
+    
+    files = history_files(run_date, history_dir)
+    for dataset_name in sorted(set(files) - set(DATASET_TRANSFORMS)):
+        logger.warning(f"{run_date}: skipping {files.pop(dataset_name)}, '{dataset_name}' is not a known dataset")
+    return files
+
+def run_partition(run_date, files, output_dir, warehouse=None):
+    """Load one day of historic files; runs in a worker process unless given a warehouse"""
+    from etl_pipeline import run_etl_pipeline
+    from extract.history_extractor import extract_history_file
+    from warehouse.warehouse_manager import create_warehouse
+    
+    run_id = partition_run_id(run_date)
+    try:
+        warehouse = warehouse or create_warehouse()
+        sources = {
+            dataset_name: (f'{dataset_name} history', lambda path=path: extract_history_file(path))
+            for dataset_name, path in files.items()
+        }
+        previous = warehouse.get_checkpoint_state(run_id)
+        result = run_etl_pipeline(
+            resume_run_id=run_id if previous is not None else None,
+            warehouse=warehouse, sources=sources, run_id=run_id, run_date=run_date,
+            output_dir=os.path.join(output_dir, run_date),
+            # Partitions load out of order, so run-to-run deltas would be meaningless
+            publish_changes=False
+        )
+        records = sum(entry['record_count'] for entry in result['validation_results'].values())
+        return {'run_date': run_date, 'run_id': run_id, 'status': 'SUCCESS', 'records': records}
+    except Exception as e:
+        return {'run_date': run_date, 'run_id': run_id, 'status': 'FAILED', 'records': 0, 'error': str(e)}
+
+def run_backfill(start, end, workers=None, history_dir=None, output_dir=BACKFILL_OUTPUT_DIR, warehouse=None):
+    """
+    Backfill every day from start to end that has historic files
+    
+    Returns {run_date: result} for the partitions run now; partitions that
+    already succeeded are reported as SKIPPED.
+    """
+    from extract.history_extractor import HISTORY_DIR
+    from warehouse.warehouse_manager import create_warehouse
+    
+    history_dir = history_dir or HISTORY_DIR
+    warehouse = warehouse or create_warehouse()
+    workers = workers or min(4, os.cpu_count() or 1)
+    
+    results = {}
+    todo = {}
+    for run_date in partition_dates(start, end):
+        files = partition_files(run_date, history_dir)
+        if not files:
+            continue
+        run = warehouse.get_checkpoint_state(partition_run_id(run_date))
+        if run is not None and run['status'] == 'SUCCESS':
+            results[run_date] = {'run_date': run_date, 'run_id': partition_run_id(run_date), 'status': 'SKIPPED'}
+        else:
+            todo[run_date] = files
+    logger.info(f"Backfill {start} to {end}: {len(todo)} partitions to run, {len(results)} already done")
+    
+    def report(done, result):
+        results[result['run_date']] = result
+        logger.info(f"[{done}/{len(todo)}] {result['run_date']}: {result['status']}"
+                    + (f" ({result['records']} records)" if result['status'] == 'SUCCESS'
+                       else f" ({result.get('error')})"))
+    
+    if not warehouse.multiprocess_writes:
+        logger.info("Warehouse allows a single writing process: backfilling one partition at a time")
+        for done, (run_date, files) in enumerate(todo.items(), 1):
+            report(done, run_partition(run_date, files, output_dir, warehouse))
+        return dict(sorted(results.items()))
+    
+    # spawn keeps this process's warehouse writer thread out of the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {executor.submit(run_partition, run_date, files, output_dir): run_date
+                   for run_date, files in todo.items()}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                report(done, future.result())
+        except KeyboardInterrupt:
+            # Partitions already running finish and are recorded; the rest run next time
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+    return dict(sorted(results.items()))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the warehouse backends on load and analytics queries
+
+Usage:
+  python benchmark_warehouse.py --rows 1000000 --backends sqlite duckdb
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from warehouse.warehouse_manager import create_warehouse
+
+CITIES = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret"]
+CONDITIONS = ["Cloudy", "Sunny", "Partly Cloudy", "Light Rain"]
+
+def make_weather_batch(rows, seed=0):
+    """Generate synthetic weather readings shaped like the API extractor output"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'city': rng.choice(CITIES, rows),
+        'temperature': rng.normal(23, 4, rows).round(1),
+        'humidity': rng.integers(30, 100, rows),
+        'weather_condition': rng.choice(CONDITIONS, rows)
+    })
+
+def timed(func):
+    """Run func and return (seconds, result)"""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+def benchmark_backend(backend, rows, batch_size, work_dir):
+    """Load rows into one backend and time the analytics queries"""
+    extension = 'duckdb' if backend == 'duckdb' else 'db'
+    warehouse = create_warehouse(backend, os.path.join(work_dir, f'bench.{extension}'))
+    
+    load_seconds = 0.0
+    for offset in range(0, rows, batch_size):
+        batch = make_weather_batch(min(batch_size, rows - offset), seed=offset)
+        seconds, _ = timed(lambda: warehouse.store_data('weather', batch, 'bench'))
+        load_seconds += seconds
+    
+    results = {'load': load_seconds}
+    results['run_analytics'], _ = timed(warehouse.run_analytics)
+    results['summary'], _ = timed(warehouse.get_warehouse_summary)
+    results['group_by_city'], _ = timed(lambda: warehouse.query(
+        'weather', group_by=['city'],
+        aggregates={'avg_temp': ('avg', 'temperature'), 'max_temp': ('max', 'temperature'),
+                    'readings': ('count', '*')}
+    ))
+    results['filtered_group_by'], _ = timed(lambda: warehouse.query(
+        'weather', group_by=['conditions'], aggregates={'avg_humidity': ('avg', 'humidity')},
+        filters=[('temperature', '>', 25)]
+    ))
+    return results
+
+def main():
+    """Run the benchmark and print a comparison table"""
+    parser = argparse.ArgumentParser(description='Warehouse backend benchmark')
+    parser.add_argument('--rows', type=int, default=200000, help='Weather rows to load')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Rows per store_data call')
+    parser.add_argument('--backends', nargs='+', default=['sqlite', 'duckdb'], choices=['sqlite', 'duckdb'])
+    args = parser.parse_args()
+    
+    logging.disable(logging.INFO)
+    
+    all_results = {}
+    for backend in args.backends:
+        work_dir = tempfile.mkdtemp(prefix=f'bench_{backend}_')
+        try:
+            all_results[backend] = benchmark_backend(backend, args.rows, args.batch_size, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    print(f"\nWarehouse benchmark: {args.rows:,} weather rows (seconds)")
+    print(f"{'operation':<20}" + ''.join(f"{backend:>12}" for backend in all_results))
+    for operation in next(iter(all_results.values())):
+        print(f"{operation:<20}" + ''.join(f"{results[operation]:>12.4f}" for results in all_results.values()))
+
+if __name__ == '__main__':
+    main()
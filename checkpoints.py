@@ -0,0 +1,80 @@
+"""
+Stage checkpoints for resuming failed pipeline runs
+
+The DataFrame a stage produces is saved under checkpoints/<run_id>/ as a
+Feather (Arrow IPC) file, or as a pickle when the frame has columns Arrow
+cannot represent exactly. Which stages are done, and any small results
+they carry, are kept in the run's pipeline_runs row, so a resumed run can
+load finished stages instead of repeating them.
+"""
+
+import os
+import shutil
+import logging
+import threading
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = 'checkpoints'
+
+class CheckpointStore:
+    """Checkpointed stage outputs of one pipeline run"""
+    
+    def __init__(self, warehouse, run_id, start_time, checkpoint_dir=CHECKPOINT_DIR, state=None):
+        self.warehouse = warehouse
+        self.run_id = run_id
+        self.start_time = start_time
+        self.run_dir = os.path.join(checkpoint_dir, run_id)
+        self.state = state or {}
+        self.lock = threading.Lock()
+    
+    @classmethod
+    def resume(cls, warehouse, run_id, checkpoint_dir=CHECKPOINT_DIR):
+        """Open the checkpoints of an earlier run that did not complete"""
+        run = warehouse.get_checkpoint_state(run_id)
+        if run is None:
+            raise ValueError(f"Unknown pipeline run '{run_id}'")
+        if run['status'] == 'SUCCESS':
+            raise ValueError(f"Pipeline run '{run_id}' already completed successfully")
+        return cls(warehouse, run_id, run['start_time'], checkpoint_dir, run['state'])
+    
+    def completed(self, dataset_name, stage):
+        """Whether a stage finished for a dataset and its checkpoint is still usable"""
+        entry = self.state.get(dataset_name, {}).get(stage)
+        return entry is not None and (entry.get('file') is None or os.path.exists(entry['file']))
+    
+    def info(self, dataset_name, stage):
+        """Small results recorded with a finished stage"""
+        return self.state[dataset_name][stage].get('info', {})
+    
+    def load(self, dataset_name, stage):
+        """Return the DataFrame saved for a finished stage, or None if it produced nothing"""
+        path = self.state[dataset_name][stage].get('file')
+        if path is None:
+            return None
+        logger.info(f"{dataset_name}: resuming from {stage} checkpoint")
+        return pd.read_feather(path) if path.endswith('.feather') else pd.read_pickle(path)
+    
+    def save(self, dataset_name, stage, df=None, **info):
+        """Checkpoint a finished stage's DataFrame and small results, then record it in pipeline_runs"""
+        path = None
+        if df is not None:
+            os.makedirs(self.run_dir, exist_ok=True)
+            path = os.path.join(self.run_dir, f'{dataset_name}__{stage}.feather')
+            try:
+                df.reset_index(drop=True).to_feather(path)
+            except Exception:
+                # Mixed-type columns and missing pyarrow fall back to pickle
+                if os.path.exists(path):
+                    os.remove(path)
+                path = path[:-len('.feather')] + '.pkl'
+                df.to_pickle(path)
+        
+        with self.lock:
+            self.state.setdefault(dataset_name, {})[stage] = {'file': path, 'info': info}
+            self.warehouse.save_checkpoint_state(self.run_id, self.start_time, self.state)
+    
+    def clear(self):
+        """Delete the checkpoint files once the run has succeeded"""
+        shutil.rmtree(self.run_dir, ignore_errors=True)
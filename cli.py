@@ -7,18 +7,88 @@ import argparse
 import sys
 import os
 
-def run_etl():
-    """Run the ETL pipeline"""
-    print("🚀 Starting ETL Pipeline...")
+def run_etl(resume=None, sample=None, memory_budget_mb=None):
+    """Run the ETL pipeline, or resume a failed run from its checkpoints"""
+    print(f"🚀 Resuming ETL Pipeline run {resume}..." if resume else "🚀 Starting ETL Pipeline...")
+    if sample:
+        print(f"🧪 Sample mode: up to {sample} rows per source, scratch warehouse, output/sample")
     try:
         from etl_pipeline import run_etl_pipeline
-        result = run_etl_pipeline()
+        from contextlib import nullcontext
+        from scheduler import RunLock
+        from memory_budget import MemoryBudget
+        budget = MemoryBudget(memory_budget_mb) if memory_budget_mb else None
+        # Sampled runs use the scratch warehouse, so they need not wait for production runs
+        with nullcontext() if sample else RunLock():
+            result = run_etl_pipeline(resume_run_id=resume, sample=sample, memory_budget=budget)
         print("✅ ETL Pipeline completed successfully!")
+        if result.get('memory'):
+            memory = result['memory']
+            print(f"🧠 Peak memory {memory['peak_mb']} of {memory['limit_mb']:g} MB, "
+                  f"{memory['spills']} frames spilled ({memory['spilled_mb']} MB)")
         return result
     except Exception as e:
         print(f"❌ ETL Pipeline failed: {e}")
         return None
 
+def run_profile(sample_interval_ms, trace_memory, top_n, output_dir=None):
+    """Run the ETL pipeline with every stage profiled"""
+    print("🔬 Profiling ETL Pipeline...")
+    try:
+        from etl_pipeline import run_etl_pipeline
+        from profiling import StageProfiler
+        from scheduler import RunLock
+        with RunLock(), StageProfiler(output_dir, sample_interval_ms, trace_memory, top_n) as profiler:
+            try:
+                run_etl_pipeline(profiler=profiler)
+            except Exception as e:
+                # Profiles of the stages that ran are still written
+                print(f"❌ ETL Pipeline failed: {e}")
+        print(f"✅ Stage profiles written to {profiler.output_dir}")
+        print(f"   Summary: {os.path.join(profiler.output_dir, 'summary.txt')}")
+        return profiler.output_dir
+    except Exception as e:
+        print(f"❌ Profiling failed: {e}")
+        return None
+
+def run_backfill(start, end, workers=None):
+    """Load historic data for a date range, one partition per day"""
+    if not start or not end:
+        print("❌ backfill needs --from and --to dates (YYYY-MM-DD)")
+        return 1
+    print(f"📚 Backfilling {start} to {end}...")
+    try:
+        from backfill import run_backfill as backfill
+        from scheduler import RunLock
+        with RunLock():
+            results = backfill(start, end, workers)
+    except Exception as e:
+        print(f"❌ Backfill failed: {e}")
+        return 1
+    
+    counts = {}
+    for result in results.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print(f"Partitions: {counts or 'none with historic files'}")
+    if counts.get('FAILED'):
+        print("❌ Some partitions failed; run the same backfill again to retry them")
+        return 1
+    print("✅ Backfill completed successfully!")
+    return 0
+
+def run_scheduler(schedule=None):
+    """Run the pipeline on per-dataset intervals until interrupted"""
+    print("⏰ Starting ETL scheduler (Ctrl+C to stop)...")
+    try:
+        from scheduler import PipelineScheduler, parse_schedule
+        scheduler = PipelineScheduler(parse_schedule(schedule) if schedule else None)
+        print(f"Schedule (seconds): {scheduler.schedule}")
+        scheduler.run_forever()
+    except Exception as e:
+        print(f"❌ Scheduler failed: {e}")
+        return 1
+    return 0
+
 def start_dashboard():
     """Start the web dashboard"""
     print("🌐 Starting ETL Dashboard...")
@@ -42,13 +112,41 @@ def run_tests():
 def main():
     """Main CLI function"""
     parser = argparse.ArgumentParser(description='ETL Pipeline CLI')
-    parser.add_argument('command', choices=['etl', 'dashboard', 'test', 'help'], 
+    parser.add_argument('command', choices=['etl', 'backfill', 'profile', 'scheduler', 'dashboard', 'test', 'help'], 
                        help='Command to run')
+    parser.add_argument('--resume', metavar='RUN_ID',
+                       help='Resume a failed ETL run from its checkpoints (etl only)')
+    parser.add_argument('--sample', type=int, metavar='N',
+                       help='Run on at most N rows per source into a scratch warehouse (etl only)')
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                       help='Spill to disk and serialize stages near this much memory (etl only, default ETL_MEMORY_BUDGET_MB)')
+    parser.add_argument('--from', dest='start', metavar='DATE',
+                       help='First day to backfill, YYYY-MM-DD (backfill only)')
+    parser.add_argument('--to', dest='end', metavar='DATE',
+                       help='Last day to backfill, YYYY-MM-DD (backfill only)')
+    parser.add_argument('--workers', type=int, metavar='N',
+                       help='Partitions loaded in parallel (backfill only, default up to 4)')
+    parser.add_argument('--schedule', metavar='SPEC',
+                       help='Per-dataset intervals such as weather=15m,news=30m (scheduler only, default ETL_SCHEDULE)')
+    parser.add_argument('--sample-interval', type=float, default=5, metavar='MS',
+                       help='Stack sampling interval for flamegraphs, 0 to disable (profile only)')
+    parser.add_argument('--tracemalloc', action='store_true',
+                       help='Trace memory allocations per stage (profile only, slows the run)')
+    parser.add_argument('--top', type=int, default=20, metavar='N',
+                       help='Functions and allocators listed per stage in the summary (profile only)')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                       help='Where to write profiles (profile only, default profiles/<timestamp>)')
     
     args = parser.parse_args()
     
     if args.command == 'etl':
-        run_etl()
+        run_etl(args.resume, args.sample, args.memory_budget)
+    elif args.command == 'backfill':
+        sys.exit(run_backfill(args.start, args.end, args.workers))
+    elif args.command == 'scheduler':
+        sys.exit(run_scheduler(args.schedule))
+    elif args.command == 'profile':
+        run_profile(args.sample_interval, args.tracemalloc, args.top, args.profile_dir)
     elif args.command == 'dashboard':
         start_dashboard()
     elif args.command == 'test':
@@ -56,13 +154,27 @@ def main():
     elif args.command == 'help':
         print("""
 ETL Pipeline CLI Commands:
-  etl       - Run the complete ETL pipeline
+  etl       - Run the complete ETL pipeline (--resume RUN_ID continues a failed run,
+              --sample N runs on N rows per source into a scratch warehouse,
+              --memory-budget MB spills to disk instead of running out of memory)
+  backfill  - Load data/history/<date>/ files for a date range (--from, --to, --workers);
+              run it again to continue an interrupted backfill
+  profile   - Run the ETL pipeline with per-stage cProfile dumps, flamegraph stacks
+              (--sample-interval MS) and allocation tracing (--tracemalloc)
+  scheduler - Run datasets on their own intervals (--schedule weather=15m,news=30m),
+              never overlapping another run
   dashboard - Start the web dashboard
   test      - Run the test suite
   help      - Show this help message
 
 Examples:
   python cli.py etl
+  python cli.py etl --resume 1a2b3c4d
+  python cli.py etl --sample 100
+  python cli.py etl --memory-budget 2048
+  python cli.py backfill --from 2024-01-01 --to 2024-03-31 --workers 4
+  python cli.py profile --tracemalloc --top 10
+  python cli.py scheduler --schedule weather=15m,news=30m,students=1h,scores=1h
   python cli.py dashboard
   python cli.py test
         """)
@@ -0,0 +1,212 @@
+"""
+Dataflow scheduler for the ETL pipeline
+
+Each dataset runs through its own chain of stages (extract -> transform ->
+validate -> warehouse -> file) as soon as its inputs are ready, instead of
+every dataset waiting at each phase for the slowest one. Chains run
+concurrently; a per-stage limit caps how many chains can be inside a
+stage at once, e.g. to bound concurrent API calls or workbook writers.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import itertools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+def peak_rss_mb():
+    """High-water mark of the process's resident memory in MB, or None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def current_rss_mb():
+    """Current resident memory of the process in MB from /proc, or None where unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class PeakMemorySampler(threading.Thread):
+    """
+    Poll the process's resident memory and keep the maximum seen while each stage runs
+    
+    An allocation that is freed again before its stage returns never shows
+    up in an RSS delta, so stages register with begin() and get the highest
+    sample taken until their end(). Spikes shorter than the poll interval
+    can still slip between samples.
+    """
+    
+    def __init__(self, interval=0.005):
+        super().__init__(name='stage-memory', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.tokens = itertools.count()
+        self.peaks = {}
+    
+    def begin(self):
+        """Start tracking a stage and return its token"""
+        rss = current_rss_mb()
+        token = next(self.tokens)
+        with self.lock:
+            self.peaks[token] = rss
+        return token
+    
+    def end(self, token):
+        """Stop tracking a stage and return its peak resident memory in MB"""
+        rss = current_rss_mb()
+        with self.lock:
+            peak = self.peaks.pop(token)
+        return round(max(peak, rss), 1)
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                if not self.peaks:
+                    continue
+            rss = current_rss_mb()
+            with self.lock:
+                for token, peak in self.peaks.items():
+                    if rss > peak:
+                        self.peaks[token] = rss
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def stage_metrics(started_at, wall_seconds, cpu_seconds, result, rss_before=None, peak_mb=None):
+    """Metrics of one stage run; rows and output size are taken from a DataFrame result"""
+    rss_after = current_rss_mb() if rss_before is not None else None
+    rows = len(result) if isinstance(result, pd.DataFrame) else None
+    return {
+        'started_at': started_at,
+        'wall_seconds': round(wall_seconds, 6),
+        'cpu_seconds': round(cpu_seconds, 6),
+        'rows': rows,
+        'rows_per_sec': round(rows / wall_seconds, 1) if rows is not None and wall_seconds > 0 else None,
+        'output_mb': (round(result.memory_usage(deep=True).sum() / (1024 * 1024), 3)
+                      if isinstance(result, pd.DataFrame) else None),
+        'peak_mb': peak_mb,
+        'rss_delta_mb': round(rss_after - rss_before, 1) if rss_after is not None else None
+    }
+
+class DataflowScheduler:
+    """Run independent per-dataset stage chains concurrently with per-stage concurrency limits"""
+    
+    def __init__(self, stage_limits=None, memory_budget=None, retain=None):
+        self.stage_limits = stage_limits or {}
+        self.memory_budget = memory_budget
+        self.retain = retain
+    
+    def run(self, chains):
+        """
+        Run every chain to completion and return their outcomes
+        
+        chains maps a dataset name to a list of (stage, func) pairs. The first
+        func is called without arguments and each later one with the previous
+        result; a stage returning None ends its chain early. Returns
+        {name: {'results': {stage: result}, 'metrics': {stage: metrics},
+        'failed_stage': stage or None, 'error': exception or None}}.
+        
+        Stage metrics hold wall and CPU seconds (CPU of the chain's thread,
+        so work a stage hands to other threads is not included), rows and
+        rows/sec and the in-memory size of a DataFrame result, the peak
+        resident memory of the process while the stage ran and how much it
+        grew or shrank across the stage. Chains share one process, so both
+        include whatever concurrent chains allocated or freed meanwhile.
+        
+        retain limits the stages whose results are kept in 'results', so
+        other intermediate frames can be freed as soon as the next stage is
+        done with them. With a memory_budget under pressure, DataFrames
+        are spilled to disk while they wait for the next stage and stages
+        run one at a time across chains. Retained results that were spilled
+        stay on disk and are returned as SpilledFrame handles, so finished
+        chains do not bring them back while others are still running; the
+        caller reads them with memory_budget.restore() when it needs them.
+        """
+        semaphores = {stage: threading.BoundedSemaphore(limit)
+                      for stage, limit in self.stage_limits.items() if limit}
+        
+        budget = self.memory_budget
+        
+        def run_stages(name, stages, outcome):
+            value = None
+            for index, (stage, func) in enumerate(stages):
+                spilled = None
+                if index and budget is not None and isinstance(value, pd.DataFrame) and budget.under_pressure():
+                    # Keep the frame on disk, not in memory, while it waits for the stage
+                    spilled = budget.spill(value, f'{name}-{stage}')
+                    for kept_stage, kept in outcome['results'].items():
+                        if kept is value:
+                            outcome['results'][kept_stage] = spilled
+                    value = None
+                semaphore = semaphores.get(stage)
+                if semaphore:
+                    semaphore.acquire()
+                serialized = budget is not None and budget.under_pressure()
+                if serialized:
+                    budget.serial_lock.acquire()
+                    budget.count('serialized_stages')
+                started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                start = time.perf_counter()
+                cpu_start = time.thread_time()
+                rss_before = current_rss_mb()
+                token = sampler.begin() if sampler else None
+                try:
+                    if spilled is not None:
+                        value = budget.load(spilled)
+                    value = func() if index == 0 else func(value)
+                except Exception as e:
+                    logger.error(f"{name}: {stage} failed: {e}")
+                    outcome['failed_stage'] = stage
+                    outcome['error'] = e
+                    value = None
+                    return
+                finally:
+                    outcome['metrics'][stage] = stage_metrics(
+                        started_at, time.perf_counter() - start, time.thread_time() - cpu_start, value, rss_before,
+                        sampler.end(token) if sampler else None
+                    )
+                    if serialized:
+                        budget.serial_lock.release()
+                    if semaphore:
+                        semaphore.release()
+                if self.retain is None or stage in self.retain:
+                    outcome['results'][stage] = value
+                if value is None:
+                    logger.info(f"{name}: nothing to pass on after {stage}")
+                    return
+        
+        def run_chain(name, stages):
+            outcome = {'results': {}, 'metrics': {}, 'failed_stage': None, 'error': None}
+            run_stages(name, stages, outcome)
+            return outcome
+        
+        if not chains:
+            return {}
+        sampler = PeakMemorySampler() if current_rss_mb() is not None else None
+        if sampler:
+            sampler.start()
+        try:
+            with ThreadPoolExecutor(max_workers=len(chains), thread_name_prefix='dataflow') as executor:
+                futures = {name: executor.submit(run_chain, name, stages) for name, stages in chains.items()}
+                return {name: future.result() for name, future in futures.items()}
+        finally:
+            if sampler:
+                sampler.stop()
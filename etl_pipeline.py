@@ -1,3 +1,5 @@
+import os
+import time
 import uuid
 import logging
 from datetime import datetime
@@ -5,110 +7,234 @@ from extract.mysql_extractor import extract_from_mysql
 from extract.api_extractor import extract_from_weather_api
 from extract.web_extractor import extract_from_web
 from extract.excel_extractor import extract_student_data
-from transform.data_transformer import transform_data
-from load.data_loader import load_data
-from warehouse.warehouse_manager import WarehouseManager
+from transform.data_transformer import DATASET_TRANSFORMS
+from load.data_loader import OutputWriter
+from warehouse.warehouse_manager import create_warehouse
 from warehouse.data_validator import DataValidator
+from dataflow import DataflowScheduler
+from memory_budget import MemoryBudget
+from checkpoints import CheckpointStore
+import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def run_etl_pipeline():
-    """Enhanced ETL pipeline with warehouse integration and validation"""
+WEATHER_CITIES = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret"]
+
+def build_sources(session=None, mysql_engine=None, sample=None):
+    """
+    Source name and extractor feeding each dataset
+    
+    A requests.Session and a SQLAlchemy engine, when given, are shared by
+    the extractors so repeated runs reuse their pooled connections. sample
+    pushes a row budget down into every extractor: a LIMIT for MySQL, the
+    first rows of the workbook, that many cities for weather and a
+    deterministic reservoir sample of headlines.
+    """
+    cities = WEATHER_CITIES[:max(1, sample)] if sample else WEATHER_CITIES
+    return {
+        'students': ('MySQL', lambda: extract_from_mysql(mysql_engine, limit=sample)),
+        'weather': ('Weather', lambda: extract_from_weather_api(cities, session)),
+        'news': ('Web', lambda: extract_from_web(session, sample=sample)),
+        'scores': ('Excel', lambda: extract_student_data(nrows=sample))
+    }
+
+DATASET_SOURCES = build_sources()
+
+# Maximum number of datasets inside each stage at the same time
+STAGE_LIMITS = {
+    'extract': 4,
+    'transform': 2,
+    'validate': 2,
+    'warehouse': 4,
+    'file': 2
+}
+
+def run_etl_pipeline(resume_run_id=None, profiler=None, warehouse=None, sources=None,
+                     run_id=None, run_date=None, output_dir=None, sample=None, memory_budget=None,
+                     publish_changes=True):
+    """
+    Enhanced ETL pipeline with warehouse integration and validation
     
-    # Generate unique run ID
-    run_id = str(uuid.uuid4())[:8]
-    start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    Extracted and transformed data and completed warehouse loads are
+    checkpointed per dataset; resume_run_id continues a failed run from
+    its checkpoints instead of starting over. A profiling.StageProfiler
+    passed as profiler profiles every stage of every dataset.
     
-    logger.info(f"Starting ETL Pipeline - Run ID: {run_id}")
+    A long-lived caller can pass its own warehouse to keep it warm between
+    runs, and sources (a subset of DATASET_SOURCES or build_sources()) to
+    run only some datasets. run_id and run_date name a new run and the
+    date its outputs and warehouse rows are filed under, e.g. for a
+    backfill partition. Loading a run_id again replaces the warehouse
+    rows it stored before.
+    
+    publish_changes=False keeps the run's warehouse loads out of the
+    warehouse change feed, e.g. for backfill partitions loaded out of order.
+    
+    sample runs on at most that many rows per source, sampled inside the
+    extractors, and loads into the scratch warehouse (a warehouse passed
+    along must be one from create_warehouse(sample=True)) and by default
+    output/sample, so production data and outputs are left alone. Sampled
+    loads never reach the change feed.
+    
+    memory_budget (a memory_budget.MemoryBudget, by default one from
+    ETL_MEMORY_BUDGET_MB) keeps the run within a memory limit by spilling
+    frames between stages, serializing stages and writing smaller chunks
+    once memory gets close to it.
+    """
     
     # Initialize warehouse and validator
-    warehouse = WarehouseManager()
+    if sample:
+        if warehouse is not None and not warehouse.scratch:
+            raise ValueError("Sampled runs load into the scratch warehouse, not the one passed in")
+        warehouse = warehouse or create_warehouse(sample=True)
+        # Sampled loads are not real changes, so they stay out of the change feed
+        publish_changes = False
+        sources = sources if sources is not None else build_sources(sample=sample)
+        output_dir = output_dir or os.path.join('output', 'sample')
+    warehouse = warehouse or create_warehouse()
+    sources = sources if sources is not None else DATASET_SOURCES
+    output_dir = output_dir or 'output'
+    budget = memory_budget or MemoryBudget.from_env()
     validator = DataValidator()
     
+    if resume_run_id:
+        checkpoints = CheckpointStore.resume(warehouse, resume_run_id)
+        run_id = resume_run_id
+        start_time = checkpoints.start_time
+        logger.info(f"Resuming ETL Pipeline - Run ID: {run_id}")
+    else:
+        # Generate unique run ID
+        run_id = run_id or str(uuid.uuid4())[:8]
+        start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        checkpoints = CheckpointStore(warehouse, run_id, start_time)
+        logger.info(f"Starting ETL Pipeline - Run ID: {run_id}")
+    
+    run_started = time.perf_counter()
+    if budget is not None:
+        budget.start()
     try:
-        # EXTRACT phase
-        logger.info("1. Extracting data from sources...")
-        extracted_data = {}
+        # Every dataset moves through its own chain as soon as its source is ready
+        logger.info("Running dataset pipelines: extract -> transform -> validate -> warehouse -> file")
+        validation_results = {}
+        stored_counts = {}
+        output_writer = OutputWriter(os.getenv('OUTPUT_FORMAT', 'json'), output_dir, run_date, run_id=run_id,
+                                     workbook_workers=min(len(sources), os.cpu_count() or 1),
+                                     memory_budget=budget)
         
-        # Extract from MySQL
-        try:
-            mysql_data = extract_from_mysql()
-            extracted_data['mysql'] = mysql_data
-            logger.info(f"MySQL extraction: {len(mysql_data)} records")
-        except Exception as e:
-            logger.error(f"MySQL extraction failed: {e}")
-            mysql_data = None
+        def checkpointed(dataset_name, stage, func):
+            """Load a stage's output from its checkpoint, or run it and checkpoint what it returns"""
+            def run(*args):
+                if checkpoints.completed(dataset_name, stage):
+                    return checkpoints.load(dataset_name, stage)
+                result = func(*args)
+                if result is not None:
+                    checkpoints.save(dataset_name, stage, result)
+                return result
+            return run
         
-        # Extract from Weather API
-        try:
-            weather_data = extract_from_weather_api(["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret"])
-            extracted_data['weather'] = weather_data
-            logger.info(f"Weather extraction: {len(weather_data)} records")
-        except Exception as e:
-            logger.error(f"Weather extraction failed: {e}")
-            weather_data = None
+        def extract_stage(source_name, extractor):
+            def extract():
+                try:
+                    data = extractor()
+                    metrics.EXTRACTIONS.inc(source=source_name, outcome='success')
+                    logger.info(f"{source_name} extraction: {len(data)} records")
+                    return data
+                except Exception as e:
+                    metrics.EXTRACTIONS.inc(source=source_name, outcome='failure')
+                    logger.error(f"{source_name} extraction failed: {e}")
+                    return None
+            return extract
         
-        # Extract from Web
-        try:
-            web_data = extract_from_web()
-            extracted_data['web'] = web_data
-            logger.info(f"Web extraction: {len(web_data)} records")
-        except Exception as e:
-            logger.error(f"Web extraction failed: {e}")
-            web_data = None
+        def validate_stage(dataset_name):
+            def validate(df):
+                if not df.empty:
+                    is_valid, messages = validator.validate_dataset(dataset_name, df)
+                    validation_results[dataset_name] = {
+                        'is_valid': is_valid,
+                        'messages': messages,
+                        'record_count': len(df)
+                    }
+                return df
+            return validate
         
-        # Extract from Excel
-        try:
-            excel_data = extract_student_data()
-            extracted_data['excel'] = excel_data
-            logger.info(f"Excel extraction: {len(excel_data)} records")
-        except Exception as e:
-            logger.error(f"Excel extraction failed: {e}")
-            excel_data = None
+        # Backfilled rows are filed under their partition's day, not the day they were loaded
+        loaded_at = f'{run_date} 00:00:00' if run_date else None
         
-        # TRANSFORM phase
-        logger.info("2. Transforming data...")
-        try:
-            transformed_data = transform_data(mysql_data, weather_data, web_data, excel_data)
-            logger.info(f"Transformation completed: {len(transformed_data)} datasets")
-        except Exception as e:
-            logger.error(f"Transformation failed: {e}")
-            raise
+        def warehouse_stage(dataset_name):
+            def store(df):
+                if checkpoints.completed(dataset_name, 'warehouse'):
+                    # Already loaded before the failure; no need to replace the rows
+                    stored_counts[dataset_name] = checkpoints.info(dataset_name, 'warehouse')['records']
+                elif not df.empty:
+                    try:
+                        records_stored = warehouse.store_data_async(dataset_name, df, run_id, loaded_at,
+                                                                    publish_changes).result()
+                        stored_counts[dataset_name] = records_stored
+                        checkpoints.save(dataset_name, 'warehouse', records=records_stored)
+                        logger.info(f"{dataset_name}: {records_stored} records stored in warehouse")
+                    except Exception as e:
+                        logger.error(f"Failed to store {dataset_name} in warehouse: {e}")
+                return df
+            return store
         
-        # VALIDATION phase
-        logger.info("3. Validating data quality...")
-        validation_results = {}
-        total_records = 0
-        
-        for dataset_name, df in transformed_data.items():
-            if df is not None and not df.empty:
-                is_valid, messages = validator.validate_dataset(dataset_name, df)
-                validation_results[dataset_name] = {
-                    'is_valid': is_valid,
-                    'messages': messages,
-                    'record_count': len(df)
-                }
-                total_records += len(df)
-        
-        # WAREHOUSE LOAD phase
-        logger.info("4. Loading data to warehouse...")
-        warehouse_records = 0
-        
-        for dataset_name, df in transformed_data.items():
-            if df is not None and not df.empty:
+        def file_stage(dataset_name):
+            def save(df):
                 try:
-                    records_stored = warehouse.store_data(dataset_name, df, run_id)
-                    warehouse_records += records_stored
-                    logger.info(f"{dataset_name}: {records_stored} records stored in warehouse")
+                    output_writer.write(dataset_name, df)
                 except Exception as e:
-                    logger.error(f"Failed to store {dataset_name} in warehouse: {e}")
+                    logger.error(f"File saving failed for {dataset_name}: {e}")
+                return df
+            return save
+        
+        chains = {
+            dataset_name: [
+                ('extract', checkpointed(dataset_name, 'extract', extract_stage(source_name, extractor))),
+                ('transform', checkpointed(dataset_name, 'transform', DATASET_TRANSFORMS[dataset_name])),
+                ('validate', validate_stage(dataset_name)),
+                ('warehouse', warehouse_stage(dataset_name)),
+                ('file', file_stage(dataset_name))
+            ]
+            for dataset_name, (source_name, extractor) in sources.items()
+        }
+        if profiler is not None:
+            chains = {
+                dataset_name: [(stage, profiler.wrap(dataset_name, stage, func)) for stage, func in stages]
+                for dataset_name, stages in chains.items()
+            }
+        outcomes = DataflowScheduler(STAGE_LIMITS, budget, retain={'transform'}).run(chains)
+        
+        # Keep per-stage measurements of failed runs too; they show where time went
+        stage_metrics = [
+            dict(dataset=dataset_name, stage=stage, **measurements)
+            for dataset_name, outcome in outcomes.items()
+            for stage, measurements in outcome['metrics'].items()
+        ]
+        warehouse.log_stage_metrics(run_id, stage_metrics)
+        metrics.record_stage_metrics(stage_metrics)
+        if stage_metrics:
+            slowest = max(stage_metrics, key=lambda entry: entry['wall_seconds'])
+            logger.info(f"Slowest stage: {slowest['dataset']} {slowest['stage']} ({slowest['wall_seconds']:.3f}s)")
+        
+        # Transformation and validation errors fail the run, as they did before
+        for dataset_name, outcome in outcomes.items():
+            if outcome['error'] is not None:
+                output_writer.close()
+                raise outcome['error']
+        
+        transformed_data = {
+            dataset_name: outcome['results']['transform']
+            for dataset_name, outcome in outcomes.items()
+            if outcome['results'].get('transform') is not None
+        }
+        logger.info(f"Transformation completed: {len(transformed_data)} datasets")
+        
+        total_records = sum(result['record_count'] for result in validation_results.values())
+        warehouse_records = sum(stored_counts.values())
         
-        # FILE LOAD phase (keep existing functionality)
-        logger.info("5. Saving data to files...")
         try:
-            output_paths = load_data(transformed_data, 'json')
+            output_paths = output_writer.finish()
             logger.info(f"Files saved: {list(output_paths.keys())}")
         except Exception as e:
             logger.error(f"File saving failed: {e}")
@@ -124,19 +250,29 @@ def run_etl_pipeline():
             records_processed=total_records
         )
         
+        checkpoints.clear()
+        metrics.PIPELINE_RUNS.inc(status='SUCCESS')
+        metrics.PIPELINE_RUN_SECONDS.observe(time.perf_counter() - run_started, status='SUCCESS')
+        
         logger.info(f"ETL Pipeline completed successfully! Run ID: {run_id}")
         logger.info(f"Total records processed: {total_records}")
         logger.info(f"Records stored in warehouse: {warehouse_records}")
         
+        if budget is not None:
+            # Spilled transform results are read back only now that the run is done with everything else
+            transformed_data = {dataset_name: budget.restore(df) for dataset_name, df in transformed_data.items()}
+        
         return {
             'transformed_data': transformed_data,
             'output_paths': output_paths,
             'run_id': run_id,
             'validation_results': validation_results,
+            'stage_metrics': stage_metrics,
             'warehouse_summary': warehouse.get_warehouse_summary(),
-            'analytics': warehouse.run_analytics()
+            'analytics': warehouse.run_analytics(),
+            'memory': budget.stats if budget is not None else None
         }
-        
+    
     except Exception as e:
         # Log failed pipeline run
         end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -148,9 +284,16 @@ def run_etl_pipeline():
             records_processed=0,
             error_message=str(e)
         )
+        metrics.PIPELINE_RUNS.inc(status='FAILED')
+        metrics.PIPELINE_RUN_SECONDS.observe(time.perf_counter() - run_started, status='FAILED')
         
         logger.error(f"ETL Pipeline failed: {e}")
+        logger.info(f"Resume this run with: python cli.py etl --resume {run_id}")
         raise
+    
+    finally:
+        if budget is not None:
+            budget.stop()
 
 if __name__ == "__main__":
     try:
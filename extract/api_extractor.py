@@ -3,10 +3,12 @@ import pandas as pd
 import os
 from datetime import datetime
 
-def extract_from_weather_api(cities=None):
+def extract_from_weather_api(cities=None, session=None):
     """
     Extract weather data from OpenWeatherMap API for Kenyan cities
     Returns a DataFrame with current weather information
+    
+    Pass a requests.Session to reuse its pooled connections across calls.
     """
     # kenya cities
     if cities is None:
@@ -28,7 +30,7 @@ def extract_from_weather_api(cities=None):
             # - API request for each city
             url = f"http://api.openweathermap.org/data/2.5/weather?q={city},KE&appid={api_key}&units=metric"
             # http://api.openweathermap.org/data/2.5/weather?q={Nairobi},KE&appid={7398ba9119a049d09f563c3e1e72b405}&units=metric
-            response = requests.get(url, timeout=10)
+            response = (session or requests).get(url, timeout=10)
             print(response.status_code)
             print(response.text)
             
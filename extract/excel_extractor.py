@@ -2,10 +2,11 @@ import pandas as pd
 import os
 
 # In extract/excel_extractor.py
-def extract_student_data():
+def extract_student_data(nrows=None):
     #    stude data excel
+    #    nrows reads only the first rows (sampled runs)
     try:
-        df = pd.read_excel('data/student_scores.xlsx')
+        df = pd.read_excel('data/student_scores.xlsx', nrows=nrows)
         print(f"Extracted {len(df)} Kenyan student records")
         return df
     except Exception as e:
@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+
+# Historic drops are kept per day as data/history/<YYYY-MM-DD>/<dataset>.<ext>,
+# e.g. data/history/2024-05-01/scores.xlsx or data/history/2024-05-01/students.csv
+HISTORY_DIR = 'data/history'
+
+HISTORY_READERS = {
+    '.xlsx': pd.read_excel,
+    '.csv': pd.read_csv,
+    '.json': pd.read_json,
+    '.parquet': pd.read_parquet
+}
+
+def history_files(run_date, history_dir=HISTORY_DIR):
+    """Return {dataset: path} of the historic files kept for one day"""
+    partition_dir = os.path.join(history_dir, run_date)
+    if not os.path.isdir(partition_dir):
+        return {}
+    files = {}
+    for name in sorted(os.listdir(partition_dir)):
+        dataset_name, extension = os.path.splitext(name)
+        if extension.lower() in HISTORY_READERS:
+            files[dataset_name] = os.path.join(partition_dir, name)
+    return files
+
+def extract_history_file(path):
+    """Read one historic Excel drop or database snapshot"""
+    df = HISTORY_READERS[os.path.splitext(path)[1].lower()](path)
+    print(f"Extracted {len(df)} historic records from {path}")
+    return df
@@ -4,22 +4,34 @@ from sqlalchemy import create_engine, text
 import pandas as pd
 import os
 
-def extract_from_mysql():
+def create_mysql_engine():
+    """Create the SQLAlchemy engine for the source MySQL database; its connection pool can be reused"""
+    mysql_user = os.getenv("MYSQL_USER", "root")
+    mysql_password = os.getenv("MYSQL_PASSWORD", "1234")
+    mysql_host = os.getenv("MYSQL_HOST", "localhost")
+    mysql_database = os.getenv("MYSQL_DATABASE", "etl")
+    
+    connection_string = f"mysql+mysqlconnector://{mysql_user}:{mysql_password}@{mysql_host}/{mysql_database}"
+    return create_engine(connection_string, pool_pre_ping=True)
+
+def extract_from_mysql(engine=None, limit=None):
     """
     Extract student data from MySQL database using SQLAlchemy and return df student
+    
+    Pass an engine from create_mysql_engine() to reuse pooled connections across calls.
+    limit reads only that many rows, for sampled runs.
     """
     try:
         # MySQL engine
-        mysql_user = os.getenv("MYSQL_USER", "root")
-        mysql_password = os.getenv("MYSQL_PASSWORD", "1234")
-        mysql_host = os.getenv("MYSQL_HOST", "localhost")
-        mysql_database = os.getenv("MYSQL_DATABASE", "etl")
-        
-        connection_string = f"mysql+mysqlconnector://{mysql_user}:{mysql_password}@{mysql_host}/{mysql_database}"
-        engine = create_engine(connection_string)
+        if engine is None:
+            engine = create_mysql_engine()
         
         # Query to get student data
-        query = text("SELECT * FROM Students")
+        if limit:
+            # MySQL has no TABLESAMPLE; LIMIT stops the scan early
+            query = text("SELECT * FROM Students LIMIT :limit").bindparams(limit=int(limit))
+        else:
+            query = text("SELECT * FROM Students")
         with engine.connect() as connection:
             df = pd.read_sql(query, connection)
         
@@ -31,9 +43,10 @@ def extract_from_mysql():
         print("Returning sample student data instead...")
 
         # Return sample data if database doesn't exist
-        return pd.DataFrame({
+        df = pd.DataFrame({
             'student_id': [1, 2, 3, 4, 5],
             'name': ['Michael', 'Sandra', 'Mike', 'Prudence', 'Daniel'],
             'age': [29, 31, 49, 30, 22],
             'major': ['Computer Science', 'Data Science', 'English Literature', 'Petrolium Englineering', 'Dancing and Arts']
-        })
\ No newline at end of file
+        })
+        return df.head(limit) if limit else df
@@ -0,0 +1,22 @@
+import random
+
+# Fixed seed so repeated sampled runs see the same rows
+SAMPLE_SEED = 42
+
+def reservoir_sample(items, k, seed=SAMPLE_SEED):
+    """
+    Deterministic reservoir sample of k items from an iterable of unknown length
+    
+    Reads the iterable once and holds at most k items; the sample keeps the
+    items' original order. The same input and seed give the same sample.
+    """
+    rng = random.Random(seed)
+    reservoir = []
+    for index, item in enumerate(items):
+        if index < k:
+            reservoir.append((index, item))
+        else:
+            slot = rng.randint(0, index)
+            if slot < k:
+                reservoir[slot] = (index, item)
+    return [item for _, item in sorted(reservoir, key=lambda entry: entry[0])]
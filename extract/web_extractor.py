@@ -1,13 +1,15 @@
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
+from extract.sampling import reservoir_sample
 
-def extract_from_web():
-#    extract simple data -> headlines
+def extract_from_web(session=None, sample=None):
+#    extract simple data -> headlines; a requests.Session keeps connections warm between calls
+#    sample keeps a deterministic reservoir sample of that many headlines
     try:
         # website
         url = "https://news.ycombinator.com"
-        response = requests.get(url)
+        response = (session or requests).get(url)
         soup = BeautifulSoup(response.text, 'html.parser')
         # print(soup.prettify())
         
@@ -16,6 +18,8 @@ def extract_from_web():
         for item in soup.select('.titleline a')[:5]:
             headlines.append(item.text)
             # print(item.text)
+        if sample:
+            headlines = reservoir_sample(headlines, sample)
         
         # Create DataFrame
         df = pd.DataFrame({
@@ -29,8 +33,9 @@ def extract_from_web():
         
     except Exception as e:
         print(f"Error extracting web data: {e}")
-        return pd.DataFrame({
+        df = pd.DataFrame({
             'headline': ['Sample Headline 1', 'Sample Headline 2', 'Sample Headline 3'],
             'source': 'Sample Source',
             'scraped_at': pd.Timestamp.now()
-        })
\ No newline at end of file
+        })
+        return df.head(sample) if sample else df
\ No newline at end of file
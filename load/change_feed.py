@@ -0,0 +1,197 @@
+"""
+Per-run change-data-capture feed
+
+Changes are appended to the feed as segments named after a per-dataset
+sequence number that only ever increases:
+
+    <feed_dir>/<dataset>/seq-000000000001.ndjson
+    <feed_dir>/<dataset>/seq-000000000002.ndjson
+
+Every delta row carries _seq, _op ('insert', 'update' or 'delete') and
+_run_id. Consumers remember the last sequence number they applied and read
+the newer segments.
+
+File outputs are snapshots of a dataset, so publish() compares each run's
+rows with the previous run's by key and row hash and appends the inserted,
+updated and deleted rows; deletes only carry the key columns. Delivery is
+at least once: a run that fails after writing its segment emits the same
+changes again on the next run.
+
+The warehouse knows which rows a load inserted and removed, so append()
+records them directly instead of diffing: a run loaded again replaces its
+earlier rows, whose ids are published as deletes ahead of the new rows'
+inserts in the same segment. It never emits updates.
+"""
+
+import os
+import threading
+import pandas as pd
+from load.data_loader import (atomic_write, write_json_records, import_pyarrow, to_arrow_table,
+                              VOLATILE_COLUMNS)
+
+# Columns identifying a row of a file output, matched case-insensitively so both
+# source and warehouse column names work; datasets without their keys are keyed
+# by content. Rows sharing a key are told apart by their order in the dataset
+KEY_COLUMNS = {
+    'students': ['student_id'],
+    'scores': ['student_id', 'subject'],
+    'weather': ['city'],
+    'news': ['headline']
+}
+
+# Columns that never take part in the row hash
+IGNORED_COLUMNS = VOLATILE_COLUMNS | {'payload'}
+
+SEGMENT_FORMATS = {'ndjson', 'parquet'}
+
+STATE_FILE = 'state.csv'
+
+def hash_rows(df):
+    """Vectorized uint64 hash per row, as strings so they survive a CSV round trip"""
+    try:
+        hashes = pd.util.hash_pandas_object(df, index=False)
+    except TypeError:
+        hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    return hashes.astype(str).to_numpy()
+
+class ChangeFeed:
+    """Append-only delta feed for the datasets written by one loader or warehouse"""
+    
+    def __init__(self, feed_dir, segment_format='ndjson'):
+        if segment_format not in SEGMENT_FORMATS:
+            raise ValueError(f"Unsupported change feed format '{segment_format}'")
+        if segment_format == 'parquet':
+            import_pyarrow()
+        self.feed_dir = feed_dir
+        self.segment_format = segment_format
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+    
+    def dataset_lock(self, dataset_name):
+        """Lock serializing publishes of one dataset; different datasets publish in parallel"""
+        with self.locks_lock:
+            return self.locks.setdefault(dataset_name, threading.Lock())
+    
+    def dataset_dir(self, dataset_name):
+        return os.path.join(self.feed_dir, dataset_name)
+    
+    def key_columns(self, dataset_name, df):
+        """Return the dataset's key columns as named in df, or None if any is missing"""
+        by_lower = {str(column).lower(): column for column in df.columns}
+        keys = [by_lower.get(key) for key in KEY_COLUMNS.get(dataset_name, [])]
+        return keys if keys and None not in keys else None
+    
+    def last_sequence(self, dataset_name):
+        """Return the sequence number of the newest segment, 0 when there is none"""
+        directory = self.dataset_dir(dataset_name)
+        if not os.path.isdir(directory):
+            return 0
+        sequences = [int(name[4:16]) for name in os.listdir(directory)
+                     if name.startswith('seq-') and name[4:16].isdigit()]
+        return max(sequences, default=0)
+    
+    def read_state(self, dataset_name):
+        """Key hashes, row hashes and key values of the previous run"""
+        try:
+            return pd.read_csv(os.path.join(self.dataset_dir(dataset_name), STATE_FILE),
+                               dtype={'_key_hash': str, '_row_hash': str})
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return pd.DataFrame(columns=['_key_hash', '_row_hash'])
+    
+    def diff(self, dataset_name, df):
+        """Compare df with the previous run and return (delta, state) DataFrames"""
+        df = df.reset_index(drop=True)
+        keys = self.key_columns(dataset_name, df)
+        hashed = df[[column for column in df.columns if column not in IGNORED_COLUMNS]]
+        
+        current = pd.DataFrame({
+            '_row_hash': hash_rows(hashed),
+            '_key_hash': hash_rows(df[keys]) if keys else hash_rows(hashed)
+        })
+        # Every row is kept: repeats of a key are keyed by their occurrence, so
+        # the first row for a key keeps the plain key hash
+        occurrence = current.groupby('_key_hash').cumcount()
+        repeated = occurrence > 0
+        current.loc[repeated, '_key_hash'] = current.loc[repeated, '_key_hash'] + '-' + occurrence[repeated].astype(str)
+        if keys:
+            current[keys] = df[keys]
+        
+        previous = self.read_state(dataset_name)
+        previous_hashes = dict(zip(previous['_key_hash'], previous['_row_hash']))
+        
+        known = current['_key_hash'].isin(previous_hashes.keys())
+        changed = known & (current['_row_hash'] != current['_key_hash'].map(previous_hashes))
+        
+        inserted = df.loc[current.index[~known]].assign(_op='insert')
+        updated = df.loc[current.index[changed]].assign(_op='update')
+        removed = previous[~previous['_key_hash'].isin(current['_key_hash'])]
+        deleted = removed[[column for column in removed.columns if not column.startswith('_')]].assign(_op='delete')
+        
+        delta = pd.concat([frame for frame in (inserted, updated, deleted) if not frame.empty] or [pd.DataFrame()],
+                          ignore_index=True)
+        return delta, current
+    
+    def publish(self, dataset_name, df, run_id=None):
+        """
+        Append the changes in df since the previous run as a new segment
+        
+        Returns the segment path, or None when nothing changed.
+        """
+        with self.dataset_lock(dataset_name):
+            delta, state = self.diff(dataset_name, df)
+            segment_path = self.write_segment(dataset_name, delta, run_id)
+            atomic_write(os.path.join(self.dataset_dir(dataset_name), STATE_FILE),
+                         lambda path: state.to_csv(path, index=False))
+            return segment_path
+    
+    def append(self, dataset_name, df, run_id=None, deleted_ids=()):
+        """
+        Append every row of df as an insert, without comparing with earlier runs
+        
+        For stores such as the warehouse that know exactly what a load changed.
+        deleted_ids are the ids of rows the load removed; they go first in the
+        segment as deletes carrying only the id. Returns the segment path, or
+        None when there is nothing to append.
+        """
+        delta = df.reset_index(drop=True).assign(_op='insert')
+        if len(deleted_ids):
+            deletes = pd.DataFrame({'id': list(deleted_ids), '_op': 'delete'})
+            delta = pd.concat([deletes, delta], ignore_index=True)
+        with self.dataset_lock(dataset_name):
+            return self.write_segment(dataset_name, delta, run_id)
+    
+    def write_segment(self, dataset_name, delta, run_id):
+        """Write delta rows as the dataset's next segment; returns its path, or None when delta is empty"""
+        directory = self.dataset_dir(dataset_name)
+        os.makedirs(directory, exist_ok=True)
+        if delta.empty:
+            return None
+        
+        sequence = self.last_sequence(dataset_name) + 1
+        delta.insert(0, '_run_id', run_id)
+        delta.insert(0, '_op', delta.pop('_op'))
+        delta.insert(0, '_seq', sequence)
+        segment_path = os.path.join(directory, f'seq-{sequence:012d}.{self.segment_format}')
+        if self.segment_format == 'parquet':
+            pa = import_pyarrow()
+            atomic_write(segment_path, lambda path: pa.parquet.write_table(to_arrow_table(delta), path))
+        else:
+            atomic_write(segment_path, lambda path: write_json_records(delta, path))
+        counts = delta['_op'].value_counts().to_dict()
+        print(f"Change feed {dataset_name} #{sequence}: {counts.get('insert', 0)} inserted, "
+              f"{counts.get('update', 0)} updated, {counts.get('delete', 0)} deleted")
+        return segment_path
+    
+    def read_changes(self, dataset_name, after_sequence=0):
+        """Return the delta rows of all segments newer than after_sequence"""
+        directory = self.dataset_dir(dataset_name)
+        if not os.path.isdir(directory):
+            return pd.DataFrame()
+        
+        frames = []
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith('seq-') and name[4:16].isdigit()) or int(name[4:16]) <= after_sequence:
+                continue
+            path = os.path.join(directory, name)
+            frames.append(pd.read_parquet(path) if name.endswith('.parquet') else pd.read_json(path, lines=True))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
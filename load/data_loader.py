@@ -1,40 +1,466 @@
 import pandas as pd
+import gzip
+import hashlib
 import json
 import os
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from metrics import record_cache_lookup
 
-def load_data(transformed_data, output_format='json'):
+# Columnar formats are written as output/<dataset>/run_date=<date>/part-N.<ext>
+PARTITIONED_FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+DEFAULT_COMPRESSION = {'parquet': 'zstd', 'arrow': 'lz4'}
+
+# Rows per part file in partitioned outputs
+ROWS_PER_PART = 1000000
+
+# Rows serialized at a time by the streaming JSON writer
+JSON_CHUNK_ROWS = 10000
+
+# Data rows per Excel sheet: the 1,048,576 row limit less the header row
+EXCEL_MAX_ROWS = 1048575
+
+# Record-oriented text formats; 'json' is an array, 'ndjson' one record per line
+JSON_FORMATS = {'json': 'json', 'ndjson': 'ndjson'}
+
+# Columns stamped with the processing time, which would otherwise change every hash
+VOLATILE_COLUMNS = {'processed_at', 'loaded_at'}
+
+MANIFEST_FILE = 'manifest.json'
+
+def import_pyarrow():
+    """Import pyarrow, which the parquet and arrow outputs need"""
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow outputs require the 'pyarrow' package: pip install pyarrow") from e
+    return pyarrow
+
+def atomic_write(file_path, write):
     """
-    Load transformed data to output files
-    Returns the file paths of saved data
+    Call write(temp_path) and move the result to file_path in one step
+    
+    Readers see either the previous file or the complete new one, never a
+    partially written file.
+    """
+    directory, name = os.path.split(file_path)
+    temp_path = os.path.join(directory, f'.{name}.tmp')
+    try:
+        write(temp_path)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return file_path
+
+def stringify_object_columns(df):
+    """Copy of df with object column values as strings, for mixed-type columns Arrow cannot type"""
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].map(lambda value: value if value is None or pd.isna(value) else str(value))
+    return df
+
+def to_arrow_table(df):
+    """Convert a DataFrame to an Arrow table, falling back to strings for mixed-type columns"""
+    pa = import_pyarrow()
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.Table.from_pandas(stringify_object_columns(df), preserve_index=False)
+
+def write_arrow_file(df, path, chunk_rows=JSON_CHUNK_ROWS):
+    """Write df to an Arrow IPC file one record batch per chunk, without an Arrow copy of the whole frame"""
+    pa = import_pyarrow()
+    try:
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = stringify_object_columns(df)
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for offset in range(0, len(df), chunk_rows):
+            writer.write_batch(pa.RecordBatch.from_pandas(df.iloc[offset:offset + chunk_rows],
+                                                          schema=schema, preserve_index=False))
+
+def encode_records(chunk):
+    """
+    Serialize a DataFrame chunk to newline-terminated JSON records
+    
+    Uses pandas' C encoder, which writes NaN, inf and missing values as null
+    and datetimes in ISO format, so no separate cleaning pass is needed.
+    """
+    return chunk.to_json(orient='records', lines=True, date_format='iso').rstrip('\n') + '\n'
+
+def write_json_records(df, path, lines=True, compression=None, chunk_rows=JSON_CHUNK_ROWS):
+    """
+    Stream df to path as NDJSON (lines=True) or a JSON array, chunk by chunk
+    
+    Only one chunk is held as text at a time. compression='gzip' compresses
+    the stream as it is written.
+    """
+    if compression not in (None, 'gzip'):
+        raise ValueError(f"Unsupported JSON compression '{compression}'")
+    opener = (lambda: gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)) if compression \
+        else (lambda: open(path, 'w', encoding='utf-8'))
+    
+    with opener() as f:
+        if not lines:
+            f.write('[')
+        for offset in range(0, len(df), chunk_rows):
+            text = encode_records(df.iloc[offset:offset + chunk_rows])
+            if lines:
+                f.write(text)
+            else:
+                # Encoded strings never contain raw newlines, so records can be split on them
+                f.write(('\n' if offset == 0 else ',\n') + text.rstrip('\n').replace('\n', ',\n'))
+        if not lines:
+            f.write('\n]\n' if len(df) else ']\n')
+
+def excel_values(series):
+    """Column values as plain Python objects openpyxl can write; NaN and inf become empty cells"""
+    if pd.api.types.is_float_dtype(series):
+        series = series.where(series.abs() != float('inf'))
+    values = series.astype(object).where(series.notna(), None)
+    if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        values = values.map(lambda value: str(value) if isinstance(value, (dict, list, tuple, set)) else value)
+    return values.tolist()
+
+def write_xlsx(df, path, max_rows=EXCEL_MAX_ROWS, chunk_rows=JSON_CHUNK_ROWS):
+    """
+    Stream df to an Excel workbook with openpyxl's write-only mode
+    
+    Rows are converted and appended chunk by chunk and written straight to
+    disk, so memory does not grow with the dataset. Datasets longer than
+    max_rows continue on Sheet2, Sheet3 and so on.
+    """
+    chunks = (df.iloc[offset:offset + chunk_rows] for offset in range(0, len(df), chunk_rows))
+    write_xlsx_chunks(df.columns, chunks, path, max_rows)
+
+def write_xlsx_chunks(columns, chunks, path, max_rows=EXCEL_MAX_ROWS):
+    """Append DataFrame chunks to a write-only workbook, starting a new sheet every max_rows rows"""
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    header = [str(column) for column in columns]
+    sheet_count = 0
+    sheet_rows = max_rows
+    for chunk in chunks:
+        offset = 0
+        while offset < len(chunk):
+            if sheet_rows == max_rows:
+                sheet_count += 1
+                sheet = workbook.create_sheet(f'Sheet{sheet_count}')
+                sheet.append(header)
+                sheet_rows = 0
+            part = chunk.iloc[offset:offset + max_rows - sheet_rows]
+            for row in zip(*(excel_values(part[column]) for column in part.columns)):
+                sheet.append(row)
+            sheet_rows += len(part)
+            offset += len(part)
+    if not sheet_count:
+        workbook.create_sheet('Sheet1').append(header)
+    workbook.save(path)
+
+def write_xlsx_from_arrow(arrow_path, file_path, max_rows=EXCEL_MAX_ROWS):
+    """
+    Write a workbook from an Arrow IPC file, one record batch at a time
+    
+    Runs in a workbook process: the dataset arrives as a file path rather
+    than a pickled DataFrame, and only one batch is read and converted at
+    a time.
     """
-    output_paths = {}
+    pa = import_pyarrow()
+    # Read batches on demand; a memory map would keep every page read resident
+    with pa.OSFile(arrow_path, 'rb') as source:
+        reader = pa.ipc.open_file(source)
+        chunks = (reader.get_batch(index).to_pandas() for index in range(reader.num_record_batches))
+        return atomic_write(file_path, lambda path: write_xlsx_chunks(reader.schema.names, chunks, path, max_rows))
+
+_workbook_pool = None
+_workbook_pool_workers = 0
+_workbook_pool_lock = threading.Lock()
+
+def get_workbook_pool(workers):
+    """
+    Shared processes for building workbooks, started on first use and reused by later runs
     
-    # Creating output directory if it doesn't exist
-    os.makedirs('output', exist_ok=True)
+    Building a workbook is pure Python and holds the GIL, so workbooks are
+    built in separate processes to run in parallel; spawn keeps the
+    warehouse threads out of them.
+    """
+    global _workbook_pool, _workbook_pool_workers
+    with _workbook_pool_lock:
+        if _workbook_pool is None or _workbook_pool_workers < workers:
+            if _workbook_pool is not None:
+                _workbook_pool.shutdown(wait=False)
+            _workbook_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _workbook_pool_workers = workers
+        return _workbook_pool
+
+def write_partitioned(df, output_format, partition_dir, compression, rows_per_part):
+    """Write one dataset as part files in its run_date partition directory"""
+    pa = import_pyarrow()
+    extension = PARTITIONED_FORMATS[output_format]
+    os.makedirs(partition_dir, exist_ok=True)
     
-    for name, df in transformed_data.items():
-        if output_format == 'json':
-            file_path = f'output/{name}.json'
-            df.to_json(file_path, orient='records', indent=2)
-        elif output_format == 'csv':
-            file_path = f'output/{name}.csv'
-            df.to_csv(file_path, index=False)
+    table = to_arrow_table(df)
+    written = set()
+    for part, offset in enumerate(range(0, max(table.num_rows, 1), rows_per_part)):
+        chunk = table.slice(offset, rows_per_part)
+        file_name = f'part-{part:05d}.{extension}'
+        if output_format == 'parquet':
+            write = lambda path, chunk=chunk: pa.parquet.write_table(chunk, path, compression=compression)
         else:
-            file_path = f'output/{name}.xlsx'
-            df.to_excel(file_path, index=False)
+            write = lambda path, chunk=chunk: pa.feather.write_feather(chunk, path, compression=compression)
+        atomic_write(os.path.join(partition_dir, file_name), write)
+        written.add(file_name)
+    
+    # A rerun on the same date replaces the partition, so drop parts it no longer has
+    for file_name in os.listdir(partition_dir):
+        if file_name.startswith('part-') and file_name not in written:
+            os.remove(os.path.join(partition_dir, file_name))
+    
+    return partition_dir
+
+def dataset_fingerprint(df):
+    """
+    Return a content hash of a DataFrame, ignoring its index and VOLATILE_COLUMNS
+    
+    Rows are hashed with pandas' vectorized hash_pandas_object; column names
+    and dtypes are part of the hash so schema changes are detected too.
+    """
+    df = df[[column for column in df.columns if column not in VOLATILE_COLUMNS]]
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=False)
+    except TypeError:
+        # Unhashable cell values such as lists or dicts
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode())
+    digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+def read_manifest(output_dir):
+    """Return the manifest of previously written outputs, keyed by dataset name"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def output_location(name, output_format, output_dir='output', run_date=None, compression=None):
+    """Return (path, compression) of a dataset's output; partitioned formats return the partition directory"""
+    if output_format in PARTITIONED_FORMATS:
+        run_date = run_date or pd.Timestamp.now().strftime('%Y-%m-%d')
+        return (os.path.join(output_dir, name, f'run_date={run_date}'),
+                compression or DEFAULT_COMPRESSION[output_format])
+    if output_format in JSON_FORMATS:
+        extension = JSON_FORMATS[output_format] + ('.gz' if compression == 'gzip' else '')
+        return os.path.join(output_dir, f'{name}.{extension}'), compression
+    if output_format == 'csv':
+        return os.path.join(output_dir, f'{name}.csv'), None
+    return os.path.join(output_dir, f'{name}.xlsx'), None
+
+def write_dataset(name, df, output_format, output_dir='output', run_date=None,
+                  compression=None, rows_per_part=ROWS_PER_PART, chunk_rows=None):
+    """Write one dataset in the requested format and return its path; chunk_rows overrides the write chunk size"""
+    file_path, compression = output_location(name, output_format, output_dir, run_date, compression)
+    
+    if output_format in PARTITIONED_FORMATS:
+        return write_partitioned(df, output_format, file_path, compression, rows_per_part)
+    if output_format in JSON_FORMATS:
+        lines = output_format == 'ndjson'
+        chunk_rows = chunk_rows or JSON_CHUNK_ROWS
+        return atomic_write(file_path, lambda path: write_json_records(df, path, lines, compression, chunk_rows))
+    elif output_format == 'csv':
+        return atomic_write(file_path, lambda path: df.to_csv(path, index=False, chunksize=chunk_rows))
+    else:
+        return atomic_write(file_path, lambda path: write_xlsx(df, path, chunk_rows=chunk_rows or JSON_CHUNK_ROWS))
+
+class OutputWriter:
+    """
+    Writes a run's datasets one at a time, then the manifest and summary
+    
+    Lets a dataset be saved as soon as it is ready instead of waiting for the
+    others; load_data drives one for a whole dict of datasets. write() is
+    safe to call from several threads.
+    """
+    
+    def __init__(self, output_format='json', output_dir='output', run_date=None, compression=None,
+                 force=False, run_id=None, change_feed=True, workbook_workers=1, memory_budget=None):
+        self.output_format = output_format
+        self.memory_budget = memory_budget
+        self.output_dir = output_dir
+        self.run_date = run_date
+        self.compression = compression
+        self.force = force
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.manifest = read_manifest(output_dir)
+        self.output_paths = {}
+        self.record_counts = {}
+        self.written = []
+        
+        # Creating output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        
+        if output_format in PARTITIONED_FORMATS:
+            import_pyarrow()
         
-        output_paths[name] = file_path
-        print(f"Saved {name} data to {file_path}")
+        self.feed = None
+        if change_feed:
+            from load.change_feed import ChangeFeed
+            self.feed = ChangeFeed(os.path.join(output_dir, 'changes'))
+        
+        # Workbooks are built in parallel processes, which stream the rows from an
+        # Arrow file; without pyarrow they are written from the calling thread
+        self.workbook_pool = None
+        if output_format == 'xlsx' and workbook_workers > 1:
+            try:
+                import_pyarrow()
+                self.workbook_pool = get_workbook_pool(workbook_workers)
+            except ImportError:
+                pass
     
-    #combined summary
-    summary = {
-        'datasets': list(transformed_data.keys()),
-        'record_counts': {name: len(df) for name, df in transformed_data.items()},
-        'processed_at': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
-    }
+    def write(self, name, df):
+        """Write one dataset unless the manifest shows it unchanged; returns its path"""
+        file_path, compression = output_location(name, self.output_format, self.output_dir,
+                                                 self.run_date, self.compression)
+        entry = {
+            'hash': dataset_fingerprint(df),
+            'format': self.output_format,
+            'compression': compression,
+            'path': file_path,
+            'records': len(df)
+        }
+        previous = self.manifest.get(name, {})
+        changed = (self.force or not os.path.exists(file_path)
+                   or any(previous.get(key) != value for key, value in entry.items()))
+        record_cache_lookup('output_manifest', not changed)
+        
+        if changed:
+            rows_per_part, chunk_rows = ROWS_PER_PART, None
+            if self.memory_budget is not None:
+                # Smaller chunks when the run is near its memory budget
+                rows_per_part = self.memory_budget.chunk_rows(ROWS_PER_PART)
+                chunk_rows = self.memory_budget.chunk_rows(JSON_CHUNK_ROWS)
+            if self.workbook_pool:
+                self.write_workbook(df, file_path, chunk_rows or JSON_CHUNK_ROWS)
+            else:
+                write_dataset(name, df, self.output_format, self.output_dir, self.run_date, self.compression,
+                              rows_per_part, chunk_rows)
+            if self.feed:
+                self.feed.publish(name, df, self.run_id)
+            entry['written_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+            print(f"Saved {name} data to {file_path}")
+        else:
+            entry = previous
+            print(f"Unchanged {name} data, kept {file_path}")
+        
+        with self.lock:
+            self.manifest[name] = entry
+            self.output_paths[name] = file_path
+            self.record_counts[name] = len(df)
+            if changed:
+                self.written.append(name)
+        return file_path
+    
+    def write_workbook(self, df, file_path, chunk_rows):
+        """Build an xlsx output in a workbook process, handing it the rows as a temporary Arrow file"""
+        descriptor, arrow_path = tempfile.mkstemp(suffix='.arrow')
+        os.close(descriptor)
+        try:
+            write_arrow_file(df, arrow_path, chunk_rows)
+            self.workbook_pool.submit(write_xlsx_from_arrow, arrow_path, file_path).result()
+        finally:
+            os.remove(arrow_path)
     
-    with open('output/summary.json', 'w') as f:
-        json.dump(summary, f, indent=2)
+    def close(self):
+        """Stop handing workbooks to the shared workbook processes, which stay up for later runs"""
+        self.workbook_pool = None
+    
+    def finish(self):
+        """
+        Write the manifest and summary.json for the datasets written so far
+        
+        A run over a subset of the sources only updates its own datasets in
+        summary.json; entries of datasets it did not touch are kept.
+        """
+        self.close()
+        
+        if self.written:
+            def write_manifest(path):
+                with open(path, 'w') as f:
+                    json.dump(self.manifest, f, indent=2)
+            
+            atomic_write(os.path.join(self.output_dir, MANIFEST_FILE), write_manifest)
+        
+        summary_path = os.path.join(self.output_dir, 'summary.json')
+        try:
+            with open(summary_path) as f:
+                previous_summary = json.load(f)
+        except (OSError, ValueError):
+            previous_summary = {}
+        
+        #combined summary
+        summary = {
+            'datasets': list(dict.fromkeys(previous_summary.get('datasets', []) + list(self.output_paths))),
+            'record_counts': {**previous_summary.get('record_counts', {}), **self.record_counts},
+            'output_format': self.output_format,
+            'output_paths': {**previous_summary.get('output_paths', {}), **self.output_paths},
+            'processed_at': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        
+        # Leave summary.json alone when it would only differ in its timestamp
+        previous_summary['processed_at'] = summary['processed_at']
+        
+        if self.written or self.force or previous_summary != summary:
+            def write_summary(path):
+                with open(path, 'w') as f:
+                    json.dump(summary, f, indent=2)
+            
+            atomic_write(summary_path, write_summary)
+        
+        return dict(self.output_paths)
+
+def load_data(transformed_data, output_format='json', output_dir='output', run_date=None,
+              compression=None, max_workers=None, force=False, run_id=None, change_feed=True):
+    """
+    Load transformed data to output files
+    
+    output_format is json, ndjson, csv, xlsx, parquet or arrow. JSON outputs
+    are streamed in chunks and gzipped when compression='gzip'. Excel
+    workbooks are streamed in write-only mode, split into further sheets at
+    Excel's row limit and written in parallel processes. Parquet and
+    Arrow IPC outputs are compressed (zstd and lz4 by default) and partitioned
+    as <output_dir>/<dataset>/run_date=<run_date>/part-N. Datasets are written
+    in parallel and every file is written to a temporary name and renamed into place.
+    
+    A manifest records a content hash per output; datasets whose content,
+    format and path are unchanged since the last run are not rewritten
+    unless force is set.
+    
+    With change_feed, the rows inserted, updated and deleted since the
+    previous run are appended to <output_dir>/changes (see load.change_feed).
+    Returns the file paths of saved data
+    """
+    workers = max_workers or min(len(transformed_data), os.cpu_count() or 1) or 1
+    writer = OutputWriter(output_format, output_dir, run_date, compression, force, run_id,
+                          change_feed, workbook_workers=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='load') as executor:
+            futures = [executor.submit(writer.write, name, df) for name, df in transformed_data.items()]
+            for future in futures:
+                future.result()
+    except Exception:
+        writer.close()
+        raise
+    output_paths = writer.finish()
     
     print("ETL pipeline completed successfully!")
-    return output_paths
\ No newline at end of file
+    return {name: output_paths[name] for name in transformed_data if name in output_paths}
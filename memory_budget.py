@@ -0,0 +1,169 @@
+"""
+Memory budget for pipeline runs
+
+MemoryBudget watches the process's memory while a run is going. Once
+usage reaches the high-water mark of the budget (80% by default) the run
+switches to a slower, leaner mode for the rest of the run instead of
+running out of memory:
+
+- DataFrames handed between stages are spilled to Arrow IPC files and
+  read back when the next stage starts, so frames waiting for a stage
+  do not stay resident; retained results stay spilled until the run
+  reads them at its end
+- stages that would run in parallel across datasets run one at a time
+- file outputs are written in smaller chunks
+
+Memory is the resident set size from /proc where available, otherwise
+the memory traced by tracemalloc when it is running, otherwise the
+process's peak RSS.
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import tracemalloc
+import pandas as pd
+from dataflow import current_rss_mb, peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+HIGH_WATER = 0.8
+POLL_SECONDS = 0.1
+# Smallest chunk the lean mode shrinks output chunks to
+MIN_CHUNK_ROWS = 1000
+
+def current_memory_mb():
+    """Current memory use of the process in MB"""
+    rss = current_rss_mb()
+    if rss is not None:
+        return rss
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+    return peak_rss_mb() or 0.0
+
+class SpilledFrame:
+    """Handle to a DataFrame spilled to disk"""
+    
+    def __init__(self, path, rows, size_mb):
+        self.path = path
+        self.rows = rows
+        self.size_mb = size_mb
+
+class MemoryBudget:
+    """Track memory against a limit and spill, shrink and serialize work when near it"""
+    
+    def __init__(self, limit_mb, spill_dir=None, high_water=HIGH_WATER, poll_seconds=POLL_SECONDS,
+                 measure=current_memory_mb):
+        if limit_mb <= 0:
+            raise ValueError("Memory budget must be positive")
+        self.limit_mb = limit_mb
+        self.threshold_mb = limit_mb * high_water
+        self.spill_root = spill_dir
+        self.spill_dir = None
+        self.poll_seconds = poll_seconds
+        self.measure = measure
+        self.tripped = threading.Event()
+        self.stopped = threading.Event()
+        self.serial_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.watcher = None
+        self.spill_count = 0
+        self.stats = {'limit_mb': limit_mb, 'peak_mb': 0.0, 'spills': 0, 'spilled_mb': 0.0, 'serialized_stages': 0}
+    
+    @classmethod
+    def from_env(cls):
+        """Budget from ETL_MEMORY_BUDGET_MB and ETL_SPILL_DIR, or None when no budget is set"""
+        limit = os.getenv('ETL_MEMORY_BUDGET_MB')
+        return cls(float(limit), os.getenv('ETL_SPILL_DIR') or None) if limit else None
+    
+    def start(self):
+        """Start watching memory in the background"""
+        self.stopped.clear()
+        self.watcher = threading.Thread(target=self.watch, name='memory-budget', daemon=True)
+        self.watcher.start()
+        return self
+    
+    def stop(self):
+        """Stop watching and delete the spill files"""
+        self.stopped.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def watch(self):
+        while True:
+            self.check()
+            if self.stopped.wait(self.poll_seconds):
+                return
+    
+    def check(self):
+        """Measure memory now; crossing the high-water mark switches on the lean mode for the rest of the run"""
+        used = self.measure()
+        with self.stats_lock:
+            self.stats['peak_mb'] = round(max(self.stats['peak_mb'], used), 1)
+        if used >= self.threshold_mb and not self.tripped.is_set():
+            logger.warning(f"Memory at {used:.0f} MB of a {self.limit_mb:.0f} MB budget: "
+                           f"spilling intermediate frames and serializing stages")
+            self.tripped.set()
+        return used
+    
+    def under_pressure(self):
+        """Whether the run should spill, shrink chunks and serialize stages"""
+        return self.tripped.is_set() or self.check() >= self.threshold_mb
+    
+    def chunk_rows(self, default):
+        """Chunk size to use for writing; a quarter of the default under pressure"""
+        return max(MIN_CHUNK_ROWS, default // 4) if self.under_pressure() else default
+    
+    def count(self, stat, amount=1):
+        with self.stats_lock:
+            self.stats[stat] = round(self.stats[stat] + amount, 3)
+    
+    def spill(self, df, name):
+        """Write df to an Arrow IPC file and return a SpilledFrame; the caller drops its reference"""
+        with self.stats_lock:
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.mkdtemp(prefix='etl-spill-', dir=self.spill_root)
+            self.spill_count += 1
+            path = os.path.join(self.spill_dir, f'{self.spill_count:05d}-{name}.arrow')
+        
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df)
+            with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        except Exception:
+            # Mixed-type columns and missing pyarrow fall back to pickle
+            if os.path.exists(path):
+                os.remove(path)
+            path = path[:-len('.arrow')] + '.pkl'
+            df.to_pickle(path)
+        
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        self.count('spills')
+        self.count('spilled_mb', size_mb)
+        return SpilledFrame(path, len(df), size_mb)
+    
+    def load(self, spilled):
+        """Read a spilled frame back into memory"""
+        if spilled.path.endswith('.pkl'):
+            return pd.read_pickle(spilled.path)
+        import pyarrow as pa
+        # to_pandas copies every column, so a memory map would save nothing
+        with pa.OSFile(spilled.path, 'rb') as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    
+    def restore(self, value):
+        """Read value back if it is a SpilledFrame, otherwise return it unchanged"""
+        return self.load(value) if isinstance(value, SpilledFrame) else value
@@ -0,0 +1,227 @@
+"""
+Prometheus metrics for the ETL pipeline and dashboard
+
+Counters and histograms keep one value store per thread, so recording a
+value is a plain dict update on the calling thread with no lock taken.
+The stores are only merged when /metrics is scraped; stores of threads
+that have exited are folded into a shared total at that point so that
+short-lived worker threads do not accumulate.
+"""
+
+import bisect
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers fast API routes up to slow pipeline stages
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RUN_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+REGISTRY = []
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=()):
+    """Render {name="value",...}, or nothing for an unlabelled sample"""
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    """Render a sample value the way Prometheus parses it"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A named metric family with a fixed set of label names"""
+    
+    kind = 'untyped'
+    
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        if registry is not None:
+            registry.append(self)
+    
+    def key(self, labels):
+        """Label values in labelnames order"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {list(self.labelnames)}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def render(self):
+        """Lines of this family in the Prometheus text format"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(self.labelnames, labels, extra)} {format_value(value)}')
+        return lines
+
+class ThreadShardedMetric(Metric):
+    """Metric whose values are recorded into per-thread stores and merged on collection"""
+    
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.local = threading.local()
+        self.shards = []
+        self.retired = {}
+        self.shards_lock = threading.Lock()
+    
+    def shard(self):
+        """The calling thread's value store; the lock is only taken on a thread's first update"""
+        values = getattr(self.local, 'values', None)
+        if values is None:
+            values = self.local.values = {}
+            with self.shards_lock:
+                self.shards.append((threading.current_thread(), values))
+        return values
+    
+    def merge(self, total, value):
+        """Combine two values of one label set"""
+        raise NotImplementedError
+    
+    def collect(self):
+        """Merged values of all threads, keyed by label values"""
+        with self.shards_lock:
+            live = []
+            for thread, values in self.shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    # The thread can no longer write to its store, so fold it in for good
+                    for key, value in values.items():
+                        self.retired[key] = self.merge(self.retired.get(key), value)
+            self.shards = live
+            totals = dict(self.retired)
+            stores = [values for _, values in live]
+        
+        for values in stores:
+            # dict() copies under the GIL, so a concurrent update cannot break the iteration
+            for key, value in dict(values).items():
+                totals[key] = self.merge(totals.get(key), value)
+        return totals
+
+class Counter(ThreadShardedMetric):
+    """Monotonically increasing count"""
+    
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        values = self.shard()
+        key = self.key(labels)
+        values[key] = values.get(key, 0) + amount
+    
+    def merge(self, total, value):
+        return value if total is None else total + value
+    
+    def value(self, **labels):
+        """Current total of one label set"""
+        return self.collect().get(self.key(labels), 0)
+    
+    def samples(self):
+        for key, value in sorted(self.collect().items()):
+            yield '', key, (), value
+
+class Histogram(ThreadShardedMetric):
+    """Distribution of observed values in cumulative buckets"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, amount, **labels):
+        values = self.shard()
+        key = self.key(labels)
+        state = values.get(key)
+        if state is None:
+            # Per-bucket counts plus an overflow slot, then the sum
+            state = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, amount)] += 1
+        state[-1] += amount
+    
+    def merge(self, total, value):
+        return list(value) if total is None else [a + b for a, b in zip(total, value)]
+    
+    def samples(self):
+        for key, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                yield '_bucket', key, (('le', format_value(float(bound))),), cumulative
+            yield '_sum', key, (), state[-1]
+            yield '_count', key, (), cumulative
+
+class Gauge(Metric):
+    """Value that is set rather than accumulated, e.g. refreshed right before a scrape"""
+    
+    kind = 'gauge'
+    
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.values = {}
+    
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+    
+    def samples(self):
+        for key, value in sorted(dict(self.values).items()):
+            yield '', key, (), value
+
+def render(registry=REGISTRY):
+    """All metrics of a registry in the Prometheus text exposition format"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'etl_http_request_duration_seconds', 'Dashboard request latency by route',
+    ['route', 'method', 'status']
+)
+PIPELINE_RUNS = Counter('etl_pipeline_runs_total', 'Pipeline runs by final status', ['status'])
+PIPELINE_RUN_SECONDS = Histogram(
+    'etl_pipeline_run_duration_seconds', 'Pipeline run wall time by final status',
+    ['status'], buckets=RUN_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'etl_stage_duration_seconds', 'Wall time of each dataset stage', ['dataset', 'stage']
+)
+STAGE_ROWS = Counter('etl_stage_rows_total', 'Rows produced by each dataset stage', ['dataset', 'stage'])
+EXTRACTIONS = Counter('etl_extractions_total', 'Extractor calls by source and outcome', ['source', 'outcome'])
+SCHEDULED_RUNS = Counter(
+    'etl_scheduled_runs_total', 'Scheduler decisions: started, coalesced into a running run, or locked out',
+    ['outcome']
+)
+CACHE_LOOKUPS = Counter('etl_cache_lookups_total', 'Cache lookups by cache and result', ['cache', 'result'])
+CACHE_HIT_RATIO = Gauge('etl_cache_hit_ratio', 'Share of cache lookups that were hits', ['cache'])
+WAREHOUSE_ROWS = Gauge('etl_warehouse_rows', 'Rows in each warehouse table', ['table'])
+
+def record_cache_lookup(cache, hit):
+    """Count one lookup of a named cache"""
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+def record_stage_metrics(stage_metrics):
+    """Observe the per-stage measurements the dataflow scheduler returns for a run"""
+    for entry in stage_metrics:
+        STAGE_SECONDS.observe(entry['wall_seconds'], dataset=entry['dataset'], stage=entry['stage'])
+        if entry.get('rows') is not None:
+            STAGE_ROWS.inc(entry['rows'], dataset=entry['dataset'], stage=entry['stage'])
+
+def update_cache_hit_ratios():
+    """Refresh etl_cache_hit_ratio from the lookup counters"""
+    lookups = {}
+    for (cache, result), count in CACHE_LOOKUPS.collect().items():
+        lookups.setdefault(cache, {})[result] = count
+    for cache, counts in lookups.items():
+        total = sum(counts.values())
+        CACHE_HIT_RATIO.set(counts.get('hit', 0) / total if total else 0.0, cache=cache)
+
+def update_warehouse_rows(summary):
+    """Refresh etl_warehouse_rows from a warehouse summary"""
+    for table, count in summary.items():
+        if isinstance(count, int):
+            WAREHOUSE_ROWS.set(count, table=table)
@@ -0,0 +1,218 @@
+"""
+Per-stage profiling of the ETL pipeline
+
+StageProfiler wraps every stage of the dataflow chains. Each stage run is
+profiled with cProfile and, optionally, sampled for flamegraph stacks and
+traced with tracemalloc. For every dataset and stage it writes:
+
+    <dataset>.<stage>.prof       cProfile dump (pstats, snakeviz, ...)
+    <dataset>.<stage>.collapsed  sampled stacks, one "a;b;c count" per line,
+                                 ready for flamegraph.pl or speedscope
+
+and summary.txt lists the hottest functions and largest allocators of
+each stage. Profiled stages run one at a time so that time and
+allocations are attributed to the stage that caused them; wall times
+of a profiled run are therefore not those of a normal run.
+
+cProfile and tracemalloc only see the thread running the stage. Work a
+stage hands to the warehouse writer thread or the change feed publisher
+shows up there as waiting; the sampler also samples those threads while
+a stage runs and adds their busy stacks to the stage's .collapsed file
+under the thread's name. Workbook processes are not profiled at all.
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+PROFILE_DIR = 'profiles'
+SAMPLE_INTERVAL_MS = 5
+TOP_N = 20
+# Threads a stage hands work to, sampled alongside the stage's own thread
+HELPER_THREAD_PREFIXES = ('warehouse-writer', 'change-feed')
+# Innermost frames of a helper thread waiting for work rather than doing it
+IDLE_MODULES = ('threading.py', 'queue.py', os.path.join('concurrent', 'futures', 'thread.py'))
+
+def frame_label(code):
+    """Collapsed-stack name of a code object; semicolons separate frames, so none inside"""
+    filename = os.path.relpath(code.co_filename) if code.co_filename.startswith(os.getcwd()) else code.co_filename
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+def busy_helper_threads():
+    """Thread ids and names of the running helper threads"""
+    return [(thread.ident, thread.name) for thread in threading.enumerate()
+            if thread.name.startswith(HELPER_THREAD_PREFIXES)]
+
+class StackSampler(threading.Thread):
+    """Sample the stack of the thread running the active stage, and of busy helper threads, at a fixed interval"""
+    
+    def __init__(self, interval_ms):
+        super().__init__(name='stage-sampler', daemon=True)
+        self.interval = interval_ms / 1000
+        self.stopped = threading.Event()
+        self.target = None
+        self.stacks = {}
+        self.lock = threading.Lock()
+    
+    def track(self, thread_id, root_code):
+        """Start sampling a thread, keeping only frames below root_code; returns the previous samples"""
+        with self.lock:
+            stacks = self.stacks
+            self.stacks = {}
+            self.target = (thread_id, root_code) if thread_id is not None else None
+        return stacks
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                if self.target is None:
+                    continue
+                thread_id, root_code = self.target
+                frames = sys._current_frames()
+                frame = frames.get(thread_id)
+                names = []
+                while frame is not None and frame.f_code is not root_code:
+                    names.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                if names:
+                    self.add(names)
+                for helper_id, helper_name in busy_helper_threads():
+                    frame = frames.get(helper_id)
+                    if frame is None or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                        continue
+                    names = []
+                    while frame is not None:
+                        names.append(frame_label(frame.f_code))
+                        frame = frame.f_back
+                    self.add(names + [f'[{helper_name}]'])
+    
+    def add(self, names):
+        """Count one sample of a stack given innermost frame first"""
+        stack = ';'.join(reversed(names))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+class StageProfiler:
+    """Profile each stage of a pipeline run and write per-stage dumps and a summary"""
+    
+    def __init__(self, output_dir=None, sample_interval_ms=SAMPLE_INTERVAL_MS, trace_memory=False, top_n=TOP_N):
+        self.output_dir = output_dir or os.path.join(PROFILE_DIR, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        self.trace_memory = trace_memory
+        self.top_n = top_n
+        self.sampler = StackSampler(sample_interval_ms) if sample_interval_ms else None
+        self.lock = threading.Lock()
+        self.results = []
+        os.makedirs(self.output_dir, exist_ok=True)
+    
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start(25)
+        if self.sampler:
+            self.sampler.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        if self.sampler:
+            self.sampler.stop()
+        if self.trace_memory:
+            tracemalloc.stop()
+        self.write_summary()
+    
+    def wrap(self, dataset_name, stage, func):
+        """Return func profiled as one stage of a dataset's chain"""
+        def profiled(*args):
+            with self.lock:
+                profile = cProfile.Profile()
+                before = tracemalloc.take_snapshot() if self.trace_memory else None
+                if self.trace_memory:
+                    tracemalloc.reset_peak()
+                if self.sampler:
+                    self.sampler.track(threading.get_ident(), profiled.__code__)
+                start = time.perf_counter()
+                profile.enable()
+                try:
+                    return func(*args)
+                finally:
+                    profile.disable()
+                    wall_seconds = time.perf_counter() - start
+                    stacks = self.sampler.track(None, None) if self.sampler else None
+                    after = tracemalloc.take_snapshot() if self.trace_memory else None
+                    peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+                    self.record(dataset_name, stage, profile, wall_seconds, stacks, before, after, peak)
+        return profiled
+    
+    def record(self, dataset_name, stage, profile, wall_seconds, stacks, before, after, peak):
+        """Write a stage's profile dump and stacks, and keep its top-N for the summary"""
+        prefix = os.path.join(self.output_dir, f'{dataset_name}.{stage}')
+        profile.dump_stats(f'{prefix}.prof')
+        if stacks is not None:
+            with open(f'{prefix}.collapsed', 'w', encoding='utf-8') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f'{stack} {count}\n')
+        
+        report = io.StringIO()
+        stats = pstats.Stats(profile, stream=report)
+        stats.sort_stats('tottime').print_stats(self.top_n)
+        allocators = []
+        if after is not None:
+            allocators = [entry for entry in after.compare_to(before, 'lineno') if entry.size_diff > 0]
+            allocators = sorted(allocators, key=lambda entry: entry.size_diff, reverse=True)[:self.top_n]
+        
+        helper_samples = {}
+        for stack, count in (stacks or {}).items():
+            if stack.startswith('['):
+                thread_name = stack[1:stack.index(']')]
+                helper_samples[thread_name] = helper_samples.get(thread_name, 0) + count
+        
+        self.results.append({
+            'dataset': dataset_name,
+            'stage': stage,
+            'wall_seconds': wall_seconds,
+            'stage_samples': sum((stacks or {}).values()) - sum(helper_samples.values()),
+            'helper_samples': helper_samples,
+            'hot_functions': report.getvalue(),
+            'allocators': allocators,
+            'peak_mb': peak / (1024 * 1024) if peak is not None else None
+        })
+    
+    def write_summary(self):
+        """Write summary.txt with the hottest functions and largest allocators per stage"""
+        lines = [
+            'cProfile and tracemalloc figures cover only the thread running each stage. Work handed to the',
+            'warehouse writer thread or the change feed publisher is sampled into the .collapsed files under',
+            'the thread\'s name when stack sampling is on; workbook processes are not profiled.',
+            ''
+        ]
+        for result in sorted(self.results, key=lambda result: result['wall_seconds'], reverse=True):
+            lines.append('=' * 78)
+            lines.append(f"{result['dataset']} / {result['stage']}: {result['wall_seconds']:.3f}s wall")
+            lines.append('=' * 78)
+            lines.append(f"Top {self.top_n} functions by own time:")
+            lines.append(result['hot_functions'].strip())
+            if result['helper_samples']:
+                lines.append('')
+                lines.append(f"Stack samples: {result['stage_samples']} on the stage's thread, "
+                             + ', '.join(f'{count} on {name}' for name, count in sorted(result['helper_samples'].items())))
+            if result['peak_mb'] is not None:
+                lines.append('')
+                lines.append(f"Peak traced memory: {result['peak_mb']:.1f} MB")
+                lines.append(f"Top {self.top_n} allocators still held after the stage:")
+                for entry in result['allocators']:
+                    frame = entry.traceback[0]
+                    lines.append(f"  {entry.size_diff / 1024:10.1f} KiB {entry.count_diff:8d} blocks  "
+                                 f"{frame.filename}:{frame.lineno}")
+            lines.append('')
+        
+        path = os.path.join(self.output_dir, 'summary.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+        return path
@@ -0,0 +1,248 @@
+"""
+Long-lived scheduler for the ETL pipeline
+
+PipelineScheduler runs each dataset on its own interval. Between runs it
+keeps the warehouse (its writer thread, caches and query stats), a
+requests.Session and the MySQL engine alive, so scheduled runs reuse
+pooled connections instead of rebuilding them.
+
+A run holds an exclusive lock on a lock file, which `cli.py etl` takes
+too, so two runs never overlap. Datasets that come due while a run is
+still going are coalesced into a single follow-up run rather than queued
+once per missed interval. When nothing is due for a while, warehouse
+maintenance runs under the same lock.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = os.getenv('ETL_LOCK_FILE', 'etl_pipeline.lock')
+
+# Seconds between runs of each dataset, overridden by ETL_SCHEDULE
+DEFAULT_SCHEDULE = {
+    'weather': 15 * 60,
+    'news': 30 * 60,
+    'students': 60 * 60,
+    'scores': 60 * 60
+}
+
+# Maintenance runs when no dataset is due for IDLE_SECONDS, at most every MAINTENANCE_INTERVAL
+IDLE_SECONDS = 120
+MAINTENANCE_INTERVAL = 6 * 60 * 60
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+def parse_duration(text):
+    """Seconds in a duration such as '90', '90s', '15m', '1h' or '1d'"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', text)
+    if not match:
+        raise ValueError(f"Invalid duration '{text}'")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or 's']
+
+def parse_schedule(text):
+    """Parse 'weather=15m,news=30m' into {dataset: seconds}"""
+    schedule = {}
+    for entry in filter(None, (part.strip() for part in text.split(','))):
+        name, _, duration = entry.partition('=')
+        if not duration:
+            raise ValueError(f"Invalid schedule entry '{entry}', expected dataset=interval")
+        seconds = parse_duration(duration)
+        if seconds <= 0:
+            raise ValueError(f"Schedule interval for '{name.strip()}' must be positive")
+        schedule[name.strip()] = seconds
+    return schedule
+
+class RunLock:
+    """Exclusive, non-blocking lock on a file shared by every process that runs the pipeline"""
+    
+    def __init__(self, path=LOCK_FILE):
+        self.path = path
+        self.fd = None
+    
+    def acquire(self):
+        """Take the lock; returns False when another run holds it"""
+        if fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+        else:
+            # Without flock the file's existence is the lock; a crashed run leaves it behind
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                return False
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+    
+    def release(self):
+        if self.fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+        else:
+            os.close(self.fd)
+            os.remove(self.path)
+        self.fd = None
+    
+    def __enter__(self):
+        if not self.acquire():
+            raise RuntimeError(f"Another ETL run holds {self.path}")
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+
+class PipelineScheduler:
+    """Run datasets on their own intervals with warm resources and no overlapping runs"""
+    
+    def __init__(self, schedule=None, lock_path=LOCK_FILE, warehouse=None, sources=None,
+                 run_pipeline=None, idle_seconds=IDLE_SECONDS, maintenance_interval=MAINTENANCE_INTERVAL,
+                 clock=time.monotonic):
+        from etl_pipeline import run_etl_pipeline
+        
+        self.schedule = schedule or parse_schedule(os.getenv('ETL_SCHEDULE', '')) or dict(DEFAULT_SCHEDULE)
+        self.lock = RunLock(lock_path)
+        self.warehouse = warehouse
+        self.sources = sources
+        self.session = None
+        self.run_pipeline = run_pipeline or run_etl_pipeline
+        self.idle_seconds = idle_seconds
+        self.maintenance_interval = maintenance_interval
+        self.clock = clock
+        
+        now = clock()
+        self.next_due = {name: now for name in self.schedule}
+        self.pending = set()
+        self.current = None
+        self.locked_out = False
+        self.last_maintenance = now
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scheduled-run')
+    
+    def open_resources(self):
+        """Create the warehouse, HTTP session and database engine kept between runs"""
+        from warehouse.warehouse_manager import create_warehouse
+        from etl_pipeline import build_sources
+        
+        if self.warehouse is None:
+            self.warehouse = create_warehouse()
+        if self.sources is None:
+            import requests
+            from extract.mysql_extractor import create_mysql_engine
+            self.session = requests.Session()
+            try:
+                mysql_engine = create_mysql_engine()
+            except Exception as e:
+                logger.warning(f"MySQL engine unavailable, each run will try its own: {e}")
+                mysql_engine = None
+            self.sources = build_sources(self.session, mysql_engine)
+        
+        unknown = set(self.schedule) - set(self.sources)
+        if unknown:
+            raise ValueError(f"Unknown datasets in schedule: {sorted(unknown)}")
+    
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.session is not None:
+            self.session.close()
+    
+    def running(self):
+        return self.current is not None and not self.current.done()
+    
+    def tick(self):
+        """Queue due datasets and start a run, or maintenance when idle; returns the started run's future"""
+        now = self.clock()
+        due = {name for name, at in self.next_due.items() if at <= now}
+        for name in due:
+            # Missed intervals are not caught up one by one; the next run covers them
+            self.next_due[name] = now + self.schedule[name]
+        
+        if self.running():
+            if due - self.pending:
+                logger.info(f"Run still in progress; coalescing {sorted(due - self.pending)} into the next run")
+                metrics.SCHEDULED_RUNS.inc(outcome='coalesced')
+            self.pending |= due
+            return None
+        self.pending |= due
+        
+        if self.pending:
+            if not self.lock.acquire():
+                if not self.locked_out:
+                    logger.info(f"Another ETL run holds {self.lock.path}; retrying {sorted(self.pending)} later")
+                    metrics.SCHEDULED_RUNS.inc(outcome='locked')
+                self.locked_out = True
+                return None
+            self.locked_out = False
+            datasets = sorted(self.pending)
+            self.pending = set()
+            metrics.SCHEDULED_RUNS.inc(outcome='started')
+            self.current = self.executor.submit(self.run_datasets, datasets)
+            return self.current
+        
+        if (min(self.next_due.values()) - now >= self.idle_seconds
+                and now - self.last_maintenance >= self.maintenance_interval):
+            self.maintain(now)
+        return None
+    
+    def run_datasets(self, datasets):
+        """Run the pipeline for some datasets; the caller has taken the run lock"""
+        logger.info(f"Scheduled run: {datasets}")
+        try:
+            return self.run_pipeline(warehouse=self.warehouse,
+                                     sources={name: self.sources[name] for name in datasets})
+        except Exception as e:
+            logger.error(f"Scheduled run of {datasets} failed: {e}")
+            return None
+        finally:
+            self.lock.release()
+    
+    def maintain(self, now):
+        """Archive expired rows and reclaim space while the pipeline is idle"""
+        if not hasattr(self.warehouse, 'run_maintenance'):
+            self.last_maintenance = now
+            return
+        if not self.lock.acquire():
+            return
+        self.last_maintenance = now
+        try:
+            result = self.warehouse.run_maintenance()
+            logger.info(f"Idle maintenance: {result}")
+        except Exception as e:
+            logger.error(f"Idle maintenance failed: {e}")
+        finally:
+            self.lock.release()
+    
+    def run_forever(self, poll_seconds=1.0):
+        """Tick until stop() is called or the process is interrupted"""
+        self.open_resources()
+        logger.info(f"Scheduler started: {self.schedule}")
+        try:
+            while not self.stopped.is_set():
+                self.tick()
+                wait = min(self.next_due.values()) - self.clock()
+                self.stopped.wait(max(0.0, min(wait, poll_seconds)))
+        except KeyboardInterrupt:
+            logger.info("Scheduler interrupted")
+        finally:
+            self.close()
+    
+    def stop(self):
+        self.stopped.set()
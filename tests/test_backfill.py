@@ -0,0 +1,113 @@
+"""
+Tests for the historic data backfill
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+class TestBackfill(unittest.TestCase):
+    """Test cases for partitioned, resumable backfills"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.previous_cwd = os.getcwd()
+        self.previous_db_path = os.environ.get('WAREHOUSE_DB_PATH')
+        # Workers create their own warehouse and checkpoints, so both go to the temp dir
+        os.chdir(self.temp_dir)
+        os.environ['WAREHOUSE_DB_PATH'] = os.path.join(self.temp_dir, 'warehouse.db')
+        
+        for day in (1, 2, 3):
+            partition_dir = os.path.join('history', f'2024-05-0{day}')
+            os.makedirs(partition_dir)
+            pd.DataFrame({'student_id': [1, 2], 'name': ['Amina', 'Brian'], 'Score': [80 + day, 70]}).to_csv(
+                os.path.join(partition_dir, 'scores.csv'), index=False)
+    
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        if self.previous_db_path is None:
+            os.environ.pop('WAREHOUSE_DB_PATH', None)
+        else:
+            os.environ['WAREHOUSE_DB_PATH'] = self.previous_db_path
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_partitions_run_once_under_their_own_run_id(self):
+        """Test that each day loads under its own run_id and a rerun only loads the missing days"""
+        from backfill import run_backfill, partition_dates
+        from warehouse.warehouse_manager import create_warehouse
+        
+        self.assertEqual(partition_dates('2024-05-01', '2024-05-03'), ['2024-05-01', '2024-05-02', '2024-05-03'])
+        with self.assertRaises(ValueError):
+            partition_dates('2024-05-03', '2024-05-01')
+        
+        warehouse = create_warehouse()
+        first = run_backfill('2024-05-01', '2024-05-02', workers=2, history_dir='history',
+                             output_dir='backfill', warehouse=warehouse)
+        self.assertEqual({result['status'] for result in first.values()}, {'SUCCESS'})
+        self.assertEqual(first['2024-05-01']['run_id'], 'backfill-2024-05-01')
+        
+        # A day without files is not a partition; finished days are skipped
+        second = run_backfill('2024-05-01', '2024-05-04', workers=2, history_dir='history',
+                              output_dir='backfill', warehouse=warehouse)
+        self.assertEqual({date: result['status'] for date, result in second.items()},
+                         {'2024-05-01': 'SKIPPED', '2024-05-02': 'SKIPPED', '2024-05-03': 'SUCCESS'})
+        
+        self.assertEqual(warehouse.get_warehouse_summary()['scores'], 6)
+        self.assertTrue(os.path.exists(os.path.join('backfill', '2024-05-03', 'scores.json')))
+    
+    def test_partition_loaded_again_replaces_its_rows(self):
+        """Test that a day stored but not checkpointed is replaced on the rerun, filed under its own date"""
+        from backfill import run_backfill
+        from warehouse.warehouse_manager import create_warehouse
+        
+        warehouse = create_warehouse()
+        # A crash after the warehouse load committed but before its checkpoint was saved
+        warehouse.store_data('scores', pd.read_csv(os.path.join('history', '2024-05-01', 'scores.csv')),
+                             'backfill-2024-05-01')
+        results = run_backfill('2024-05-01', '2024-05-01', workers=1, history_dir='history',
+                               output_dir='backfill', warehouse=warehouse)
+        self.assertEqual(results['2024-05-01']['status'], 'SUCCESS')
+        
+        rows = warehouse.query('scores')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(set(rows['run_id']), {'backfill-2024-05-01'})
+        self.assertEqual(set(rows['loaded_at']), {'2024-05-01 00:00:00'})
+        self.assertEqual(warehouse.run_analytics()['scores']['total_records'], 2)
+        
+        # The backfill's loads stay out of the feed without turning it off for the caller
+        self.assertEqual(warehouse.change_feed.last_sequence('scores'), 1)
+        warehouse.store_data('scores', rows, 'run1')
+        self.assertEqual(warehouse.change_feed.last_sequence('scores'), 2)
+    
+    def test_files_of_unknown_datasets_are_skipped(self):
+        """Test that a history file with no matching dataset is logged and skipped instead of failing its day"""
+        from backfill import run_backfill
+        from warehouse.warehouse_manager import create_warehouse
+        
+        pd.DataFrame({'value': [1]}).to_csv(os.path.join('history', '2024-05-01', 'foo.csv'), index=False)
+        os.makedirs(os.path.join('history', '2024-05-04'))
+        pd.DataFrame({'value': [1]}).to_csv(os.path.join('history', '2024-05-04', 'foo.csv'), index=False)
+        
+        warehouse = create_warehouse()
+        with self.assertLogs('backfill', 'WARNING') as logs:
+            results = run_backfill('2024-05-01', '2024-05-04', workers=1, history_dir='history',
+                                   output_dir='backfill', warehouse=warehouse)
+        self.assertEqual(results['2024-05-01']['status'], 'SUCCESS')
+        # A day with only unknown files is not a partition
+        self.assertNotIn('2024-05-04', results)
+        self.assertTrue(any('foo.csv' in line for line in logs.output))
+        self.assertEqual(warehouse.get_warehouse_summary()['scores'], 6)
+    
+    def test_backfill_waits_for_the_run_lock(self):
+        """Test that cli.py backfill fails while another run holds the lock and runs once it is free"""
+        import cli
+        from scheduler import RunLock
+        
+        with RunLock():
+            self.assertEqual(cli.run_backfill('2024-05-01', '2024-05-01', workers=1), 1)
+        self.assertEqual(cli.run_backfill('2024-05-01', '2024-05-01', workers=1), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Tests for pipeline stage checkpoints
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+class TestCheckpointStore(unittest.TestCase):
+    """Test cases for checkpointing and resuming runs"""
+    
+    def setUp(self):
+        from warehouse.warehouse_manager import WarehouseManager
+        self.temp_dir = tempfile.mkdtemp()
+        self.warehouse = WarehouseManager(os.path.join(self.temp_dir, 'test_warehouse.db'))
+        self.checkpoint_dir = os.path.join(self.temp_dir, 'checkpoints')
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_resume_loads_completed_stages(self):
+        """Test that a failed run's checkpoints and state survive for a resumed run"""
+        from checkpoints import CheckpointStore
+        
+        weather = pd.DataFrame({'city': ['Nairobi', 'Kisumu'], 'temperature': [22.5, 26.0]})
+        news = pd.DataFrame({'headline': ['Markets rally', 'Rains expected'], 'word_count': [2, 'two']})
+        
+        store = CheckpointStore(self.warehouse, 'run1', '2024-05-01 10:00:00', self.checkpoint_dir)
+        store.save('weather', 'extract', weather)
+        store.save('news', 'extract', news)
+        store.save('weather', 'warehouse', records=2)
+        self.warehouse.log_pipeline_run('run1', '2024-05-01 10:00:00', '2024-05-01 10:01:00', 'FAILED', 0, 'boom')
+        
+        resumed = CheckpointStore.resume(self.warehouse, 'run1', self.checkpoint_dir)
+        self.assertEqual(resumed.start_time, '2024-05-01 10:00:00')
+        self.assertTrue(resumed.completed('weather', 'extract'))
+        self.assertFalse(resumed.completed('weather', 'transform'))
+        pd.testing.assert_frame_equal(resumed.load('weather', 'extract'), weather)
+        # Columns Arrow cannot hold exactly are checkpointed with pickle instead
+        pd.testing.assert_frame_equal(resumed.load('news', 'extract'), news)
+        self.assertEqual(resumed.info('weather', 'warehouse'), {'records': 2})
+        
+        # The run keeps a single pipeline_runs row from start to finish
+        self.warehouse.log_pipeline_run('run1', '2024-05-01 10:00:00', '2024-05-01 10:05:00', 'SUCCESS', 3)
+        runs = self.warehouse.query('pipeline_runs', aggregates={'runs': ('count', '*')})
+        self.assertEqual(runs['runs'][0], 1)
+        self.assertEqual(self.warehouse.get_checkpoint_state('run1')['status'], 'SUCCESS')
+        with self.assertRaises(ValueError):
+            CheckpointStore.resume(self.warehouse, 'run1', self.checkpoint_dir)
+        with self.assertRaises(ValueError):
+            CheckpointStore.resume(self.warehouse, 'unknown', self.checkpoint_dir)
+
+if __name__ == '__main__':
+    unittest.main()
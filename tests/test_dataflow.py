@@ -0,0 +1,131 @@
+"""
+Tests for the dataflow scheduler
+"""
+
+import threading
+import time
+import unittest
+
+class TestDataflowScheduler(unittest.TestCase):
+    """Test cases for per-dataset stage chains"""
+    
+    def test_chains_do_not_wait_for_each_other(self):
+        """Test that a fast chain finishes while a slow one is still extracting"""
+        from dataflow import DataflowScheduler
+        
+        slow_release = threading.Event()
+        fast_done = threading.Event()
+        
+        def slow_extract():
+            slow_release.wait(5)
+            return 1
+        
+        def fast_load(value):
+            fast_done.set()
+            return value
+        
+        chains = {
+            'slow': [('extract', slow_extract), ('load', lambda value: value + 1)],
+            'fast': [('extract', lambda: 10), ('load', fast_load)]
+        }
+        outcomes = {}
+        runner = threading.Thread(target=lambda: outcomes.update(DataflowScheduler().run(chains)))
+        runner.start()
+        self.assertTrue(fast_done.wait(5))
+        slow_release.set()
+        runner.join()
+        
+        self.assertEqual(outcomes['slow']['results'], {'extract': 1, 'load': 2})
+        self.assertEqual(outcomes['fast']['results'], {'extract': 10, 'load': 10})
+    
+    def test_stage_limits_failures_and_early_stop(self):
+        """Test that stage limits cap concurrency, errors are captured and None ends a chain"""
+        from dataflow import DataflowScheduler
+        
+        active = []
+        peak = []
+        lock = threading.Lock()
+        
+        def limited(value):
+            with lock:
+                active.append(value)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(value)
+            return value
+        
+        def fail(value):
+            raise ValueError('bad data')
+        
+        chains = {name: [('extract', lambda name=name: name), ('transform', limited)] for name in 'abcd'}
+        chains['broken'] = [('extract', lambda: 'x'), ('transform', fail), ('file', limited)]
+        chains['empty'] = [('extract', lambda: None), ('transform', limited)]
+        
+        outcomes = DataflowScheduler({'transform': 2}).run(chains)
+        
+        self.assertLessEqual(max(peak), 2)
+        self.assertEqual(outcomes['a']['results']['transform'], 'a')
+        self.assertEqual(outcomes['broken']['failed_stage'], 'transform')
+        self.assertIsInstance(outcomes['broken']['error'], ValueError)
+        self.assertNotIn('file', outcomes['broken']['results'])
+        self.assertEqual(outcomes['empty']['results'], {'extract': None})
+    
+    def test_stage_metrics(self):
+        """Test that every stage run is measured, with rows taken from DataFrame results"""
+        import pandas as pd
+        from dataflow import DataflowScheduler
+        
+        frame = pd.DataFrame({'value': range(1000)})
+        outcomes = DataflowScheduler().run({'numbers': [('extract', lambda: frame), ('transform', lambda df: df * 2)]})
+        
+        metrics = outcomes['numbers']['metrics']
+        self.assertEqual(set(metrics), {'extract', 'transform'})
+        self.assertEqual(metrics['transform']['rows'], 1000)
+        self.assertGreater(metrics['transform']['output_mb'], 0)
+        self.assertGreaterEqual(metrics['transform']['cpu_seconds'], 0)
+        self.assertGreater(metrics['transform']['wall_seconds'], 0)
+    
+    def test_stage_metrics_measure_memory_per_stage(self):
+        """Test that a stage's RSS delta reflects what it allocated, not the process's high-water mark"""
+        import numpy as np
+        import pandas as pd
+        from dataflow import DataflowScheduler, current_rss_mb
+        
+        if current_rss_mb() is None:
+            self.skipTest('resident memory is not readable on this platform')
+        big = np.ones(64 * 1024 * 1024 // 8)
+        big[:] = 2.0
+        del big
+        outcomes = DataflowScheduler().run({'numbers': [
+            ('extract', lambda: pd.DataFrame({'value': np.ones(32 * 1024 * 1024 // 8)})),
+            ('validate', len)
+        ]})
+        
+        metrics = outcomes['numbers']['metrics']
+        self.assertGreater(metrics['extract']['rss_delta_mb'], 16)
+        self.assertLess(metrics['validate']['rss_delta_mb'], 16)
+    
+    def test_stage_peak_memory_includes_memory_freed_within_the_stage(self):
+        """Test that a stage's peak memory counts an allocation it freed again before returning"""
+        import numpy as np
+        import pandas as pd
+        from dataflow import DataflowScheduler, current_rss_mb
+        
+        if current_rss_mb() is None:
+            self.skipTest('resident memory is not readable on this platform')
+        
+        def extract():
+            scratch = np.ones(64 * 1024 * 1024 // 8)
+            time.sleep(0.05)
+            del scratch
+            return pd.DataFrame({'value': [1, 2, 3]})
+        
+        outcomes = DataflowScheduler().run({'numbers': [('extract', extract)]})
+        
+        metrics = outcomes['numbers']['metrics']['extract']
+        self.assertLess(metrics['rss_delta_mb'], 16)
+        self.assertGreater(metrics['peak_mb'], current_rss_mb() + 48)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,6 +39,28 @@ class TestExtractors(unittest.TestCase):
             
         self.assertIsInstance(result, pd.DataFrame)
         self.assertGreater(len(result), 0)
+    
+    def test_mysql_extractor_limit(self):
+        """Test that a sampled MySQL extraction pushes its LIMIT into the query"""
+        from sqlalchemy import create_engine
+        from extract.mysql_extractor import extract_from_mysql
+        
+        engine = create_engine('sqlite://')
+        pd.DataFrame({'student_id': range(50), 'name': 'Student'}).to_sql('Students', engine, index=False)
+        
+        self.assertEqual(len(extract_from_mysql(engine)), 50)
+        self.assertEqual(extract_from_mysql(engine, limit=5)['student_id'].tolist(), [0, 1, 2, 3, 4])
+    
+    def test_reservoir_sample_is_deterministic(self):
+        """Test that reservoir sampling keeps k items in stream order, the same ones every run"""
+        from extract.sampling import reservoir_sample
+        
+        first = reservoir_sample(iter(range(10000)), 10)
+        self.assertEqual(len(first), 10)
+        self.assertEqual(first, sorted(first))
+        self.assertEqual(first, reservoir_sample(iter(range(10000)), 10))
+        self.assertNotEqual(first, list(range(10)))
+        self.assertEqual(reservoir_sample(range(3), 10), [0, 1, 2])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,192 @@
+"""
+Tests for the file loader
+"""
+
+import gzip
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+class TestDataLoader(unittest.TestCase):
+    """Test cases for load_data output formats"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = {
+            'weather': pd.DataFrame({
+                'city': ['Nairobi', 'Mombasa', 'Kisumu'],
+                'temperature': [22.5, 30.1, 26.0],
+                'humidity': [60, 75, 68]
+            }),
+            'news': pd.DataFrame({
+                'headline': ['Markets rally', 'Rains expected'],
+                'word_count': [2, 2]
+            })
+        }
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_json_output_and_summary(self):
+        """Test that json output keeps one file per dataset and leaves no temp files"""
+        from load.data_loader import load_data
+        
+        paths = load_data(self.data, 'json', output_dir=self.temp_dir)
+        
+        self.assertEqual(paths['weather'], os.path.join(self.temp_dir, 'weather.json'))
+        self.assertEqual(len(pd.read_json(paths['weather'])), 3)
+        with open(os.path.join(self.temp_dir, 'summary.json')) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['record_counts'], {'weather': 3, 'news': 2})
+        self.assertFalse([name for name in os.listdir(self.temp_dir) if name.endswith('.tmp')])
+    
+    def test_unchanged_datasets_are_not_rewritten(self):
+        """Test that the manifest skips outputs whose content has not changed"""
+        from load.data_loader import load_data
+        
+        self.data['weather']['processed_at'] = '2024-05-01 10:00:00'
+        paths = load_data(self.data, 'csv', output_dir=self.temp_dir)
+        for path in list(paths.values()) + [os.path.join(self.temp_dir, 'summary.json')]:
+            os.utime(path, (0, 0))
+        
+        # Only the processing timestamp differs, which does not count as a change
+        self.data['weather']['processed_at'] = '2024-05-02 10:00:00'
+        load_data(self.data, 'csv', output_dir=self.temp_dir)
+        self.assertEqual(os.path.getmtime(paths['weather']), 0)
+        self.assertEqual(os.path.getmtime(os.path.join(self.temp_dir, 'summary.json')), 0)
+        
+        self.data['news'].loc[0, 'headline'] = 'Markets slide'
+        load_data(self.data, 'csv', output_dir=self.temp_dir)
+        self.assertEqual(os.path.getmtime(paths['weather']), 0)
+        self.assertNotEqual(os.path.getmtime(paths['news']), 0)
+        self.assertEqual(pd.read_csv(paths['news'])['headline'][0], 'Markets slide')
+    
+    def test_subset_runs_keep_the_other_datasets_in_the_summary(self):
+        """Test that runs over different subsets of the datasets each add to summary.json"""
+        from load.data_loader import load_data
+        
+        load_data({'weather': self.data['weather']}, 'json', output_dir=self.temp_dir)
+        load_data({'news': self.data['news']}, 'json', output_dir=self.temp_dir)
+        
+        with open(os.path.join(self.temp_dir, 'summary.json')) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['datasets'], ['weather', 'news'])
+        self.assertEqual(summary['record_counts'], {'weather': 3, 'news': 2})
+        self.assertEqual(set(summary['output_paths']), {'weather', 'news'})
+    
+    def test_change_feed_records_inserts_updates_and_deletes(self):
+        """Test that each run appends only the changed rows under the next sequence number"""
+        from load.data_loader import load_data
+        from load.change_feed import ChangeFeed
+        
+        load_data(self.data, 'csv', output_dir=self.temp_dir, run_id='run1')
+        weather = pd.DataFrame({
+            'city': ['Nairobi', 'Mombasa', 'Eldoret'],
+            'temperature': [22.5, 31.0, 19.0],
+            'humidity': [60, 75, 80]
+        })
+        load_data({'weather': weather, 'news': self.data['news']}, 'csv', output_dir=self.temp_dir, run_id='run2')
+        
+        feed = ChangeFeed(os.path.join(self.temp_dir, 'changes'))
+        self.assertEqual(feed.last_sequence('weather'), 2)
+        self.assertEqual(feed.last_sequence('news'), 1)
+        
+        changes = feed.read_changes('weather', after_sequence=1)
+        ops = dict(zip(changes['city'], changes['_op']))
+        self.assertEqual(ops, {'Eldoret': 'insert', 'Mombasa': 'update', 'Kisumu': 'delete'})
+        self.assertEqual(set(changes['_seq']), {2})
+        self.assertEqual(set(changes['_run_id']), {'run2'})
+    
+    def test_change_feed_keeps_rows_sharing_a_key(self):
+        """Test that several rows with the same key are all published and diffed by occurrence"""
+        from load.change_feed import ChangeFeed
+        
+        feed = ChangeFeed(os.path.join(self.temp_dir, 'changes'))
+        readings = pd.DataFrame({'city': ['Nairobi', 'Nairobi', 'Mombasa'], 'temperature': [20.0, 21.0, 30.0]})
+        feed.publish('weather', readings, 'run1')
+        self.assertEqual(len(feed.read_changes('weather')), 3)
+        
+        readings.loc[1, 'temperature'] = 22.0
+        feed.publish('weather', readings.head(2), 'run2')
+        changes = feed.read_changes('weather', after_sequence=1)
+        self.assertEqual(sorted(zip(changes['_op'], changes['city'])), [('delete', 'Mombasa'), ('update', 'Nairobi')])
+        self.assertEqual(changes.loc[changes['_op'] == 'update', 'temperature'].tolist(), [22.0])
+    
+    def test_ndjson_streams_in_chunks_with_nulls_and_gzip(self):
+        """Test that the streaming JSON writer spans chunks, writes NaN/inf as null and gzips"""
+        from load.data_loader import write_dataset, write_json_records
+        
+        df = pd.DataFrame({'reading': [1.5, float('nan'), float('inf'), -float('inf'), 2.0]})
+        path = write_dataset('readings', df, 'ndjson', self.temp_dir, compression='gzip')
+        
+        self.assertTrue(path.endswith('readings.ndjson.gz'))
+        with gzip.open(path, 'rt') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record['reading'] for record in records], [1.5, None, None, None, 2.0])
+        
+        array_path = os.path.join(self.temp_dir, 'readings.json')
+        write_json_records(df, array_path, lines=False, chunk_rows=2)
+        with open(array_path) as f:
+            self.assertEqual(len(json.load(f)), 5)
+    
+    def test_json_writes_missing_dates_and_objects_as_null(self):
+        """Test that NaT in datetime columns and None/NaN in object columns are null in every chunk"""
+        from load.data_loader import write_json_records
+        
+        df = pd.DataFrame({
+            'scraped_at': pd.to_datetime(['2024-05-01 10:00:00', None, '2024-05-02 08:30:00']),
+            'source': ['Hacker News', None, float('nan')]
+        })
+        expected = [
+            {'scraped_at': '2024-05-01T10:00:00.000', 'source': 'Hacker News'},
+            {'scraped_at': None, 'source': None},
+            {'scraped_at': '2024-05-02T08:30:00.000', 'source': None}
+        ]
+        
+        lines_path = os.path.join(self.temp_dir, 'news.ndjson')
+        write_json_records(df, lines_path, chunk_rows=1)
+        with open(lines_path) as f:
+            self.assertEqual([json.loads(line) for line in f], expected)
+        
+        array_path = os.path.join(self.temp_dir, 'news.json')
+        write_json_records(df, array_path, lines=False, chunk_rows=2)
+        with open(array_path) as f:
+            self.assertEqual(json.load(f), expected)
+    
+    def test_xlsx_streams_and_splits_sheets(self):
+        """Test that workbooks are written in parallel and continue on a new sheet at the row limit"""
+        from load.data_loader import load_data, write_xlsx
+        
+        paths = load_data(self.data, 'xlsx', output_dir=self.temp_dir, max_workers=2)
+        pd.testing.assert_frame_equal(pd.read_excel(paths['weather']), self.data['weather'])
+        
+        path = os.path.join(self.temp_dir, 'split.xlsx')
+        write_xlsx(self.data['weather'], path, max_rows=2)
+        sheets = pd.read_excel(path, sheet_name=None)
+        self.assertEqual(list(sheets), ['Sheet1', 'Sheet2'])
+        self.assertEqual(list(sheets['Sheet2']['city']), ['Kisumu'])
+    
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_partitioned_parquet_and_arrow_outputs(self):
+        """Test that columnar outputs are partitioned by run date and split into parts"""
+        from load.data_loader import load_data, write_dataset
+        
+        paths = load_data(self.data, 'parquet', output_dir=self.temp_dir, run_date='2024-05-01')
+        partition = os.path.join(self.temp_dir, 'weather', 'run_date=2024-05-01')
+        self.assertEqual(paths['weather'], partition)
+        self.assertEqual(os.listdir(partition), ['part-00000.parquet'])
+        pd.testing.assert_frame_equal(pd.read_parquet(partition), self.data['weather'])
+        
+        # Datasets larger than rows_per_part are split across part files
+        write_dataset('weather', self.data['weather'], 'arrow', self.temp_dir, '2024-05-02', rows_per_part=2)
+        partition = os.path.join(self.temp_dir, 'weather', 'run_date=2024-05-02')
+        self.assertEqual(sorted(os.listdir(partition)), ['part-00000.arrow', 'part-00001.arrow'])
+        parts = [pd.read_feather(os.path.join(partition, name)) for name in sorted(os.listdir(partition))]
+        pd.testing.assert_frame_equal(pd.concat(parts, ignore_index=True), self.data['weather'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Tests for memory-budgeted pipeline runs
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+class TestMemoryBudget(unittest.TestCase):
+    """Test cases for spilling, chunk shrinking and stage serialization under a memory budget"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.memory_mb = 10
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def budget(self):
+        from memory_budget import MemoryBudget
+        return MemoryBudget(100, spill_dir=self.temp_dir, measure=lambda: self.memory_mb)
+    
+    def test_lean_mode_trips_at_high_water_and_stays_on(self):
+        """Test that chunks shrink once memory reaches the high-water mark, even after it drops again"""
+        budget = self.budget()
+        self.assertFalse(budget.under_pressure())
+        self.assertEqual(budget.chunk_rows(10000), 10000)
+        
+        self.memory_mb = 85
+        self.assertTrue(budget.under_pressure())
+        self.memory_mb = 10
+        self.assertTrue(budget.under_pressure())
+        self.assertEqual(budget.chunk_rows(10000), 2500)
+        self.assertEqual(budget.chunk_rows(2000), 1000)
+        self.assertEqual(budget.stats['peak_mb'], 85)
+    
+    def test_spilled_frames_round_trip(self):
+        """Test that spilled frames read back equal and their files are removed on stop"""
+        budget = self.budget().start()
+        df = pd.DataFrame({'student_id': [1, 2, 3], 'name': ['Amina', 'Brian', 'Chen'], 'Score': [80.5, 70.0, 91.0]})
+        mixed = pd.DataFrame({'value': [1, 'two', 3.0]})
+        
+        spilled = budget.spill(df, 'students')
+        self.assertTrue(spilled.path.endswith('.arrow'))
+        self.assertEqual(spilled.rows, 3)
+        pd.testing.assert_frame_equal(budget.restore(spilled), df)
+        pd.testing.assert_frame_equal(budget.restore(budget.spill(mixed, 'mixed')), mixed)
+        self.assertEqual(budget.restore('not spilled'), 'not spilled')
+        self.assertEqual(budget.stats['spills'], 2)
+        
+        spill_dir = budget.spill_dir
+        budget.stop()
+        self.assertFalse(os.path.exists(spill_dir))
+    
+    def test_scheduler_spills_and_serializes_under_pressure(self):
+        """Test that chains spill frames between stages, serialize stages and keep only retained results"""
+        from dataflow import DataflowScheduler
+        
+        self.memory_mb = 90
+        budget = self.budget()
+        stages = [
+            ('extract', lambda: pd.DataFrame({'Score': [50, 60, 70]})),
+            ('transform', lambda df: df.assign(Score=df['Score'] + 10)),
+            ('validate', len)
+        ]
+        outcomes = DataflowScheduler({'transform': 2}, budget, retain={'transform'}).run(
+            {'scores': stages, 'marks': list(stages)}
+        )
+        
+        from memory_budget import SpilledFrame
+        for outcome in outcomes.values():
+            self.assertIsNone(outcome['error'])
+            self.assertEqual(set(outcome['results']), {'transform'})
+            # Retained results stay on disk until the caller reads them
+            self.assertIsInstance(outcome['results']['transform'], SpilledFrame)
+            self.assertEqual(budget.restore(outcome['results']['transform'])['Score'].tolist(), [60, 70, 80])
+            self.assertEqual(outcome['metrics']['transform']['rows'], 3)
+        self.assertEqual(budget.stats['spills'], 4)
+        self.assertEqual(budget.stats['serialized_stages'], 6)
+        budget.stop()
+    
+    def test_pipeline_reads_spilled_results_back_at_the_end(self):
+        """Test that a run under pressure returns its transformed frames, not spill handles"""
+        from etl_pipeline import run_etl_pipeline
+        from warehouse.warehouse_manager import WarehouseManager
+        
+        self.memory_mb = 90
+        scores = pd.DataFrame({'Student_ID': ['S001', 'S002'], 'Score': [90, 70], 'Subject': ['Math', 'Math']})
+        previous_cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            result = run_etl_pipeline(
+                warehouse=WarehouseManager(os.path.join(self.temp_dir, 'warehouse.db')),
+                sources={'scores': ('scores', lambda: scores)},
+                output_dir=os.path.join(self.temp_dir, 'output'), memory_budget=self.budget()
+            )
+        finally:
+            os.chdir(previous_cwd)
+        
+        self.assertGreater(result['memory']['spills'], 0)
+        self.assertIsInstance(result['transformed_data']['scores'], pd.DataFrame)
+        self.assertEqual(len(result['transformed_data']['scores']), 2)
+
+if __name__ == '__main__':
+    unittest.main()
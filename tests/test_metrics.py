@@ -0,0 +1,68 @@
+"""
+Tests for the Prometheus metrics registry
+"""
+
+import threading
+import unittest
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for per-thread metrics and the text format"""
+    
+    def test_counters_merge_thread_stores(self):
+        """Test that counts recorded on many threads, including finished ones, add up"""
+        from metrics import Counter, render
+        
+        registry = []
+        counter = Counter('test_events_total', 'Events seen', ['source'], registry=registry)
+        
+        def record():
+            for _ in range(1000):
+                counter.inc(source='api')
+        
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5, source='web')
+        
+        self.assertEqual(counter.value(source='api'), 8000)
+        # Stores of exited threads are folded into one total
+        self.assertEqual(len(counter.shards), 1)
+        self.assertEqual(counter.value(source='api'), 8000)
+        
+        text = render(registry)
+        self.assertIn('# TYPE test_events_total counter', text)
+        self.assertIn('test_events_total{source="api"} 8000', text)
+        self.assertIn('test_events_total{source="web"} 5', text)
+        with self.assertRaises(ValueError):
+            counter.inc(route='/')
+    
+    def test_histogram_and_gauges(self):
+        """Test that histogram buckets are cumulative and derived gauges are rendered"""
+        import metrics
+        
+        registry = []
+        histogram = metrics.Histogram('test_latency_seconds', 'Latency', ['route'],
+                                      buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, route='/health')
+        gauge = metrics.Gauge('test_rows', 'Rows', ['table'], registry=registry)
+        gauge.set(3, table='say "hi"')
+        
+        text = metrics.render(registry)
+        self.assertIn('test_latency_seconds_bucket{route="/health",le="0.1"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{route="/health",le="1.0"} 3', text)
+        self.assertIn('test_latency_seconds_bucket{route="/health",le="+Inf"} 4', text)
+        self.assertIn('test_latency_seconds_sum{route="/health"} 3.65', text)
+        self.assertIn('test_latency_seconds_count{route="/health"} 4', text)
+        self.assertIn('test_rows{table="say \\"hi\\""} 3', text)
+        
+        metrics.record_cache_lookup('test_cache', True)
+        metrics.record_cache_lookup('test_cache', True)
+        metrics.record_cache_lookup('test_cache', False)
+        metrics.update_cache_hit_ratios()
+        self.assertAlmostEqual(metrics.CACHE_HIT_RATIO.values[('test_cache',)], 2 / 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests for per-stage pipeline profiling
+"""
+
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+class TestStageProfiler(unittest.TestCase):
+    """Test cases for per-stage profile dumps and the summary"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_stage_profiles_stacks_and_summary(self):
+        """Test that every profiled stage gets a dump, sampled stacks and a summary section"""
+        from dataflow import DataflowScheduler
+        from profiling import StageProfiler
+        
+        def busy_extract():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+            return [bytearray(1024) for _ in range(100)]
+        
+        with StageProfiler(self.temp_dir, sample_interval_ms=1, trace_memory=True, top_n=5) as profiler:
+            stages = [('extract', busy_extract), ('transform', len)]
+            chains = {'numbers': [(stage, profiler.wrap('numbers', stage, func)) for stage, func in stages]}
+            outcomes = DataflowScheduler().run(chains)
+        
+        self.assertEqual(outcomes['numbers']['results']['transform'], 100)
+        stats = pstats.Stats(os.path.join(self.temp_dir, 'numbers.extract.prof'))
+        self.assertIn('busy_extract', {function for _, _, function in stats.stats})
+        with open(os.path.join(self.temp_dir, 'numbers.extract.collapsed')) as f:
+            stacks = f.read().splitlines()
+        self.assertTrue(stacks)
+        # Stacks start at the stage function, not in the scheduler's threads
+        self.assertTrue(all(line.startswith('busy_extract') for line in stacks))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'numbers.transform.prof')))
+        
+        with open(os.path.join(self.temp_dir, 'summary.txt')) as f:
+            summary = f.read()
+        self.assertIn('numbers / extract', summary)
+        self.assertIn('Peak traced memory', summary)
+        self.assertIn('test_profiling.py', summary)
+    
+    def test_work_on_helper_threads_is_sampled(self):
+        """Test that stacks of the writer thread a stage waits on land in the stage's collapsed file"""
+        import queue
+        import threading
+        from dataflow import DataflowScheduler
+        from profiling import StageProfiler
+        
+        requests = queue.Queue()
+        
+        def writer():
+            while True:
+                done = requests.get()
+                if done is None:
+                    return
+                deadline = time.perf_counter() + 0.1
+                while time.perf_counter() < deadline:
+                    pass
+                done.set()
+        
+        def write_rows():
+            done = threading.Event()
+            requests.put(done)
+            done.wait()
+            return 1
+        
+        thread = threading.Thread(target=writer, name='warehouse-writer-test.db', daemon=True)
+        thread.start()
+        try:
+            with StageProfiler(self.temp_dir, sample_interval_ms=1, top_n=5) as profiler:
+                DataflowScheduler().run({'numbers': [('warehouse', profiler.wrap('numbers', 'warehouse', write_rows))]})
+        finally:
+            requests.put(None)
+            thread.join()
+        
+        with open(os.path.join(self.temp_dir, 'numbers.warehouse.collapsed')) as f:
+            stacks = f.read().splitlines()
+        self.assertTrue(any(line.startswith('[warehouse-writer-test.db];') and 'writer' in line for line in stacks))
+        # Waiting for work is not sampled
+        self.assertFalse(any(line.startswith('[warehouse-writer-test.db];') and 'queue.py' in line for line in stacks))
+        with open(os.path.join(self.temp_dir, 'summary.txt')) as f:
+            summary = f.read()
+        self.assertIn('on warehouse-writer-test.db', summary)
+        self.assertIn('workbook processes are not profiled', summary)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests for the pipeline scheduler
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+class TestPipelineScheduler(unittest.TestCase):
+    """Test cases for scheduled, non-overlapping runs"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.lock_path = os.path.join(self.temp_dir, 'etl.lock')
+        self.now = 0.0
+        self.release = threading.Event()
+        self.runs = []
+    
+    def tearDown(self):
+        self.release.set()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def make_scheduler(self):
+        from scheduler import PipelineScheduler
+        
+        def run_pipeline(warehouse, sources):
+            self.runs.append(sorted(sources))
+            self.release.wait(5)
+        
+        sources = {name: (name, lambda: None) for name in ['weather', 'news', 'scores']}
+        return PipelineScheduler({'weather': 60, 'news': 300, 'scores': 300}, self.lock_path,
+                                 warehouse=object(), sources=sources, run_pipeline=run_pipeline,
+                                 clock=lambda: self.now)
+    
+    def test_due_datasets_are_coalesced_while_a_run_is_going(self):
+        """Test that datasets due during a run are merged into one follow-up run"""
+        scheduler = self.make_scheduler()
+        scheduler.open_resources()
+        
+        first = scheduler.tick()
+        self.assertIsNotNone(first)
+        # Weather comes due three times while the first run is still going
+        for self.now in (60.0, 120.0, 180.0):
+            self.assertIsNone(scheduler.tick())
+        self.assertEqual(scheduler.pending, {'weather'})
+        
+        self.release.set()
+        first.result(5)
+        self.now = 181.0
+        scheduler.tick().result(5)
+        scheduler.close()
+        
+        self.assertEqual(self.runs, [['news', 'scores', 'weather'], ['weather']])
+    
+    def test_runs_wait_for_the_lock(self):
+        """Test that no run starts while another process holds the run lock"""
+        from scheduler import RunLock
+        
+        scheduler = self.make_scheduler()
+        scheduler.open_resources()
+        self.release.set()
+        
+        with RunLock(self.lock_path):
+            self.assertIsNone(scheduler.tick())
+            with self.assertRaises(RuntimeError):
+                with RunLock(self.lock_path):
+                    pass
+        self.assertEqual(self.runs, [])
+        
+        scheduler.tick().result(5)
+        scheduler.close()
+        self.assertEqual(self.runs, [['news', 'scores', 'weather']])
+    
+    def test_profiled_runs_wait_for_the_lock(self):
+        """Test that cli.py profile does not run the pipeline while another run holds the lock"""
+        from unittest import mock
+        from scheduler import RunLock
+        import cli
+        
+        with mock.patch.object(RunLock.__init__, '__defaults__', (self.lock_path,)), \
+                mock.patch('etl_pipeline.run_etl_pipeline') as run_pipeline:
+            with RunLock():
+                self.assertIsNone(cli.run_profile(0, False, 5, os.path.join(self.temp_dir, 'profiles')))
+            run_pipeline.assert_not_called()
+            
+            self.assertIsNotNone(cli.run_profile(0, False, 5, os.path.join(self.temp_dir, 'profiles')))
+            run_pipeline.assert_called_once()
+    
+    def test_parse_schedule(self):
+        """Test that schedules accept unit suffixes and reject bad entries"""
+        from scheduler import parse_schedule
+        
+        self.assertEqual(parse_schedule('weather=15m, news=90,students=1h'),
+                         {'weather': 900, 'news': 90, 'students': 3600})
+        with self.assertRaises(ValueError):
+            parse_schedule('weather')
+        with self.assertRaises(ValueError):
+            parse_schedule('weather=soon')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,605 @@
+"""
+Tests for the warehouse manager
+"""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+class TestWarehouseManager(unittest.TestCase):
+    """Test cases for the SQLite warehouse"""
+    
+    def setUp(self):
+        from warehouse.warehouse_manager import WarehouseManager
+        
+        self.temp_dir = tempfile.mkdtemp()
+        self.warehouse = WarehouseManager(db_path=os.path.join(self.temp_dir, 'test_warehouse.db'))
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_analytics_cover_all_stored_rows(self):
+        """Test that analytics are exact over more rows than get_data returns"""
+        weather = pd.DataFrame({
+            'city': ['Nairobi', 'Mombasa'] * 100,
+            'temperature': [20.0, 30.0] * 100,
+            'humidity': [50, 70] * 100,
+            'weather_condition': ['Cloudy', 'Sunny'] * 100
+        })
+        self.warehouse.store_data('weather', weather, 'run1')
+        self.warehouse.store_data('weather', weather.head(2), 'run2')
+        
+        analytics = self.warehouse.run_analytics()['weather']
+        self.assertEqual(analytics['total_records'], 202)
+        self.assertAlmostEqual(analytics['avg_temperature'], 25.0)
+        self.assertEqual(analytics['cities'], {'Mombasa': 101, 'Nairobi': 101})
+    
+    def test_rebuild_aggregates_matches_incremental(self):
+        """Test that a full rebuild gives the same analytics as incremental updates"""
+        scores = pd.DataFrame({
+            'Student_ID': ['S001', 'S002', 'S003'],
+            'Score': [90, 70, None],
+            'Subject': ['Math', 'Math', 'English']
+        })
+        self.warehouse.store_data('scores', scores, 'run1')
+        incremental = self.warehouse.run_analytics()
+        
+        self.warehouse.rebuild_aggregates()
+        self.assertEqual(self.warehouse.run_analytics(), incremental)
+        self.assertAlmostEqual(incremental['scores']['avg_score'], 80.0)
+    
+    def test_storing_a_run_again_replaces_its_rows(self):
+        """Test that a run loaded twice keeps only its second batch, in the rows, aggregates and rollups"""
+        weather = pd.DataFrame({
+            'city': ['Nairobi', 'Mombasa', 'Kisumu'],
+            'temperature': [20.0, 30.0, 25.0],
+            'humidity': [50, 70, 60],
+            'weather_condition': ['Cloudy', 'Sunny', 'Rain']
+        })
+        self.warehouse.store_data('weather', weather.head(1), 'other')
+        self.warehouse.store_data('weather', weather, 'backfill-2024-05-01', loaded_at='2024-05-01 00:00:00')
+        self.warehouse.store_data('weather', weather.head(2), 'backfill-2024-05-01', loaded_at='2024-05-01 00:00:00')
+        
+        rows = self.warehouse.query('weather', order_by=['id'])
+        self.assertEqual(rows['run_id'].tolist(), ['other', 'backfill-2024-05-01', 'backfill-2024-05-01'])
+        self.assertEqual(rows['loaded_at'].iloc[1:].tolist(), ['2024-05-01 00:00:00'] * 2)
+        self.assertEqual(self.warehouse.get_warehouse_summary()['weather'], 3)
+        
+        incremental = self.warehouse.run_analytics()
+        self.assertEqual(incremental['weather']['cities'], {'Nairobi': 2, 'Mombasa': 1})
+        # Kisumu's reading was replaced, so its bucket is gone
+        trend = self.warehouse.get_weather_trend(resolution='day')
+        self.assertEqual(sorted(trend['city'].unique()), ['Mombasa', 'Nairobi'])
+        self.warehouse.rebuild_aggregates()
+        self.warehouse.rebuild_weather_rollups()
+        self.assertEqual(self.warehouse.run_analytics(), incremental)
+        pd.testing.assert_frame_equal(self.warehouse.get_weather_trend(resolution='day'), trend)
+    
+    def test_clear_warehouse_resets_analytics(self):
+        """Test that clearing the warehouse also clears the aggregates"""
+        news = pd.DataFrame({'headline': ['Test headline'], 'source': ['Test Source']})
+        self.warehouse.store_data('news', news, 'run1')
+        self.warehouse.clear_warehouse()
+        
+        self.assertEqual(self.warehouse.run_analytics(), {})
+    
+    def test_summary_counters_track_inserts_and_deletes(self):
+        """Test that the trigger-maintained counters match the table contents"""
+        import sqlite3
+        
+        students = pd.DataFrame({'student_id': [1, 2, 3], 'name': ['A', 'B', 'C']})
+        self.warehouse.store_data('students', students, 'run1')
+        self.warehouse.log_pipeline_run('run1', '2024-01-01 10:00:00', '2024-01-01 10:01:00', 'SUCCESS', 3)
+        self.warehouse.log_pipeline_run('run2', '2024-01-02 10:00:00', '2024-01-02 10:01:00', 'FAILED', 0)
+        with sqlite3.connect(self.warehouse.db_path) as conn:
+            conn.execute("DELETE FROM students WHERE student_id = 2")
+        
+        summary = self.warehouse.get_warehouse_summary()
+        self.assertEqual(summary['students'], 2)
+        self.assertEqual(summary['weather'], 0)
+        self.assertEqual(summary['latest_run']['run_id'], 'run2')
+        
+        self.warehouse.clear_warehouse()
+        summary = self.warehouse.get_warehouse_summary()
+        self.assertEqual(summary['students'], 0)
+        self.assertNotIn('latest_run', summary)
+    
+    def test_concurrent_loads_are_serialized(self):
+        """Test that many threads can load at once without lock errors"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        batch = pd.DataFrame({'city': ['Nairobi'] * 50, 'temperature': [20.0] * 50})
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            stored = list(executor.map(
+                lambda i: self.warehouse.store_data('weather', batch, f'run{i}'), range(40)
+            ))
+        
+        self.assertEqual(sum(stored), 2000)
+        self.assertEqual(self.warehouse.get_warehouse_summary()['weather'], 2000)
+        self.assertEqual(self.warehouse.run_analytics()['weather']['total_records'], 2000)
+    
+    def test_failed_write_does_not_affect_batch(self):
+        """Test that a failing request is rolled back on its own"""
+        def failing_write(conn):
+            conn.execute("INSERT INTO news (headline) VALUES ('never committed')")
+            raise RuntimeError("write failed")
+        
+        failed = self.warehouse.writer.submit(failing_write)
+        stored = self.warehouse.store_data_async('news', pd.DataFrame({'headline': ['Kept headline']}), 'run1')
+        
+        self.assertEqual(stored.result(), 1)
+        with self.assertRaises(RuntimeError):
+            failed.result()
+        self.assertEqual(self.warehouse.get_data('news')['headline'].tolist(), ['Kept headline'])
+    
+    def test_archive_expired_moves_old_rows(self):
+        """Test that rows past the retention window move to monthly archives"""
+        import sqlite3
+        from datetime import datetime
+        
+        weather = pd.DataFrame({'city': ['Nairobi'] * 300, 'temperature': [20.0] * 300})
+        self.warehouse.store_data('weather', weather, 'run1')
+        with sqlite3.connect(self.warehouse.db_path) as conn:
+            conn.execute("UPDATE weather SET loaded_at = '2024-01-15 08:00:00' WHERE id <= 100")
+            conn.execute("UPDATE weather SET loaded_at = '2024-02-15 08:00:00' WHERE id > 100 AND id <= 200")
+        
+        result = self.warehouse.run_maintenance(now=datetime(2024, 6, 1))
+        
+        self.assertEqual(result['archived'], {'weather': 200})
+        self.assertGreater(result['pages_released'], 0)
+        self.assertEqual(self.warehouse.get_warehouse_summary()['weather'], 100)
+        self.assertEqual(self.warehouse.run_analytics()['weather']['total_records'], 300)
+        
+        archive_path = os.path.join(self.temp_dir, 'archive', 'weather_2024_01.db')
+        with sqlite3.connect(archive_path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM weather").fetchone()[0], 100)
+    
+    def test_replacing_an_archived_run_removes_its_archived_rows(self):
+        """Test that a run stored again after its rows were archived leaves no duplicate history"""
+        import sqlite3
+        from datetime import datetime
+        
+        weather = pd.DataFrame({'city': ['Nairobi', 'Mombasa'], 'temperature': [20.0, 30.0],
+                                'pressure': [1010.0, 1012.0]})
+        self.warehouse.store_data('weather', weather, 'other', loaded_at='2024-01-10 00:00:00')
+        self.warehouse.store_data('weather', weather, 'backfill-2024-01-15', loaded_at='2024-01-15 00:00:00')
+        self.assertEqual(self.warehouse.archive_expired(now=datetime(2024, 6, 1)), {'weather': 4})
+        
+        self.warehouse.store_data('weather', weather.head(1), 'backfill-2024-01-15', loaded_at='2024-01-15 00:00:00')
+        
+        archive_path = os.path.join(self.temp_dir, 'archive', 'weather_2024_01.db')
+        with sqlite3.connect(archive_path) as conn:
+            archived = conn.execute("SELECT run_id, COUNT(*) FROM weather GROUP BY run_id").fetchall()
+        self.assertEqual(archived, [('other', 2)])
+        self.assertEqual(self.warehouse.get_warehouse_summary()['weather'], 1)
+        analytics = self.warehouse.run_analytics()['weather']
+        self.assertEqual(analytics['total_records'], 3)
+        self.assertEqual(analytics['cities'], {'Nairobi': 2, 'Mombasa': 1})
+        self.assertAlmostEqual(analytics['avg_pressure'], (1010.0 + 1012.0 + 1010.0) / 3)
+        self.assertEqual(self.warehouse.archived_run_paths('weather', 'backfill-2024-01-15'), [])
+        
+        replaced = self.warehouse.change_feed.read_changes('weather', after_sequence=2)
+        self.assertEqual(list(zip(replaced['_op'], replaced['id'])), [('delete', 3), ('delete', 4), ('insert', 5)])
+    
+    def test_payload_keeps_fields_outside_schema(self):
+        """Test that unmapped source fields stay queryable through the payload"""
+        from extract.api_extractor import create_sample_weather_data
+        
+        weather = create_sample_weather_data()
+        self.warehouse.store_data('weather', weather, 'run1')
+        
+        self.assertAlmostEqual(self.warehouse.run_analytics()['weather']['avg_pressure'], 1015.0)
+        
+        windy = self.warehouse.query('weather', columns=['city', 'wind_speed', 'payload.country'],
+                                     filters=[('wind_speed', '>=', 0)], order_by=['city'])
+        self.assertEqual(len(windy), len(weather))
+        self.assertEqual(set(windy['payload.country']), {'Kenya'})
+        
+        with self.warehouse.connect() as conn:
+            plan = conn.execute("EXPLAIN QUERY PLAN SELECT city FROM weather WHERE pressure > 1000").fetchall()
+        self.assertIn('idx_weather_pressure', str(plan))
+    
+    def test_snapshot_is_consistent_and_read_only(self):
+        """Test that snapshot readers see the data as of the snapshot"""
+        import sqlite3
+        
+        students = pd.DataFrame({'student_id': [1, 2], 'name': ['A', 'B']})
+        self.warehouse.store_data('students', students, 'run1')
+        self.warehouse.create_snapshot()
+        self.warehouse.store_data('students', students, 'run2')
+        
+        self.assertEqual(len(self.warehouse.get_data('students', snapshot=True)), 2)
+        self.assertEqual(len(self.warehouse.get_data('students')), 4)
+        
+        conn = self.warehouse.connect_snapshot()
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM students")
+        conn.close()
+    
+    def test_create_snapshot_keeps_newest(self):
+        """Test that old snapshots are pruned"""
+        for _ in range(4):
+            self.warehouse.create_snapshot(keep=2)
+        self.assertEqual(len(self.warehouse.list_snapshots()), 2)
+    
+    def test_snapshots_are_kept_per_database(self):
+        """Test that warehouses sharing a directory only list, read and prune their own snapshots"""
+        from warehouse.warehouse_manager import WarehouseManager
+        
+        other = WarehouseManager(db_path=os.path.join(self.temp_dir, 'test_warehouse_sample.db'))
+        other.store_data('students', pd.DataFrame({'student_id': [1], 'name': ['A']}), 'run1')
+        self.warehouse.create_snapshot()
+        for _ in range(3):
+            other.create_snapshot(keep=1)
+        
+        self.assertEqual(len(self.warehouse.list_snapshots()), 1)
+        self.assertEqual(len(other.list_snapshots()), 1)
+        self.assertTrue(os.path.basename(other.list_snapshots()[0]).startswith('test_warehouse_sample-'))
+        self.assertTrue(self.warehouse.get_data('students', snapshot=True).empty)
+    
+    def test_search_news_ranks_and_paginates(self):
+        """Test headline search stays in sync with inserts and deletes"""
+        news = pd.DataFrame({
+            'headline': ['Python release brings faster startup', 'Rust and Python interop',
+                         'Weather update for Nairobi', 'Searching "quoted" python headlines'],
+            'source': ['Hacker News'] * 4
+        })
+        self.warehouse.store_data('news', news, 'run1')
+        
+        first_page = self.warehouse.search_news('python', per_page=2)
+        self.assertEqual(first_page['total'], 3)
+        self.assertEqual(len(first_page['results']), 2)
+        self.assertEqual(len(self.warehouse.search_news('python', page=2, per_page=2)['results']), 1)
+        self.assertEqual(self.warehouse.search_news('nair*')['total'], 1)
+        self.assertEqual(self.warehouse.search_news('"quoted" AND (')['total'], 0)
+        
+        self.warehouse.clear_warehouse()
+        self.assertEqual(self.warehouse.search_news('python')['total'], 0)
+    
+    def test_weather_rollups_answer_trend_queries(self):
+        """Test that incremental rollups match the raw readings at each resolution"""
+        timestamps = pd.date_range('2024-03-01', periods=72, freq='h')
+        weather = pd.DataFrame({
+            'city': ['Nairobi'] * 72,
+            'temperature': [float(i % 24) for i in range(72)],
+            'humidity': [50] * 72,
+            'timestamp': timestamps.strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.warehouse.store_data('weather', weather.iloc[:40], 'run1')
+        self.warehouse.store_data('weather', weather.iloc[40:], 'run2')
+        
+        hourly = self.warehouse.get_weather_trend(city='Nairobi', resolution='hour')
+        self.assertEqual(len(hourly), 72)
+        
+        daily = self.warehouse.get_weather_trend(city='Nairobi', resolution='day')
+        self.assertEqual(daily['readings'].tolist(), [24, 24, 24])
+        self.assertEqual(daily['min_temperature'].tolist(), [0.0, 0.0, 0.0])
+        self.assertEqual(daily['max_temperature'].tolist(), [23.0, 23.0, 23.0])
+        self.assertAlmostEqual(daily['avg_temperature'].iloc[1], 11.5)
+        
+        # Six-hour buckets are re-aggregated from the hourly rollup
+        six_hourly = self.warehouse.get_weather_trend(resolution=6 * 3600)
+        self.assertEqual(len(six_hourly), 12)
+        self.assertEqual(len(self.warehouse.get_weather_trend(max_points=3)), 3)
+        
+        incremental = self.warehouse.get_weather_trend(resolution='hour')
+        self.warehouse.rebuild_weather_rollups()
+        pd.testing.assert_frame_equal(self.warehouse.get_weather_trend(resolution='hour'), incremental)
+    
+    def test_store_data_publishes_change_feed(self):
+        """Test that every committed row reaches the warehouse change feed as an insert with its id"""
+        weather = pd.DataFrame({'city': ['Nairobi', 'Nairobi', 'Mombasa'], 'temperature': [20.0, 21.0, 30.0]})
+        self.warehouse.store_data('weather', weather, 'run1')
+        self.warehouse.store_data('weather', weather.head(2), 'run2')
+        
+        changes = self.warehouse.change_feed.read_changes('weather')
+        self.assertEqual(list(changes['_op']), ['insert'] * 5)
+        self.assertEqual(list(changes['_seq']), [1, 1, 1, 2, 2])
+        self.assertEqual(list(changes['id']), list(self.warehouse.query('weather', order_by=['id'])['id']))
+        self.assertEqual(list(changes['temperature']), [20.0, 21.0, 30.0, 20.0, 21.0])
+    
+    def test_storing_a_run_again_publishes_deletes_before_inserts(self):
+        """Test that the rows a run replaces reach the change feed as deletes in the same segment"""
+        weather = pd.DataFrame({'city': ['Nairobi', 'Mombasa', 'Kisumu'], 'temperature': [20.0, 30.0, 25.0]})
+        self.warehouse.store_data('weather', weather, 'run1')
+        self.warehouse.store_data('weather', weather.head(2), 'run1')
+        
+        changes = self.warehouse.change_feed.read_changes('weather', after_sequence=1)
+        self.assertEqual(list(zip(changes['_op'], changes['id'])),
+                         [('delete', 1), ('delete', 2), ('delete', 3), ('insert', 4), ('insert', 5)])
+        self.assertEqual(set(changes['_seq']), {2})
+        self.assertEqual(set(changes['_run_id']), {'run1'})
+    
+    def test_change_feed_is_written_off_the_writer_thread(self):
+        """Test that other writes commit while a load's changes are still being published"""
+        import threading
+        
+        release = threading.Event()
+        append = self.warehouse.change_feed.append
+        self.warehouse.change_feed.append = lambda *args: (release.wait(10), append(*args))
+        
+        stored = self.warehouse.store_data_async('news', pd.DataFrame({'headline': ['Markets rally']}), 'run1')
+        self.assertEqual(self.warehouse.writer.submit(lambda conn: 'written').result(timeout=5), 'written')
+        self.assertFalse(stored.done())
+        release.set()
+        self.assertEqual(stored.result(timeout=10), 1)
+        self.assertEqual(len(self.warehouse.change_feed.read_changes('news')), 1)
+    
+    def test_stage_metrics_are_queryable(self):
+        """Test that logged stage metrics can be aggregated across runs"""
+        for run_id, seconds in (('run1', 1.5), ('run2', 2.5)):
+            self.warehouse.log_stage_metrics(run_id, [
+                {'dataset': 'weather', 'stage': 'extract', 'wall_seconds': seconds, 'cpu_seconds': 0.1, 'rows': 5},
+                {'dataset': 'weather', 'stage': 'file', 'wall_seconds': 0.2, 'cpu_seconds': 0.2, 'rows': 5}
+            ])
+        
+        trend = self.warehouse.query(
+            'pipeline_stage_metrics', group_by=['stage'],
+            aggregates={'avg_wall': ('avg', 'wall_seconds'), 'runs': ('count', '*')}, order_by=['stage']
+        )
+        self.assertEqual(list(trend['stage']), ['extract', 'file'])
+        self.assertEqual(list(trend['avg_wall']), [2.0, 0.2])
+        self.assertEqual(list(trend['runs']), [2, 2])
+    
+    def test_statements_are_timed_and_slow_ones_explained(self):
+        """Test that warehouse SQL is counted per statement shape and slow queries keep their plan"""
+        self.warehouse.query_stats.reset()
+        self.warehouse.query_stats.slow_query_ms = 0
+        try:
+            self.warehouse.query('students', filters={'student_id': 1})
+            self.warehouse.query('students', filters={'student_id': 2})
+        finally:
+            self.warehouse.query_stats.slow_query_ms = 100
+        
+        stats = [row for row in self.warehouse.get_query_stats() if row['statement'].startswith('SELECT *')]
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['count'], 2)
+        self.assertEqual(sum(stats[0]['histogram'].values()), 2)
+        
+        slow = self.warehouse.get_slow_queries()
+        self.assertTrue(any('SCAN students' in ' '.join(entry['plan']) for entry in slow))
+    
+    def test_statements_are_timed_until_their_rows_are_fetched(self):
+        """Test that a query whose cost is in fetching its rows is timed and logged as slow"""
+        import time
+        from warehouse.query_stats import QueryStats, instrumented_connect
+        
+        stats = QueryStats(slow_query_ms=30)
+        conn = instrumented_connect(':memory:', stats)
+        conn.create_function('slow', 1, lambda value: time.sleep(0.001) or value)
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(50)])
+        
+        # execute() only steps to the first row; the other 49 are computed while fetching
+        self.assertEqual(len(conn.execute("SELECT slow(x) FROM t").fetchall()), 50)
+        self.assertEqual(len(list(conn.execute("SELECT slow(x) FROM t WHERE x < 40"))), 40)
+        cursor = conn.cursor()
+        cursor.execute("SELECT slow(x) FROM t WHERE x >= 10")
+        while cursor.fetchmany(7):
+            pass
+        
+        timed = {row['statement']: row for row in stats.summary()}
+        self.assertGreaterEqual(timed['SELECT slow(x) FROM t']['max_ms'], 45)
+        self.assertGreaterEqual(timed['SELECT slow(x) FROM t WHERE x < ?']['max_ms'], 35)
+        self.assertGreaterEqual(timed['SELECT slow(x) FROM t WHERE x >= ?']['max_ms'], 35)
+        self.assertEqual(len(stats.slow_queries), 3)
+        self.assertTrue(all('SCAN t' in ' '.join(entry['plan']) for entry in stats.slow_queries))
+        conn.close()
+    
+    def test_query_pushes_aggregation_into_sqlite(self):
+        """Test grouped, filtered and ordered aggregate queries"""
+        weather = pd.DataFrame({
+            'city': ['Nairobi', 'Nairobi', 'Mombasa', 'Kisumu'],
+            'temperature': [20.0, 24.0, 30.0, 10.0],
+            'humidity': [50, 60, 70, 80]
+        })
+        self.warehouse.store_data('weather', weather, 'run1')
+        
+        result = self.warehouse.query(
+            'weather',
+            group_by=['city'],
+            aggregates={'avg_temp': ('avg', 'temperature'), 'readings': ('count', '*')},
+            filters=[('temperature', '>', 15)],
+            order_by=['-avg_temp']
+        )
+        self.assertEqual(list(result['city']), ['Mombasa', 'Nairobi'])
+        self.assertEqual(list(result['avg_temp']), [30.0, 22.0])
+        self.assertEqual(list(result['readings']), [1, 2])
+    
+    def test_query_pages_need_a_limit(self):
+        """Test that limit and offset page through rows and an offset without a limit is rejected"""
+        from warehouse.query_builder import QueryError
+        
+        self.warehouse.store_data('weather', pd.DataFrame({'city': ['Nairobi', 'Mombasa', 'Kisumu']}), 'run1')
+        page = self.warehouse.query('weather', columns=['city'], order_by=['id'], limit=2, offset=1)
+        self.assertEqual(list(page['city']), ['Mombasa', 'Kisumu'])
+        with self.assertRaises(QueryError):
+            self.warehouse.query('weather', order_by=['id'], offset=1)
+    
+    def test_query_rejects_unknown_names(self):
+        """Test that table and column names cannot be injected"""
+        from warehouse.query_builder import QueryError
+        
+        with self.assertRaises(QueryError):
+            self.warehouse.query('students; DROP TABLE students')
+        with self.assertRaises(QueryError):
+            self.warehouse.query('students', columns=['name FROM students --'])
+        self.assertTrue(self.warehouse.get_data('students WHERE 1=1').empty)
+
+class FailingConnection:
+    """Writer connection whose given statements fail, as they would on a full or failing disk"""
+    
+    def __init__(self, conn, failing):
+        self.conn = conn
+        self.failing = failing
+    
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+    
+    def execute(self, sql, *args):
+        if sql in self.failing:
+            import sqlite3
+            raise sqlite3.OperationalError(f"{sql} failed")
+        return self.conn.execute(sql, *args)
+
+class TestWarehouseWriter(unittest.TestCase):
+    """Test cases for failures around the writer thread's transactions"""
+    
+    def setUp(self):
+        from warehouse.warehouse_manager import WarehouseManager
+        
+        self.temp_dir = tempfile.mkdtemp()
+        self.warehouse = WarehouseManager(db_path=os.path.join(self.temp_dir, 'test_warehouse.db'))
+        self.writer = self.warehouse.writer
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_failed_commit_and_rollback_fail_the_batch(self):
+        """Test that a batch whose COMMIT and ROLLBACK fail is failed and the writer keeps going"""
+        import sqlite3
+        
+        self.writer.submit(lambda conn: setattr(self.writer, 'conn', FailingConnection(conn, {'COMMIT', 'ROLLBACK'})),
+                           transactional=False).result()
+        lost = self.warehouse.store_data_async('news', pd.DataFrame({'headline': ['Lost headline']}), 'run1')
+        with self.assertRaises(sqlite3.OperationalError):
+            lost.result(timeout=10)
+        
+        self.assertTrue(self.writer.thread.is_alive())
+        self.assertEqual(self.warehouse.store_data('news', pd.DataFrame({'headline': ['Kept headline']}), 'run2'), 1)
+        self.assertEqual(self.warehouse.get_data('news')['headline'].tolist(), ['Kept headline'])
+    
+    def test_failed_begin_skips_cancelled_requests(self):
+        """Test that a batch that cannot begin fails its requests, including cancelled ones, without stopping the writer"""
+        import sqlite3
+        import threading
+        
+        release = threading.Event()
+        
+        def block(conn):
+            self.writer.conn = FailingConnection(conn, {'BEGIN IMMEDIATE'})
+            release.wait(10)
+        
+        blocker = self.writer.submit(block, transactional=False)
+        failed = self.writer.submit(lambda conn: conn.execute("INSERT INTO news (headline) VALUES ('first')"))
+        cancelled = self.writer.submit(lambda conn: conn.execute("INSERT INTO news (headline) VALUES ('second')"))
+        self.assertTrue(cancelled.cancel())
+        release.set()
+        blocker.result(timeout=10)
+        
+        with self.assertRaises(sqlite3.OperationalError):
+            failed.result(timeout=10)
+        self.writer.submit(lambda conn: setattr(self.writer, 'conn', conn.conn), transactional=False).result(timeout=10)
+        self.assertEqual(self.warehouse.store_data('news', pd.DataFrame({'headline': ['Kept headline']}), 'run1'), 1)
+
+class TestWarehouseBackends(unittest.TestCase):
+    """Test that the warehouse backends expose the same behaviour"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    @unittest.skipUnless(importlib.util.find_spec('duckdb'), 'duckdb is not installed')
+    def test_duckdb_matches_sqlite(self):
+        """Test that both backends return the same analytics and query results"""
+        from warehouse.warehouse_manager import create_warehouse
+        
+        weather = pd.DataFrame({
+            'city': ['Nairobi', 'Mombasa', 'Nairobi'],
+            'temperature': [20.0, 30.0, 22.0],
+            'humidity': [50, 70, 60],
+            'weather_condition': ['Cloudy', 'Sunny', 'Cloudy']
+        })
+        results = []
+        for backend in ['sqlite', 'duckdb']:
+            warehouse = create_warehouse(backend, os.path.join(self.temp_dir, f'warehouse.{backend}'))
+            warehouse.store_data('weather', weather, 'run1')
+            by_city = warehouse.query('weather', group_by=['city'],
+                                      aggregates={'readings': ('count', '*')}, order_by=['city'])
+            results.append((warehouse.run_analytics(), by_city['readings'].tolist(),
+                            warehouse.get_warehouse_summary()['weather']))
+        
+        self.assertEqual(results[0], results[1])
+    
+    @unittest.skipUnless(importlib.util.find_spec('duckdb'), 'duckdb is not installed')
+    def test_storing_a_run_again_replaces_its_rows(self):
+        """Test that both backends replace the rows a run stored before instead of adding to them"""
+        from warehouse.warehouse_manager import create_warehouse
+        
+        scores = pd.DataFrame({'Student_ID': ['S001', 'S002'], 'Score': [90, 70], 'Subject': ['Math', 'Math']})
+        for backend in ['sqlite', 'duckdb']:
+            warehouse = create_warehouse(backend, os.path.join(self.temp_dir, f'warehouse.{backend}'))
+            warehouse.store_data('scores', scores, 'run1')
+            warehouse.store_data('scores', scores, 'run2')
+            warehouse.store_data('scores', scores.head(1), 'run1', loaded_at='2024-05-01 00:00:00')
+            
+            rows = warehouse.query('scores', order_by=['run_id', 'student_id'])
+            self.assertEqual(rows['run_id'].tolist(), ['run1', 'run2', 'run2'], backend)
+            self.assertEqual(rows['loaded_at'].iloc[0], '2024-05-01 00:00:00', backend)
+            self.assertEqual(warehouse.run_analytics()['scores']['total_records'], 3, backend)
+    
+    def test_sampled_runs_leave_the_production_feed_unchanged(self):
+        """Test that a sampled run loads into its own directory and publishes no changes"""
+        from unittest import mock
+        from etl_pipeline import run_etl_pipeline
+        from warehouse.warehouse_manager import create_warehouse
+        
+        scores = pd.DataFrame({'Student_ID': ['S001', 'S002'], 'Score': [90, 70], 'Subject': ['Math', 'Math']})
+        previous_cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            with mock.patch.dict(os.environ):
+                for variable in ['WAREHOUSE_BACKEND', 'WAREHOUSE_DB_PATH', 'SAMPLE_WAREHOUSE_DB_PATH']:
+                    os.environ.pop(variable, None)
+                production = create_warehouse()
+                production.store_data('scores', scores, 'run1')
+                feed = production.change_feed.read_changes('scores')
+                
+                result = run_etl_pipeline(sources={'scores': ('scores', lambda: scores)}, sample=2)
+                sample = create_warehouse(sample=True)
+                with self.assertRaises(ValueError):
+                    run_etl_pipeline(warehouse=production, sources={'scores': ('scores', lambda: scores)}, sample=2)
+                run_etl_pipeline(warehouse=sample, sources={'scores': ('scores', lambda: scores)}, sample=2)
+            
+            self.assertEqual(result['warehouse_summary']['scores'], 2)
+            self.assertEqual(production.get_warehouse_summary()['scores'], 2)
+            pd.testing.assert_frame_equal(production.change_feed.read_changes('scores'), feed)
+            self.assertTrue(sample.change_feed.read_changes('scores').empty)
+            self.assertEqual(sample.get_warehouse_summary()['scores'], 4)
+            self.assertIsNotNone(sample.change_feed)
+            self.assertNotEqual(os.path.dirname(sample.db_path), os.path.dirname(production.db_path))
+            self.assertNotEqual(sample.archive_dir, production.archive_dir)
+            self.assertNotEqual(sample.snapshot_dir, production.snapshot_dir)
+        finally:
+            os.chdir(previous_cwd)
+    
+    @unittest.skipUnless(importlib.util.find_spec('duckdb'), 'duckdb is not installed')
+    def test_duckdb_reports_unsupported_features(self):
+        """Test that SQLite-only features raise UnsupportedOperation on DuckDB"""
+        from warehouse.warehouse_manager import create_warehouse
+        from warehouse.base_warehouse import UnsupportedOperation
+        
+        warehouse = create_warehouse('duckdb', os.path.join(self.temp_dir, 'warehouse.duckdb'))
+        with self.assertRaises(UnsupportedOperation):
+            warehouse.create_snapshot()
+        with self.assertRaises(UnsupportedOperation):
+            warehouse.search_news('python')
+        with self.assertRaises(UnsupportedOperation):
+            warehouse.get_weather_trend(city='Nairobi')
+        with self.assertRaises(UnsupportedOperation):
+            warehouse.get_query_stats()
+    
+    def test_unknown_backend(self):
+        """Test that an unknown backend name is rejected"""
+        from warehouse.warehouse_manager import create_warehouse
+        
+        with self.assertRaises(ValueError):
+            create_warehouse('oracle')
+
+if __name__ == '__main__':
+    unittest.main()
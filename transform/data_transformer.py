@@ -1,6 +1,67 @@
 import pandas as pd
 from datetime import datetime
 
+def transform_students(mysql_df):
+    """Transform MySQL student data; returns None when there is nothing to transform"""
+    if mysql_df is None or mysql_df.empty:
+        return None
+    mysql_df = mysql_df.copy()
+    # addding a processing timestamp
+    mysql_df['processed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    print(f"Transformed {len(mysql_df)} MySQL records")
+    return mysql_df
+
+def transform_weather(weather_df):
+    """Transform weather API data; returns None when there is nothing to transform"""
+    if weather_df is None or weather_df.empty:
+        return None
+    weather_df = weather_df.copy()
+    # addding a category based on temperature
+    if 'temperature' in weather_df.columns:
+        weather_df['temp_category'] = weather_df['temperature'].apply(
+            lambda x: (
+                'Unknown' if x is None or pd.isna(x)
+                else 'Hot' if x > 25
+                else 'Warm' if x > 15
+                else 'Cool' if x > 5
+                else 'Cold'
+            )
+        )
+    print(f"Transformed {len(weather_df)} weather records")
+    return weather_df
+
+def transform_news(web_df):
+    """Transform scraped web data; returns None when there is nothing to transform"""
+    if web_df is None or web_df.empty:
+        return None
+    web_df = web_df.copy()
+    # addding word count for headlines
+    if 'headline' in web_df.columns:
+        web_df['word_count'] = web_df['headline'].apply(lambda x: len(str(x).split()))
+    print(f"Transformed {len(web_df)} web records")
+    return web_df
+
+def transform_scores(excel_df):
+    """Transform Excel score data; returns None when there is nothing to transform"""
+    if excel_df is None or excel_df.empty:
+        return None
+    excel_df = excel_df.copy()
+    # addding grade category if Score column exists
+    if 'Score' in excel_df.columns:
+        excel_df['grade_category'] = excel_df['Score'].apply(
+            lambda x: 'A' if x >= 90 else 'B' if x >= 80 else 'C' if x >= 70 else 'D' if x >= 60 else 'F'
+        )
+    print(f"Transformed {len(excel_df)} Excel records")
+    return excel_df
+
+# Transform for each output dataset
+DATASET_TRANSFORMS = {
+    'students': transform_students,
+    'weather': transform_weather,
+    'news': transform_news,
+    'scores': transform_scores
+}
+
 def transform_data(mysql_df, weather_df, web_df, excel_df):
     """
     Transform all extracted data
@@ -8,51 +69,11 @@ def transform_data(mysql_df, weather_df, web_df, excel_df):
     """
     transformed_data = {}
     
-    # Transform MySQL data
-    if not mysql_df.empty:
-        mysql_df = mysql_df.copy()
-        # addding a processing timestamp
-        mysql_df['processed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        transformed_data['students'] = mysql_df
-        print(f"Transformed {len(mysql_df)} MySQL records")
-    
-    # Transform weather data
-    if not weather_df.empty:
-        weather_df = weather_df.copy()
-        # addding a category based on temperature
-        if 'temperature' in weather_df.columns:
-            weather_df['temp_category'] = weather_df['temperature'].apply(
-                lambda x: (
-                    'Unknown' if x is None or pd.isna(x)
-                    else 'Hot' if x > 25
-                    else 'Warm' if x > 15
-                    else 'Cool' if x > 5
-                    else 'Cold'
-                )
-            )
-
-        transformed_data['weather'] = weather_df
-        print(f"Transformed {len(weather_df)} weather records")
-    
-    # Transform web data
-    if not web_df.empty:
-        web_df = web_df.copy()
-        # addding word count for headlines
-        if 'headline' in web_df.columns:
-            web_df['word_count'] = web_df['headline'].apply(lambda x: len(str(x).split()))
-        transformed_data['news'] = web_df
-        print(f"Transformed {len(web_df)} web records")
-    
-    # Transform Excel data
-    if not excel_df.empty:
-        excel_df = excel_df.copy()
-        # addding grade category if Score column exists
-        if 'Score' in excel_df.columns:
-            excel_df['grade_category'] = excel_df['Score'].apply(
-                lambda x: 'A' if x >= 90 else 'B' if x >= 80 else 'C' if x >= 70 else 'D' if x >= 60 else 'F'
-            )
-        transformed_data['scores'] = excel_df
-        print(f"Transformed {len(excel_df)} Excel records")
+    sources = {'students': mysql_df, 'weather': weather_df, 'news': web_df, 'scores': excel_df}
+    for dataset_name, source_df in sources.items():
+        transformed_df = DATASET_TRANSFORMS[dataset_name](source_df)
+        if transformed_df is not None:
+            transformed_data[dataset_name] = transformed_df
     
     print("Successfully transformed all data")
-    return transformed_data
\ No newline at end of file
+    return transformed_data
@@ -0,0 +1,313 @@
+import os
+from datetime import datetime
+import logging
+from concurrent.futures import Future
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Warehouse tables that hold loaded datasets
+WAREHOUSE_TABLES = ['students', 'weather', 'news', 'scores']
+
+# Tables that can be read through the query API
+QUERYABLE_TABLES = WAREHOUSE_TABLES + ['pipeline_runs', 'pipeline_stage_metrics']
+
+# Per-stage measurements stored by log_stage_metrics, in column order
+STAGE_METRIC_FIELDS = ['dataset', 'stage', 'started_at', 'wall_seconds', 'cpu_seconds', 'rows',
+                       'rows_per_sec', 'output_mb', 'peak_mb', 'rss_delta_mb']
+
+# Source fields kept only in the JSON payload that are exposed as generated,
+# indexed columns: {table: {field: SQL type}}
+JSON_PATH_COLUMNS = {
+    'weather': {
+        'pressure': 'REAL',
+        'wind_speed': 'REAL',
+        'cloudiness': 'INTEGER',
+        'weather_description': 'TEXT'
+    }
+}
+
+# Figures reported by run_analytics for each table.
+# 'averages' maps a numeric column to its output key, 'distributions' maps a
+# dimension column to the key of its value-count histogram.
+ANALYTICS_SPEC = {
+    'students': {
+        'count_key': 'total_count',
+        'averages': {'age': 'avg_age'},
+        'distributions': {'major': 'majors'}
+    },
+    'weather': {
+        'count_key': 'total_records',
+        'averages': {'temperature': 'avg_temperature', 'humidity': 'avg_humidity', 'pressure': 'avg_pressure'},
+        'distributions': {'city': 'cities', 'conditions': 'conditions'}
+    },
+    'news': {
+        'count_key': 'total_records',
+        'averages': {},
+        'distributions': {'source': 'sources'}
+    },
+    'scores': {
+        'count_key': 'total_records',
+        'averages': {'score': 'avg_score'},
+        'distributions': {'subject': 'subjects'}
+    }
+}
+
+class UnsupportedOperation(NotImplementedError):
+    """Raised for warehouse features the configured backend does not provide"""
+
+def completed_future(result):
+    """Return a Future that already holds result"""
+    future = Future()
+    future.set_result(result)
+    return future
+
+class BaseWarehouse:
+    """
+    Storage-backend interface shared by the warehouse implementations
+    
+    Backends implement the storage methods below; column mapping and
+    get_data are shared so every backend exposes the same schema.
+    """
+    
+    # Whether several processes can write to the same warehouse at once
+    multiprocess_writes = True
+    
+    # Set on the scratch warehouse sampled runs load into
+    scratch = False
+    
+    def ensure_warehouse_dir(self):
+        """Create warehouse directory if it doesn't exist"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+    
+    def map_columns(self, df, dataset_name):
+        """Map source columns to warehouse schema columns"""
+        if df.empty:
+            return df
+        
+        df = df.copy()
+        
+        if dataset_name == 'students':
+            # Map MySQL/sample student data columns
+            column_mapping = {
+                'student_id': 'student_id',
+                'Student_ID': 'student_id',
+                'id': 'student_id',
+                'name': 'name',
+                'Name': 'name',
+                'First_Name': 'name',
+                'first_name': 'name',
+                'age': 'age',
+                'Age': 'age',
+                'major': 'major',
+                'Major': 'major',
+                'Course': 'major',
+                'course': 'major'
+            }
+            
+            # Rename columns to match warehouse schema
+            for source_col, target_col in column_mapping.items():
+                if source_col in df.columns:
+                    df[target_col] = df[source_col]
+            
+            # Select only the columns we need
+            required_columns = ['student_id', 'name', 'age', 'major']
+            available_columns = [col for col in required_columns if col in df.columns]
+            df = df[available_columns]
+            
+        elif dataset_name == 'weather':
+            # Map weather API data columns
+            column_mapping = {
+                'city': 'city',
+                'temperature': 'temperature',
+                'humidity': 'humidity',
+                'weather_condition': 'conditions'
+            }
+            
+            # Rename columns to match warehouse schema
+            for source_col, target_col in column_mapping.items():
+                if source_col in df.columns:
+                    df[target_col] = df[source_col]
+            
+            # Select only the columns we need
+            required_columns = ['city', 'temperature', 'humidity', 'conditions']
+            available_columns = [col for col in required_columns if col in df.columns]
+            df = df[available_columns]
+            
+        elif dataset_name == 'news':
+            # Map web scraped news data columns
+            column_mapping = {
+                'headline': 'headline',
+                'source': 'source',
+                'scraped_at': 'scraped_at'
+            }
+            
+            # Rename columns to match warehouse schema
+            for source_col, target_col in column_mapping.items():
+                if source_col in df.columns:
+                    df[target_col] = df[source_col]
+            
+            # Select only the columns we need
+            required_columns = ['headline', 'source', 'scraped_at']
+            available_columns = [col for col in required_columns if col in df.columns]
+            df = df[available_columns]
+            
+        elif dataset_name == 'scores':
+            # Map Excel scores data columns
+            column_mapping = {
+                'Student_ID': 'student_id',
+                'student_id': 'student_id',
+                'id': 'student_id',
+                'First_Name': 'first_name',
+                'first_name': 'first_name',
+                'Last_Name': 'last_name',
+                'last_name': 'last_name',
+                'Score': 'score',
+                'score': 'score',
+                'Subject': 'subject',
+                'subject': 'subject',
+                'Course': 'subject',
+                'course': 'subject'
+            }
+            
+            # Rename columns to match warehouse schema
+            for source_col, target_col in column_mapping.items():
+                if source_col in df.columns:
+                    df[target_col] = df[source_col]
+            
+            # Select only the columns we need
+            required_columns = ['student_id', 'first_name', 'last_name', 'score', 'subject']
+            available_columns = [col for col in required_columns if col in df.columns]
+            df = df[available_columns]
+        
+        return df
+    
+    def prepare_batch(self, dataset_name, data_df, run_id=None, loaded_at=None):
+        """
+        Map a dataset to its warehouse table and stamp it, or return None if there is nothing to store
+        
+        Rows are stamped with the run that loaded them and loaded_at, by
+        default now; a backfill passes its partition's date instead so
+        historic rows land in their own retention window and archive month.
+        """
+        if data_df.empty:
+            logger.warning(f"Empty dataset {dataset_name}, skipping storage")
+            return None
+        
+        # Map columns to warehouse schema
+        mapped_df = self.map_columns(data_df, dataset_name)
+        
+        if mapped_df.empty:
+            logger.warning(f"No valid columns found for {dataset_name}, skipping storage")
+            return None
+        
+        if dataset_name not in WAREHOUSE_TABLES:
+            logger.warning(f"Unknown dataset type: {dataset_name}")
+            return None
+        
+        # Add loading run and timestamp and the full transformed record
+        mapped_df = mapped_df.copy()
+        mapped_df['run_id'] = run_id
+        mapped_df['loaded_at'] = loaded_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        mapped_df['payload'] = self.records_to_json(data_df)
+        return mapped_df
+    
+    def records_to_json(self, df):
+        """Serialize each row to a compact JSON object, NaN as null and dates as ISO strings"""
+        lines = df.to_json(orient='records', lines=True, date_format='iso').splitlines()
+        return pd.Series(lines, index=df.index)
+    
+    def get_data(self, table_name, limit=100, snapshot=False):
+        """Retrieve the most recently loaded rows from a warehouse table"""
+        try:
+            order_by = ['-loaded_at'] if 'loaded_at' in self.get_table_columns(table_name) else ['-id']
+            return self.query(table_name, order_by=order_by, limit=limit, snapshot=snapshot)
+        except Exception as e:
+            logger.error(f"Failed to retrieve data from {table_name}: {e}")
+            return pd.DataFrame()
+    
+    def store_data(self, dataset_name, data_df, run_id, loaded_at=None, publish=True):
+        """
+        Store transformed data in the warehouse
+        
+        Rows a run already stored for the dataset are replaced in the same
+        transaction, so loading a run again does not duplicate them.
+        publish=False keeps the load out of the backend's change feed, if
+        it has one.
+        """
+        raise NotImplementedError
+    
+    def store_data_async(self, dataset_name, data_df, run_id, loaded_at=None, publish=True):
+        """Store data and return a Future; backends without a write queue store synchronously"""
+        future = Future()
+        try:
+            future.set_result(self.store_data(dataset_name, data_df, run_id, loaded_at, publish))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def get_table_columns(self, table_name):
+        """Return the column names of a queryable table"""
+        raise NotImplementedError
+    
+    def query(self, table_name, columns=None, filters=None, group_by=None,
+              aggregates=None, order_by=None, limit=None, offset=None, snapshot=False):
+        """
+        Run a filtered/grouped/aggregated query in the backend and return the result
+        
+        snapshot=True reads from the latest consistent snapshot where the backend has them.
+        """
+        raise NotImplementedError
+    
+    def get_warehouse_summary(self):
+        """Get row counts per table and the latest pipeline run"""
+        raise NotImplementedError
+    
+    def log_pipeline_run(self, run_id, start_time, end_time, status, records_processed, error_message=None):
+        """Log pipeline execution metadata"""
+        raise NotImplementedError
+    
+    def save_checkpoint_state(self, run_id, start_time, state):
+        """Record which stages of a run are checkpointed, marking the run as RUNNING"""
+        raise NotImplementedError
+    
+    def get_checkpoint_state(self, run_id):
+        """Return {'status', 'start_time', 'state'} for a run, or None if the run is unknown"""
+        raise NotImplementedError
+    
+    def log_stage_metrics(self, run_id, metrics):
+        """Store per-stage, per-dataset metrics of a run; metrics is a list of dicts with STAGE_METRIC_FIELDS"""
+        raise NotImplementedError
+    
+    def run_analytics(self):
+        """Run analytics over the whole warehouse"""
+        raise NotImplementedError
+    
+    def clear_warehouse(self):
+        """Clear all data from warehouse (for testing/reset)"""
+        raise NotImplementedError
+    
+    # Optional features; backends without them raise UnsupportedOperation
+    
+    def unsupported(self, feature):
+        return UnsupportedOperation(f"The {type(self).__name__} backend does not support {feature}")
+    
+    def create_snapshot(self, keep=3, pages=1024, sleep=0.005):
+        """Write a new read-only snapshot of the warehouse and return its path"""
+        raise self.unsupported('snapshots')
+    
+    def search_news(self, text, page=1, per_page=20):
+        """Full-text search over news headlines, best matches first"""
+        raise self.unsupported('news search')
+    
+    def get_weather_trend(self, city=None, start=None, end=None, resolution=None, max_points=500):
+        """Temperature and humidity over time per city, from pre-aggregated rollups"""
+        raise self.unsupported('weather rollups')
+    
+    def get_query_stats(self):
+        """Per-statement counts, latencies and histograms for the SQL the warehouse issued"""
+        raise self.unsupported('query statistics')
+    
+    def get_slow_queries(self):
+        """Recent statements over the slow-query threshold, with their query plans"""
+        raise self.unsupported('query statistics')
@@ -0,0 +1,311 @@
+import os
+import json
+import logging
+import pandas as pd
+from warehouse.base_warehouse import (
+    BaseWarehouse, WAREHOUSE_TABLES, QUERYABLE_TABLES, ANALYTICS_SPEC, STAGE_METRIC_FIELDS
+)
+from warehouse.query_builder import build_query, QueryError, quote_identifier
+
+logger = logging.getLogger(__name__)
+
+# Same logical schema as the SQLite warehouse; ids come from per-table sequences
+# and JSON_PATH_COLUMNS are generated columns over the payload
+DUCKDB_SCHEMA = {
+    'students': '''
+        student_id BIGINT,
+        name VARCHAR,
+        age INTEGER,
+        major VARCHAR,
+        processed_at VARCHAR,
+        loaded_at VARCHAR,
+        run_id VARCHAR,
+        payload VARCHAR
+    ''',
+    'weather': '''
+        city VARCHAR,
+        temperature DOUBLE,
+        humidity INTEGER,
+        conditions VARCHAR,
+        temp_category VARCHAR,
+        processed_at VARCHAR,
+        loaded_at VARCHAR,
+        run_id VARCHAR,
+        payload VARCHAR,
+        pressure DOUBLE AS (TRY_CAST(json_extract_string(payload, '$.pressure') AS DOUBLE)),
+        wind_speed DOUBLE AS (TRY_CAST(json_extract_string(payload, '$.wind_speed') AS DOUBLE)),
+        cloudiness INTEGER AS (TRY_CAST(json_extract_string(payload, '$.cloudiness') AS INTEGER)),
+        weather_description VARCHAR AS (json_extract_string(payload, '$.weather_description'))
+    ''',
+    'news': '''
+        headline VARCHAR,
+        source VARCHAR,
+        scraped_at VARCHAR,
+        word_count INTEGER,
+        processed_at VARCHAR,
+        loaded_at VARCHAR,
+        run_id VARCHAR,
+        payload VARCHAR
+    ''',
+    'scores': '''
+        student_id VARCHAR,
+        first_name VARCHAR,
+        last_name VARCHAR,
+        score INTEGER,
+        subject VARCHAR,
+        grade_category VARCHAR,
+        processed_at VARCHAR,
+        loaded_at VARCHAR,
+        run_id VARCHAR,
+        payload VARCHAR
+    ''',
+    'pipeline_runs': '''
+        run_id VARCHAR,
+        start_time VARCHAR,
+        end_time VARCHAR,
+        status VARCHAR,
+        records_processed INTEGER,
+        error_message VARCHAR,
+        checkpoint_state VARCHAR
+    ''',
+    'pipeline_stage_metrics': '''
+        run_id VARCHAR,
+        dataset VARCHAR,
+        stage VARCHAR,
+        started_at VARCHAR,
+        wall_seconds DOUBLE,
+        cpu_seconds DOUBLE,
+        rows BIGINT,
+        rows_per_sec DOUBLE,
+        output_mb DOUBLE,
+        peak_mb DOUBLE,
+        rss_delta_mb DOUBLE
+    '''
+}
+
+class DuckDBWarehouse(BaseWarehouse):
+    """
+    Columnar data warehouse backed by an embedded DuckDB database
+    
+    Aggregations run as vectorized column scans, so run_analytics and
+    query() compute exact figures directly from the stored rows.
+    """
+    
+    # A DuckDB file can only be opened for writing by one process
+    multiprocess_writes = False
+    
+    def __init__(self, db_path='warehouse/etl_warehouse.duckdb'):
+        """Initialize warehouse with a DuckDB database file"""
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("The duckdb warehouse backend requires the 'duckdb' package: pip install duckdb") from e
+        
+        self.db_path = db_path
+        self.ensure_warehouse_dir()
+        self.conn = duckdb.connect(db_path)
+        self.init_database()
+    
+    def cursor(self):
+        """Return a cursor that can be used from the calling thread"""
+        return self.conn.cursor()
+    
+    def init_database(self):
+        """Initialize the warehouse database with required tables"""
+        try:
+            cursor = self.cursor()
+            for table_name, columns in DUCKDB_SCHEMA.items():
+                cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {table_name}_id_seq")
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table_name} (
+                        id BIGINT DEFAULT nextval('{table_name}_id_seq'),
+                        {columns}
+                    )
+                """)
+            cursor.execute("ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS checkpoint_state VARCHAR")
+            cursor.execute("ALTER TABLE pipeline_stage_metrics ADD COLUMN IF NOT EXISTS peak_mb DOUBLE")
+            cursor.execute("ALTER TABLE pipeline_stage_metrics ADD COLUMN IF NOT EXISTS rss_delta_mb DOUBLE")
+            for table_name in WAREHOUSE_TABLES:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS run_id VARCHAR")
+            logger.info("DuckDB warehouse initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize DuckDB warehouse: {e}")
+            raise
+    
+    def store_data(self, dataset_name, data_df, run_id, loaded_at=None, publish=True):
+        """Store transformed data in the warehouse, replacing rows the run already stored; there is no change feed"""
+        try:
+            mapped_df = self.prepare_batch(dataset_name, data_df, run_id, loaded_at)
+            if mapped_df is None:
+                return 0
+            
+            columns = ', '.join(quote_identifier(col) for col in mapped_df.columns)
+            cursor = self.cursor()
+            cursor.register('incoming_batch', mapped_df)
+            try:
+                cursor.execute("BEGIN TRANSACTION")
+                try:
+                    cursor.execute(f"DELETE FROM {dataset_name} WHERE run_id = ?", (run_id,))
+                    cursor.execute(f"INSERT INTO {dataset_name} ({columns}) SELECT {columns} FROM incoming_batch")
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+            finally:
+                cursor.unregister('incoming_batch')
+            
+            records_stored = len(mapped_df)
+            logger.info(f"Stored {records_stored} records for {dataset_name}")
+            return records_stored
+        
+        except Exception as e:
+            logger.error(f"Failed to store {dataset_name}: {e}")
+            raise
+    
+    def get_table_columns(self, table_name):
+        """Return the column names of a queryable table"""
+        if table_name not in QUERYABLE_TABLES:
+            raise QueryError(f"Unknown warehouse table '{table_name}'")
+        return ['id'] + [line.split()[0] for line in DUCKDB_SCHEMA[table_name].strip().splitlines()]
+    
+    def query(self, table_name, columns=None, filters=None, group_by=None,
+              aggregates=None, order_by=None, limit=None, offset=None, snapshot=False):
+        """Run a filtered/grouped/aggregated query inside DuckDB and return the result"""
+        # DuckDB cursors already read a consistent MVCC snapshot, so snapshot is ignored
+        sql, params = build_query(
+            table_name, self.get_table_columns(table_name),
+            columns=columns, filters=filters, group_by=group_by,
+            aggregates=aggregates, order_by=order_by, limit=limit, offset=offset
+        )
+        return self.cursor().execute(sql, params).df()
+    
+    def get_warehouse_summary(self):
+        """Get row counts per table and the latest pipeline run"""
+        try:
+            cursor = self.cursor()
+            summary = {}
+            for table in WAREHOUSE_TABLES:
+                summary[table] = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            
+            latest_run = cursor.execute("""
+                SELECT run_id, start_time, end_time, status, records_processed
+                FROM pipeline_runs
+                ORDER BY start_time DESC
+                LIMIT 1
+            """).fetchone()
+            
+            if latest_run:
+                summary['latest_run'] = {
+                    'run_id': latest_run[0],
+                    'start_time': latest_run[1],
+                    'end_time': latest_run[2],
+                    'status': latest_run[3],
+                    'records_processed': latest_run[4]
+                }
+            
+            return summary
+        
+        except Exception as e:
+            logger.error(f"Failed to get warehouse summary: {e}")
+            return {}
+    
+    def log_pipeline_run(self, run_id, start_time, end_time, status, records_processed, error_message=None):
+        """Log pipeline execution metadata, completing the run's row if checkpointing created one"""
+        try:
+            cursor = self.cursor()
+            existing = cursor.execute("SELECT MAX(id) FROM pipeline_runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+            if existing is not None:
+                cursor.execute("""
+                    UPDATE pipeline_runs
+                    SET start_time = ?, end_time = ?, status = ?, records_processed = ?, error_message = ?
+                    WHERE id = ?
+                """, (start_time, end_time, status, records_processed, error_message, existing))
+            else:
+                cursor.execute("""
+                    INSERT INTO pipeline_runs (run_id, start_time, end_time, status, records_processed, error_message)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (run_id, start_time, end_time, status, records_processed, error_message))
+            logger.info(f"Pipeline run logged: {run_id} - {status}")
+        except Exception as e:
+            logger.error(f"Failed to log pipeline run: {e}")
+    
+    def log_stage_metrics(self, run_id, metrics):
+        """Store per-stage, per-dataset metrics of a run; metrics is a list of dicts with STAGE_METRIC_FIELDS"""
+        try:
+            rows = [[run_id] + [entry.get(field) for field in STAGE_METRIC_FIELDS] for entry in metrics]
+            if rows:
+                self.cursor().executemany(f"""
+                    INSERT INTO pipeline_stage_metrics (run_id, {', '.join(STAGE_METRIC_FIELDS)})
+                    VALUES ({', '.join('?' for _ in range(len(STAGE_METRIC_FIELDS) + 1))})
+                """, rows)
+        except Exception as e:
+            logger.error(f"Failed to log stage metrics: {e}")
+    
+    def save_checkpoint_state(self, run_id, start_time, state):
+        """Record which stages of a run are checkpointed, marking the run as RUNNING"""
+        cursor = self.cursor()
+        existing = cursor.execute("SELECT MAX(id) FROM pipeline_runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+        if existing is not None:
+            cursor.execute("UPDATE pipeline_runs SET status = 'RUNNING', checkpoint_state = ? WHERE id = ?",
+                           (json.dumps(state), existing))
+        else:
+            cursor.execute("""
+                INSERT INTO pipeline_runs (run_id, start_time, status, records_processed, checkpoint_state)
+                VALUES (?, ?, 'RUNNING', 0, ?)
+            """, (run_id, start_time, json.dumps(state)))
+    
+    def get_checkpoint_state(self, run_id):
+        """Return {'status', 'start_time', 'state'} for a run, or None if the run is unknown"""
+        row = self.cursor().execute("""
+            SELECT status, start_time, checkpoint_state FROM pipeline_runs
+            WHERE run_id = ? ORDER BY id DESC LIMIT 1
+        """, (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'start_time': row[1], 'state': json.loads(row[2]) if row[2] else {}}
+    
+    def run_analytics(self):
+        """Run analytics over the whole warehouse with one column scan per table"""
+        try:
+            analytics = {}
+            for table_name, spec in ANALYTICS_SPEC.items():
+                aggregates = {'row_count': ('count', '*')}
+                aggregates.update({key: ('avg', column) for column, key in spec['averages'].items()})
+                totals = self.query(table_name, aggregates=aggregates).iloc[0]
+                
+                if not totals['row_count']:
+                    continue
+                
+                table_analytics = {spec['count_key']: int(totals['row_count'])}
+                for key in spec['averages'].values():
+                    if pd.notna(totals[key]):
+                        table_analytics[key] = float(totals[key])
+                
+                for column, key in spec['distributions'].items():
+                    counts = self.query(
+                        table_name, group_by=[column], aggregates={'value_count': ('count', '*')},
+                        filters=[(column, 'is not null')], order_by=['-value_count', column]
+                    )
+                    if not counts.empty:
+                        table_analytics[key] = {
+                            str(value): int(count) for value, count in zip(counts[column], counts['value_count'])
+                        }
+                
+                analytics[table_name] = table_analytics
+            
+            return analytics
+        
+        except Exception as e:
+            logger.error(f"Failed to run analytics: {e}")
+            return {}
+    
+    def clear_warehouse(self):
+        """Clear all data from warehouse (for testing/reset)"""
+        try:
+            cursor = self.cursor()
+            for table in WAREHOUSE_TABLES + ['pipeline_runs', 'pipeline_stage_metrics']:
+                cursor.execute(f"DELETE FROM {table}")
+            logger.info("Warehouse cleared successfully")
+        except Exception as e:
+            logger.error(f"Failed to clear warehouse: {e}")
+            raise
@@ -0,0 +1,140 @@
+"""
+Compile warehouse analytics queries into parameterized SQL
+
+Table and column names are checked against the known schema and quoted,
+values are always bound as parameters, so nothing from a caller is ever
+interpolated into the statement text.
+
+Fields of the JSON payload column can be referenced as 'payload.<field>'.
+"""
+
+import re
+
+AGGREGATE_FUNCTIONS = {'count', 'sum', 'avg', 'min', 'max'}
+
+FILTER_OPERATORS = {'=', '!=', '<', '<=', '>', '>=', 'like', 'in', 'not in', 'is null', 'is not null'}
+
+PAYLOAD_FIELD = re.compile(r'^payload\.([A-Za-z_][A-Za-z0-9_]*)$')
+
+class QueryError(ValueError):
+    """Raised when a warehouse query references unknown names or operators"""
+
+def quote_identifier(name):
+    """Quote an SQL identifier that has already been validated"""
+    return '"' + name.replace('"', '""') + '"'
+
+def normalize_filters(filters):
+    """Turn a {column: value} dict or a list of (column, op[, value]) tuples into triples"""
+    if not filters:
+        return []
+    if isinstance(filters, dict):
+        return [(column, 'in' if isinstance(value, (list, tuple, set)) else '=', value)
+                for column, value in filters.items()]
+    
+    normalized = []
+    for item in filters:
+        if len(item) == 2:
+            column, op = item
+            value = None
+        else:
+            column, op, value = item
+        normalized.append((column, op.lower(), value))
+    return normalized
+
+def build_query(table_name, table_columns, columns=None, filters=None, group_by=None,
+                aggregates=None, order_by=None, limit=None, offset=None):
+    """
+    Build a parameterized SELECT statement
+    
+    columns    - list of columns to return (all columns when omitted)
+    filters    - {column: value} or [(column, op, value), ...], combined with AND
+    group_by   - list of columns to group on
+    aggregates - {alias: (function, column)}, column may be '*' for count
+    order_by   - list of output names, prefix with '-' for descending order
+    Returns a (sql, params) tuple
+    """
+    def check_column(column):
+        payload_field = PAYLOAD_FIELD.match(column) if 'payload' in table_columns else None
+        if payload_field:
+            return f"json_extract(\"payload\", '$.{payload_field.group(1)}')"
+        if column not in table_columns:
+            raise QueryError(f"Unknown column '{column}' in table '{table_name}'")
+        return quote_identifier(column)
+    
+    def select_column(column):
+        expression = check_column(column)
+        return expression if column in table_columns else f"{expression} AS {quote_identifier(column)}"
+    
+    group_by = list(group_by or [])
+    aggregates = aggregates or {}
+    params = []
+    
+    select_parts = []
+    output_names = set()
+    if columns is None and not group_by and not aggregates:
+        select_parts.append('*')
+        output_names.update(table_columns)
+    else:
+        for column in list(columns or []) + [c for c in group_by if c not in (columns or [])]:
+            select_parts.append(select_column(column))
+            output_names.add(column)
+    
+    for alias, (function, column) in aggregates.items():
+        function = function.lower()
+        if function not in AGGREGATE_FUNCTIONS:
+            raise QueryError(f"Unsupported aggregate function '{function}'")
+        if column == '*' and function != 'count':
+            raise QueryError(f"'*' can only be used with count, not {function}")
+        argument = '*' if column == '*' else check_column(column)
+        select_parts.append(f"{function.upper()}({argument}) AS {quote_identifier(alias)}")
+        output_names.add(alias)
+    
+    sql = f"SELECT {', '.join(select_parts)} FROM {quote_identifier(table_name)}"
+    
+    conditions = []
+    for column, op, value in normalize_filters(filters):
+        if op not in FILTER_OPERATORS:
+            raise QueryError(f"Unsupported filter operator '{op}'")
+        quoted = check_column(column)
+        if op in ('is null', 'is not null'):
+            conditions.append(f"{quoted} {op.upper()}")
+        elif op in ('in', 'not in'):
+            values = list(value)
+            if not values:
+                conditions.append('1 = 0' if op == 'in' else '1 = 1')
+                continue
+            conditions.append(f"{quoted} {op.upper()} ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        else:
+            conditions.append(f"{quoted} {op.upper()} ?")
+            params.append(value)
+    
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    
+    if group_by:
+        sql += " GROUP BY " + ", ".join(check_column(column) for column in group_by)
+    
+    if order_by:
+        order_parts = []
+        for name in order_by:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name in output_names:
+                expression = quote_identifier(name)
+            else:
+                expression = check_column(name)
+            order_parts.append(expression + (' DESC' if descending else ''))
+        sql += " ORDER BY " + ", ".join(order_parts)
+    
+    if offset and limit is None:
+        # SQLite has no OFFSET without LIMIT; ignoring it would quietly return the first page
+        raise QueryError("offset needs a limit")
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+        if offset:
+            sql += " OFFSET ?"
+            params.append(int(offset))
+    
+    return sql, params
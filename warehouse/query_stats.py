@@ -0,0 +1,231 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (milliseconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000]
+
+# Statements slower than this are logged with their query plan
+SLOW_QUERY_MS = float(os.getenv('WAREHOUSE_SLOW_QUERY_MS', '100'))
+
+# Statements that EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_statement(sql):
+    """Reduce a statement to its shape: literals become ?, placeholder lists collapse"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('?, ...', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+class QueryStats:
+    """Per-statement call counts, timings and latency histograms, plus a slow query log"""
+    
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, max_slow_queries=100):
+        self.slow_query_ms = slow_query_ms
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+    
+    def record(self, sql, duration_ms):
+        """Add one execution of sql; returns True when it counts as slow"""
+        normalized = normalize_statement(sql)
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if duration_ms <= bound),
+                      len(LATENCY_BUCKETS_MS))
+        with self.lock:
+            entry = self.statements.get(normalized)
+            if entry is None:
+                entry = self.statements[normalized] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['histogram'][bucket] += 1
+        return duration_ms >= self.slow_query_ms
+    
+    def record_slow(self, sql, duration_ms, plan):
+        """Keep a slow statement and its query plan, and log it"""
+        self.slow_queries.append({
+            'statement': normalize_statement(sql),
+            'duration_ms': round(duration_ms, 3),
+            'plan': plan,
+            'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        logger.warning(
+            f"Slow warehouse query ({duration_ms:.1f} ms): {normalize_statement(sql)}\n"
+            + "\n".join(f"  {line}" for line in plan)
+        )
+    
+    def summary(self):
+        """Return per-statement statistics, most total time first"""
+        with self.lock:
+            rows = [
+                {
+                    'statement': statement,
+                    'count': entry['count'],
+                    'total_ms': round(entry['total_ms'], 3),
+                    'avg_ms': round(entry['total_ms'] / entry['count'], 3),
+                    'max_ms': round(entry['max_ms'], 3),
+                    'histogram': dict(zip([f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ['gt_5000ms'],
+                                          entry['histogram']))
+                }
+                for statement, entry in self.statements.items()
+            ]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+    
+    def reset(self):
+        """Forget all collected statistics"""
+        with self.lock:
+            self.statements.clear()
+            self.slow_queries.clear()
+
+def explain(conn, sql, params):
+    """Return EXPLAIN QUERY PLAN lines for sql, or an empty list if it cannot be explained"""
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        cursor = sqlite3.Cursor(conn)
+        rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return [row[-1] for row in rows]
+    except sqlite3.Error as e:
+        return [f"plan unavailable: {e}"]
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports the duration of every statement to its connection's QueryStats
+    
+    SQLite produces a query's rows as they are fetched, so a statement with
+    a result set is timed over execute() and every fetch, and recorded once
+    its rows run out or the cursor is closed, reused or dropped. Time the
+    caller spends between fetches is not counted.
+    """
+    
+    pending = None
+    
+    def execute(self, sql, parameters=()):
+        self.finish()
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            self.connection.observe(sql, parameters, (time.perf_counter() - start) * 1000)
+            raise
+        duration_ms = (time.perf_counter() - start) * 1000
+        if self.description is None:
+            self.connection.observe(sql, parameters, duration_ms)
+        else:
+            self.pending = [sql, parameters, duration_ms]
+        return self
+    
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.observe(sql, seq_of_parameters[0] if seq_of_parameters else (),
+                                    (time.perf_counter() - start) * 1000)
+    
+    def timed(self, fetch, *args):
+        """Call fetch, adding its duration to the pending statement"""
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self.pending is not None:
+                self.pending[2] += (time.perf_counter() - start) * 1000
+    
+    def fetchone(self):
+        row = self.timed(super().fetchone)
+        if row is None:
+            self.finish()
+        return row
+    
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self.timed(super().fetchmany, size)
+        if len(rows) < size:
+            self.finish()
+        return rows
+    
+    def fetchall(self):
+        rows = self.timed(super().fetchall)
+        self.finish()
+        return rows
+    
+    def __next__(self):
+        try:
+            return self.timed(super().__next__)
+        except StopIteration:
+            self.finish()
+            raise
+    
+    def close(self):
+        self.finish()
+        super().close()
+    
+    def __del__(self):
+        try:
+            self.finish()
+        except Exception:
+            pass
+    
+    def finish(self):
+        """Record the pending statement, if any"""
+        if self.pending is not None:
+            sql, parameters, duration_ms = self.pending
+            self.pending = None
+            self.connection.observe(sql, parameters, duration_ms)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed, counted and explained when slow"""
+    
+    stats = None
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def observe(self, sql, parameters, duration_ms):
+        """Record a finished statement that took duration_ms"""
+        if self.stats is not None and self.stats.record(sql, duration_ms):
+            self.stats.record_slow(sql, duration_ms, explain(self, sql, parameters))
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def get_query_stats(db_path):
+    """Return the shared QueryStats for a database file"""
+    key = os.path.abspath(db_path)
+    with _stats_lock:
+        if key not in _stats:
+            _stats[key] = QueryStats()
+        return _stats[key]
+
+def instrumented_connect(database, stats, **kwargs):
+    """sqlite3.connect() returning an InstrumentedConnection that reports to stats"""
+    conn = sqlite3.connect(database, factory=InstrumentedConnection, **kwargs)
+    conn.stats = stats
+    return conn
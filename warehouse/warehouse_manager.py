@@ -4,30 +4,104 @@ import json
 import os
 from datetime import datetime
 import logging
+import math
+import re
+import time
+import urllib.parse
+from datetime import timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+from warehouse.base_warehouse import (
+    BaseWarehouse, completed_future, WAREHOUSE_TABLES, QUERYABLE_TABLES, ANALYTICS_SPEC, JSON_PATH_COLUMNS,
+    STAGE_METRIC_FIELDS
+)
+from warehouse.query_builder import build_query, QueryError
+from warehouse.write_queue import get_writer, BUSY_TIMEOUT
+from warehouse.query_stats import get_query_stats, instrumented_connect
+from load.change_feed import ChangeFeed
+from metrics import record_cache_lookup
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class WarehouseManager:
+# Tables whose row counts are maintained in table_counters
+COUNTED_TABLES = WAREHOUSE_TABLES + ['pipeline_runs']
+
+# Days a row stays in the hot database before archive_expired moves it out;
+# None keeps the table's rows forever
+DEFAULT_RETENTION_DAYS = {
+    'students': None,
+    'scores': None,
+    'weather': 90,
+    'news': 30
+}
+
+# Weather rollup granularities, finest first: {name: (bucket seconds, strftime bucket format)}
+ROLLUP_RESOLUTIONS = {
+    'hour': (3600, '%Y-%m-%d %H:00:00'),
+    'day': (86400, '%Y-%m-%d 00:00:00')
+}
+
+# Column name used in agg_measures for the per-table row count
+ROW_COUNT_COLUMN = '*'
+
+# Snapshot files are named <database stem>-<SNAPSHOT_TIMESTAMP>.db
+SNAPSHOT_TIMESTAMP = '%Y%m%d_%H%M%S_%f'
+SNAPSHOT_SUFFIX = re.compile(r'-\d{8}_\d{6}_\d{6}\.db$')
+
+def dataframe_to_rows(df):
+    """Convert a DataFrame to a list of tuples of plain Python values for sqlite3"""
+    df = df.copy()
+    for col in df.select_dtypes(include=['datetime', 'datetimetz']).columns:
+        df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query that ANDs quoted terms, keeping a trailing '*' as prefix search"""
+    terms = []
+    for word in str(text or '').split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+class WarehouseManager(BaseWarehouse):
     """Simple data warehouse manager using SQLite for persistent storage"""
     
-    def __init__(self, db_path='warehouse/etl_warehouse.db'):
+    def __init__(self, db_path='warehouse/etl_warehouse.db', retention_days=None):
         """Initialize warehouse with SQLite database"""
         self.db_path = db_path
+        self.retention_days = dict(DEFAULT_RETENTION_DAYS, **(retention_days or {}))
+        self.archive_dir = os.path.join(os.path.dirname(db_path) or '.', 'archive')
+        self.snapshot_dir = os.path.join(os.path.dirname(db_path) or '.', 'snapshots')
+        self.change_feed = ChangeFeed(os.path.join(os.path.dirname(db_path) or '.', 'changes'))
+        # Publishes committed loads to the change feed off the writer thread, in commit order
+        self.feed_publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='change-feed')
+        self.table_columns = {}
+        self.query_stats = get_query_stats(db_path)
         self.ensure_warehouse_dir()
         self.init_database()
+        self.writer = get_writer(db_path)
     
-    def ensure_warehouse_dir(self):
-        """Create warehouse directory if it doesn't exist"""
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+    def connect(self):
+        """Open a connection that waits for the writer instead of failing with 'database is locked'"""
+        return instrumented_connect(self.db_path, self.query_stats, timeout=BUSY_TIMEOUT)
     
     def init_database(self):
         """Initialize the warehouse database with required tables"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 
+                # Lets reclaim_space return free pages in small steps; only takes
+                # effect on new databases (see enable_incremental_vacuum)
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                
+                # Readers see a consistent view while the writer appends to the WAL
+                cursor.execute("PRAGMA journal_mode = WAL")
+                
                 # Create tables for each data type
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS students (
@@ -37,7 +111,8 @@ class WarehouseManager:
                         age INTEGER,
                         major TEXT,
                         processed_at TEXT,
-                        loaded_at TEXT
+                        loaded_at TEXT,
+                        run_id TEXT
                     )
                 ''')
                 
@@ -50,7 +125,8 @@ class WarehouseManager:
                         conditions TEXT,
                         temp_category TEXT,
                         processed_at TEXT,
-                        loaded_at TEXT
+                        loaded_at TEXT,
+                        run_id TEXT
                     )
                 ''')
                 
@@ -62,7 +138,8 @@ class WarehouseManager:
                         scraped_at TEXT,
                         word_count INTEGER,
                         processed_at TEXT,
-                        loaded_at TEXT
+                        loaded_at TEXT,
+                        run_id TEXT
                     )
                 ''')
                 
@@ -76,7 +153,29 @@ class WarehouseManager:
                         subject TEXT,
                         grade_category TEXT,
                         processed_at TEXT,
-                        loaded_at TEXT
+                        loaded_at TEXT,
+                        run_id TEXT
+                    )
+                ''')
+                
+                # Create materialized aggregate tables used by run_analytics
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS agg_measures (
+                        table_name TEXT NOT NULL,
+                        column_name TEXT NOT NULL,
+                        value_count INTEGER NOT NULL DEFAULT 0,
+                        value_sum REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (table_name, column_name)
+                    )
+                ''')
+                
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS agg_value_counts (
+                        table_name TEXT NOT NULL,
+                        column_name TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        value_count INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (table_name, column_name, value)
                     )
                 ''')
                 
@@ -93,6 +192,106 @@ class WarehouseManager:
                     )
                 ''')
                 
+                # Wall/CPU time, throughput and memory of every stage and dataset of a run
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS pipeline_stage_metrics (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        run_id TEXT NOT NULL,
+                        dataset TEXT NOT NULL,
+                        stage TEXT NOT NULL,
+                        started_at TEXT,
+                        wall_seconds REAL,
+                        cpu_seconds REAL,
+                        rows INTEGER,
+                        rows_per_sec REAL,
+                        output_mb REAL,
+                        peak_mb REAL,
+                        rss_delta_mb REAL
+                    )
+                ''')
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_pipeline_stage_metrics_run
+                    ON pipeline_stage_metrics (run_id)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_pipeline_stage_metrics_stage
+                    ON pipeline_stage_metrics (stage, dataset, started_at)
+                """)
+                
+                # Archive databases holding rows of each run, so a replaced run can be removed from them too
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS archived_runs (
+                        table_name TEXT NOT NULL,
+                        run_id TEXT NOT NULL,
+                        archive_path TEXT NOT NULL,
+                        PRIMARY KEY (table_name, run_id, archive_path)
+                    )
+                ''')
+                
+                # Row counts and the latest-run pointer, kept current by triggers
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS table_counters (
+                        table_name TEXT PRIMARY KEY,
+                        row_count INTEGER NOT NULL DEFAULT 0,
+                        last_row_id INTEGER
+                    )
+                ''')
+                self.init_counters(conn)
+                
+                self.init_payload_columns(conn)
+                self.init_news_search(conn)
+                
+                # Stage checkpoints of a run, for resuming it after a failure
+                existing = {row[1] for row in cursor.execute("PRAGMA table_info(pipeline_runs)").fetchall()}
+                if 'checkpoint_state' not in existing:
+                    cursor.execute("ALTER TABLE pipeline_runs ADD COLUMN checkpoint_state TEXT")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_runs_run_id ON pipeline_runs (run_id)")
+                
+                # Stage metrics recorded the process's peak RSS before the per-stage peak and RSS delta
+                existing = {row[1] for row in cursor.execute("PRAGMA table_info(pipeline_stage_metrics)").fetchall()}
+                for column in ('peak_mb', 'rss_delta_mb'):
+                    if column not in existing:
+                        cursor.execute(f"ALTER TABLE pipeline_stage_metrics ADD COLUMN {column} REAL")
+                
+                # Retention and get_data both select rows by load time
+                for table in WAREHOUSE_TABLES:
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_loaded_at ON {table} (loaded_at)")
+                
+                # Rows record the run that loaded them, so a run can replace its own rows
+                for table in WAREHOUSE_TABLES:
+                    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+                    if 'run_id' not in existing:
+                        cursor.execute(f"ALTER TABLE {table} ADD COLUMN run_id TEXT")
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_run_id ON {table} (run_id)")
+                
+                # Hourly and daily weather summaries per city
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS weather_rollups (
+                        resolution TEXT NOT NULL,
+                        city TEXT NOT NULL,
+                        bucket TEXT NOT NULL,
+                        readings INTEGER NOT NULL DEFAULT 0,
+                        temperature_count INTEGER NOT NULL DEFAULT 0,
+                        temperature_sum REAL NOT NULL DEFAULT 0,
+                        temperature_min REAL,
+                        temperature_max REAL,
+                        humidity_count INTEGER NOT NULL DEFAULT 0,
+                        humidity_sum REAL NOT NULL DEFAULT 0,
+                        humidity_min REAL,
+                        humidity_max REAL,
+                        PRIMARY KEY (resolution, city, bucket)
+                    )
+                ''')
+                
+                # Populate aggregates for warehouses created before they existed
+                cursor.execute("SELECT 1 FROM agg_measures LIMIT 1")
+                if cursor.fetchone() is None:
+                    self.rebuild_aggregates(conn)
+                
+                cursor.execute("SELECT 1 FROM weather_rollups LIMIT 1")
+                if cursor.fetchone() is None:
+                    self.rebuild_weather_rollups(conn)
+                
                 conn.commit()
                 logger.info("Warehouse database initialized successfully")
                 
@@ -100,181 +299,514 @@ class WarehouseManager:
             logger.error(f"Failed to initialize warehouse: {e}")
             raise
     
-    def map_columns(self, df, dataset_name):
-        """Map source columns to warehouse schema columns"""
-        if df.empty:
-            return df
-        
-        df = df.copy()
-        
-        if dataset_name == 'students':
-            # Map MySQL/sample student data columns
-            column_mapping = {
-                'student_id': 'student_id',
-                'Student_ID': 'student_id',
-                'id': 'student_id',
-                'name': 'name',
-                'Name': 'name',
-                'First_Name': 'name',
-                'first_name': 'name',
-                'age': 'age',
-                'Age': 'age',
-                'major': 'major',
-                'Major': 'major',
-                'Course': 'major',
-                'course': 'major'
-            }
+    def init_payload_columns(self, conn):
+        """Add the JSON payload column and the generated, indexed columns over its hot paths"""
+        cursor = conn.cursor()
+        for table in WAREHOUSE_TABLES:
+            existing = {row[1] for row in cursor.execute(f"PRAGMA table_xinfo({table})").fetchall()}
+            if 'payload' not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN payload TEXT")
             
-            # Rename columns to match warehouse schema
-            for source_col, target_col in column_mapping.items():
-                if source_col in df.columns:
-                    df[target_col] = df[source_col]
-            
-            # Select only the columns we need
-            required_columns = ['student_id', 'name', 'age', 'major']
-            available_columns = [col for col in required_columns if col in df.columns]
-            df = df[available_columns]
-            
-        elif dataset_name == 'weather':
-            # Map weather API data columns
-            column_mapping = {
-                'city': 'city',
-                'temperature': 'temperature',
-                'humidity': 'humidity',
-                'weather_condition': 'conditions'
-            }
+            for field, sql_type in JSON_PATH_COLUMNS.get(table, {}).items():
+                if field not in existing:
+                    cursor.execute(f"""
+                        ALTER TABLE {table} ADD COLUMN {field} {sql_type}
+                        GENERATED ALWAYS AS (json_extract(payload, '$.{field}')) VIRTUAL
+                    """)
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{field} ON {table} ({field})")
+    
+    def init_news_search(self, conn):
+        """Create the FTS5 index over news headlines and the triggers that keep it in sync"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'news_fts'")
+        index_exists = cursor.fetchone() is not None
+        
+        # External-content index: headlines are stored once, in the news table
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(
+                headline, content='news', content_rowid='id', tokenize='porter unicode61'
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS news_fts_insert AFTER INSERT ON news
+            BEGIN
+                INSERT INTO news_fts (rowid, headline) VALUES (NEW.id, NEW.headline);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS news_fts_delete AFTER DELETE ON news
+            BEGIN
+                INSERT INTO news_fts (news_fts, rowid, headline) VALUES ('delete', OLD.id, OLD.headline);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS news_fts_update AFTER UPDATE OF headline ON news
+            BEGIN
+                INSERT INTO news_fts (news_fts, rowid, headline) VALUES ('delete', OLD.id, OLD.headline);
+                INSERT INTO news_fts (rowid, headline) VALUES (NEW.id, NEW.headline);
+            END
+        """)
+        
+        if not index_exists:
+            # Index headlines loaded before search existed
+            cursor.execute("INSERT INTO news_fts (news_fts) VALUES ('rebuild')")
+    
+    def init_counters(self, conn):
+        """Create the row-count triggers and seed counters for tables that have none yet"""
+        cursor = conn.cursor()
+        for table in COUNTED_TABLES:
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table}
+                BEGIN
+                    UPDATE table_counters SET row_count = row_count + 1, last_row_id = NEW.id
+                    WHERE table_name = '{table}';
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table}
+                BEGIN
+                    UPDATE table_counters SET row_count = row_count - 1
+                    WHERE table_name = '{table}';
+                END
+            """)
+        
+        cursor.execute("SELECT table_name FROM table_counters")
+        seeded = {row[0] for row in cursor.fetchall()}
+        for table in COUNTED_TABLES:
+            if table not in seeded:
+                # One full count when the counter is first created
+                cursor.execute(
+                    f"INSERT INTO table_counters (table_name, row_count, last_row_id) SELECT ?, COUNT(*), MAX(id) FROM {table}",
+                    (table,)
+                )
+    
+    def store_data(self, dataset_name, data_df, run_id, loaded_at=None, publish=True):
+        """Store transformed data in the warehouse, replacing rows the run already stored"""
+        return self.store_data_async(dataset_name, data_df, run_id, loaded_at, publish).result()
+    
+    def store_data_async(self, dataset_name, data_df, run_id, loaded_at=None, publish=True):
+        """
+        Queue transformed data for the warehouse writer and return a Future with the stored row count
+        
+        publish=False stores the rows without appending them to the change feed.
+        """
+        try:
+            mapped_df = self.prepare_batch(dataset_name, data_df, run_id, loaded_at)
+            if mapped_df is None:
+                return completed_future(0)
             
-            # Rename columns to match warehouse schema
-            for source_col, target_col in column_mapping.items():
-                if source_col in df.columns:
-                    df[target_col] = df[source_col]
+            # Rows and aggregates are written in one transaction so analytics
+            # never see a partially loaded batch
+            # Aggregate payload-only fields from the source frame
+            aggregate_df = mapped_df.copy()
+            for field in JSON_PATH_COLUMNS.get(dataset_name, {}):
+                if field in data_df.columns:
+                    aggregate_df[field] = data_df[field]
             
-            # Select only the columns we need
-            required_columns = ['city', 'temperature', 'humidity', 'conditions']
-            available_columns = [col for col in required_columns if col in df.columns]
-            df = df[available_columns]
+            # Rows of the run that were archived since are removed first, on their own
+            # because ATTACH cannot run inside the writer's transaction
+            archive_paths = self.archived_run_paths(dataset_name, run_id)
+            archive_cleanup = None
+            if archive_paths:
+                archive_cleanup = self.writer.submit(
+                    lambda conn: [row_id for path in archive_paths
+                                  for row_id in self.delete_archived_run_rows(conn, dataset_name, run_id, path)],
+                    transactional=False
+                )
             
-        elif dataset_name == 'news':
-            # Map web scraped news data columns
-            column_mapping = {
-                'headline': 'headline',
-                'source': 'source',
-                'scraped_at': 'scraped_at'
-            }
+            def write(conn):
+                deleted_ids = []
+                if archive_cleanup is not None:
+                    # Queued ahead of this write, so already done; its failure fails the load
+                    deleted_ids = archive_cleanup.result(timeout=0)
+                if conn.execute("SELECT 1 FROM archived_runs WHERE table_name = ? AND run_id = ? LIMIT 1",
+                                (dataset_name, run_id)).fetchone() is not None:
+                    raise RuntimeError(f"{dataset_name} rows of run {run_id} were archived while it was being replaced")
+                # A run loaded again, e.g. resumed after it stored but before its
+                # checkpoint, replaces its earlier rows instead of duplicating them
+                deleted_ids = deleted_ids + self.delete_run_rows(conn, dataset_name, run_id)
+                self.insert_rows(conn, dataset_name, mapped_df)
+                # One writer inserts the batch in one statement, so its ids are consecutive
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                self.update_aggregates(conn, dataset_name, aggregate_df)
+                if dataset_name == 'weather':
+                    self.update_weather_rollups(conn, mapped_df, data_df)
+                logger.info(f"Stored {len(mapped_df)} records for {dataset_name}")
+                return last_id, deleted_ids
             
-            # Rename columns to match warehouse schema
-            for source_col, target_col in column_mapping.items():
-                if source_col in df.columns:
-                    df[target_col] = df[source_col]
+            def log_failure(future):
+                if future.exception() is not None:
+                    logger.error(f"Failed to store {dataset_name}: {future.exception()}")
             
-            # Select only the columns we need
-            required_columns = ['headline', 'source', 'scraped_at']
-            available_columns = [col for col in required_columns if col in df.columns]
-            df = df[available_columns]
+            stored = Future()
             
-        elif dataset_name == 'scores':
-            # Map Excel scores data columns
-            column_mapping = {
-                'Student_ID': 'student_id',
-                'student_id': 'student_id',
-                'id': 'student_id',
-                'First_Name': 'first_name',
-                'first_name': 'first_name',
-                'Last_Name': 'last_name',
-                'last_name': 'last_name',
-                'Score': 'score',
-                'score': 'score',
-                'Subject': 'subject',
-                'subject': 'subject',
-                'Course': 'subject',
-                'course': 'subject'
-            }
+            def append_changes(written):
+                last_id, deleted_ids = written
+                try:
+                    inserted = mapped_df.drop(columns=['payload', 'run_id'], errors='ignore')
+                    inserted.insert(0, 'id', range(last_id - len(mapped_df) + 1, last_id + 1))
+                    self.change_feed.append(dataset_name, inserted, run_id, deleted_ids)
+                except Exception as e:
+                    logger.error(f"Failed to publish {dataset_name} changes: {e}")
+                stored.set_result(len(mapped_df))
             
-            # Rename columns to match warehouse schema
-            for source_col, target_col in column_mapping.items():
-                if source_col in df.columns:
-                    df[target_col] = df[source_col]
+            def publish_changes(future):
+                # Only batches that actually committed reach the change feed, and
+                # callers see the stored count once the feed is up to date. This
+                # runs on the writer thread, so the feed is written elsewhere.
+                if future.exception() is not None:
+                    stored.set_exception(future.exception())
+                elif self.change_feed is None or not publish:
+                    stored.set_result(len(mapped_df))
+                else:
+                    try:
+                        self.feed_publisher.submit(append_changes, future.result())
+                    except RuntimeError as e:
+                        # Interpreter shutdown; the rows are stored, only the feed misses them
+                        logger.error(f"Failed to publish {dataset_name} changes: {e}")
+                        stored.set_result(len(mapped_df))
             
-            # Select only the columns we need
-            required_columns = ['student_id', 'first_name', 'last_name', 'score', 'subject']
-            available_columns = [col for col in required_columns if col in df.columns]
-            df = df[available_columns]
+            future = self.writer.submit(write)
+            future.add_done_callback(log_failure)
+            future.add_done_callback(publish_changes)
+            return stored
+                
+        except Exception as e:
+            logger.error(f"Failed to store {dataset_name}: {e}")
+            raise
+    
+    def insert_rows(self, conn, table_name, df):
+        """Insert DataFrame rows into a warehouse table on an open connection"""
+        columns = ', '.join(df.columns)
+        placeholders = ', '.join('?' for _ in df.columns)
+        conn.executemany(
+            f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
+            dataframe_to_rows(df)
+        )
+    
+    def delete_run_rows(self, conn, table_name, run_id, database='main'):
+        """
+        Delete the rows a run stored in a table and take them out of the aggregates; returns their ids
         
-        return df
+        database='archive' deletes them from an ATTACHed archive database;
+        archived rows are still counted in the aggregates of the main one.
+        """
+        table = f"{database}.{table_name}"
+        if conn.execute(f"SELECT 1 FROM {table} WHERE run_id = ? LIMIT 1", (run_id,)).fetchone() is None:
+            return []
+        
+        replaced = pd.read_sql_query(f"SELECT * FROM {table} WHERE run_id = ?", conn, params=(run_id,))
+        # Archives keep the payload but not the generated columns over it
+        payloads = [json.loads(payload) if payload else {} for payload in replaced.get('payload', [])]
+        for field in JSON_PATH_COLUMNS.get(table_name, {}):
+            if field not in replaced.columns:
+                replaced[field] = [payload.get(field) for payload in payloads] if payloads else None
+        self.update_aggregates(conn, table_name, replaced, sign=-1)
+        if table_name == 'weather':
+            source = pd.DataFrame({'timestamp': [payload.get('timestamp') for payload in payloads] or None},
+                                  index=replaced.index)
+            self.update_weather_rollups(conn, replaced, source, sign=-1)
+        conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+        logger.info(f"Replacing {len(replaced)} {table_name} rows stored earlier by run {run_id}"
+                    + (f" in {database}" if database != 'main' else ''))
+        return replaced['id'].tolist()
+    
+    def archived_run_paths(self, table_name, run_id):
+        """Archive databases holding rows a run stored in a table"""
+        with self.connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT archive_path FROM archived_runs WHERE table_name = ? AND run_id = ? ORDER BY archive_path",
+                (table_name, run_id)
+            ).fetchall()]
     
-    def store_data(self, dataset_name, data_df, run_id):
-        """Store transformed data in the warehouse"""
+    def delete_archived_run_rows(self, conn, table_name, run_id, archive_path):
+        """Delete a run's rows from one archive database, outside the writer's transactions; returns their ids"""
+        if not os.path.exists(archive_path):
+            # The archive was removed by hand; only forget it
+            conn.execute("DELETE FROM archived_runs WHERE table_name = ? AND run_id = ? AND archive_path = ?",
+                         (table_name, run_id, archive_path))
+            return []
+        
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
         try:
-            if data_df.empty:
-                logger.warning(f"Empty dataset {dataset_name}, skipping storage")
-                return 0
+            conn.execute("BEGIN IMMEDIATE")
+            removed = self.delete_run_rows(conn, table_name, run_id, database='archive')
+            conn.execute("DELETE FROM main.archived_runs WHERE table_name = ? AND run_id = ? AND archive_path = ?",
+                         (table_name, run_id, archive_path))
+            conn.execute("COMMIT")
+            return removed
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+    
+    def update_aggregates(self, conn, table_name, df, sign=1):
+        """Add a newly loaded batch to the materialized aggregate tables, or take it out with sign=-1"""
+        spec = ANALYTICS_SPEC[table_name]
+        measures = [(table_name, ROW_COUNT_COLUMN, sign * len(df), 0.0)]
+        
+        for column in spec['averages']:
+            if column in df.columns:
+                values = pd.to_numeric(df[column], errors='coerce')
+                measures.append((table_name, column, sign * int(values.count()), sign * float(values.sum())))
+        
+        conn.executemany("""
+            INSERT INTO agg_measures (table_name, column_name, value_count, value_sum)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (table_name, column_name) DO UPDATE SET
+                value_count = value_count + excluded.value_count,
+                value_sum = value_sum + excluded.value_sum
+        """, measures)
+        
+        value_counts = []
+        for column in spec['distributions']:
+            if column in df.columns:
+                counts = df[column].dropna().astype(str).value_counts()
+                value_counts.extend(
+                    (table_name, column, value, sign * int(count)) for value, count in counts.items()
+                )
+        
+        conn.executemany("""
+            INSERT INTO agg_value_counts (table_name, column_name, value, value_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (table_name, column_name, value) DO UPDATE SET
+                value_count = value_count + excluded.value_count
+        """, value_counts)
+        if sign < 0:
+            conn.execute("DELETE FROM agg_value_counts WHERE table_name = ? AND value_count <= 0", (table_name,))
+    
+    def rebuild_aggregates(self, conn=None):
+        """Recompute the aggregate tables from a full scan of the warehouse tables"""
+        if conn is None:
+            return self.writer.submit(self.rebuild_aggregates).result()
+        
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM agg_measures")
+        cursor.execute("DELETE FROM agg_value_counts")
+        
+        for table_name, spec in ANALYTICS_SPEC.items():
+            cursor.execute(
+                f"INSERT INTO agg_measures SELECT ?, ?, COUNT(*), 0 FROM {table_name}",
+                (table_name, ROW_COUNT_COLUMN)
+            )
+            for column in spec['averages']:
+                cursor.execute(
+                    f"INSERT INTO agg_measures SELECT ?, ?, COUNT({column}), COALESCE(SUM({column}), 0) FROM {table_name}",
+                    (table_name, column)
+                )
+            for column in spec['distributions']:
+                cursor.execute(f"""
+                    INSERT INTO agg_value_counts
+                    SELECT ?, ?, CAST({column} AS TEXT), COUNT(*) FROM {table_name}
+                    WHERE {column} IS NOT NULL GROUP BY CAST({column} AS TEXT)
+                """, (table_name, column))
+        
+        logger.info("Warehouse aggregates rebuilt")
+    
+    def update_weather_rollups(self, conn, mapped_df, data_df, sign=1):
+        """Fold a batch of weather readings into the hourly and daily rollups, or take it out with sign=-1"""
+        if 'city' not in mapped_df.columns:
+            return
+        
+        # Bucket by observation time from the source, falling back to load time
+        observed = pd.to_datetime(mapped_df['loaded_at'])
+        if 'timestamp' in data_df.columns:
+            observed = pd.to_datetime(data_df['timestamp'], errors='coerce').fillna(observed)
+        
+        readings = mapped_df.reindex(columns=['city', 'temperature', 'humidity']).dropna(subset=['city'])
+        for column in ['temperature', 'humidity']:
+            readings[column] = pd.to_numeric(readings[column], errors='coerce')
+        
+        rows = []
+        for resolution, (_, bucket_format) in ROLLUP_RESOLUTIONS.items():
+            readings['bucket'] = observed.loc[readings.index].dt.strftime(bucket_format)
+            grouped = readings.groupby(['city', 'bucket']).agg(
+                readings=('city', 'size'),
+                temperature_count=('temperature', 'count'),
+                temperature_sum=('temperature', 'sum'),
+                temperature_min=('temperature', 'min'),
+                temperature_max=('temperature', 'max'),
+                humidity_count=('humidity', 'count'),
+                humidity_sum=('humidity', 'sum'),
+                humidity_min=('humidity', 'min'),
+                humidity_max=('humidity', 'max')
+            ).reset_index()
+            grouped.insert(0, 'resolution', resolution)
+            if sign < 0:
+                # Counts and sums can be taken out again; min and max keep the
+                # removed readings until the bucket is empty or rebuilt
+                measures = ['readings', 'temperature_count', 'temperature_sum', 'humidity_count', 'humidity_sum']
+                grouped[measures] = -grouped[measures]
+                grouped[['temperature_min', 'temperature_max', 'humidity_min', 'humidity_max']] = None
+            rows.extend(dataframe_to_rows(grouped))
+        
+        conn.executemany("""
+            INSERT INTO weather_rollups (
+                resolution, city, bucket, readings,
+                temperature_count, temperature_sum, temperature_min, temperature_max,
+                humidity_count, humidity_sum, humidity_min, humidity_max
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (resolution, city, bucket) DO UPDATE SET
+                readings = readings + excluded.readings,
+                temperature_count = temperature_count + excluded.temperature_count,
+                temperature_sum = temperature_sum + excluded.temperature_sum,
+                temperature_min = COALESCE(MIN(temperature_min, excluded.temperature_min), temperature_min, excluded.temperature_min),
+                temperature_max = COALESCE(MAX(temperature_max, excluded.temperature_max), temperature_max, excluded.temperature_max),
+                humidity_count = humidity_count + excluded.humidity_count,
+                humidity_sum = humidity_sum + excluded.humidity_sum,
+                humidity_min = COALESCE(MIN(humidity_min, excluded.humidity_min), humidity_min, excluded.humidity_min),
+                humidity_max = COALESCE(MAX(humidity_max, excluded.humidity_max), humidity_max, excluded.humidity_max)
+        """, rows)
+        if sign < 0:
+            conn.execute("DELETE FROM weather_rollups WHERE readings <= 0")
+    
+    def rebuild_weather_rollups(self, conn=None):
+        """Recompute the weather rollups from the weather table"""
+        if conn is None:
+            return self.writer.submit(self.rebuild_weather_rollups).result()
+        
+        conn.execute("DELETE FROM weather_rollups")
+        for resolution, (_, bucket_format) in ROLLUP_RESOLUTIONS.items():
+            conn.execute(f"""
+                INSERT INTO weather_rollups
+                SELECT ?, city, strftime('{bucket_format}', observed_at) AS bucket, COUNT(*),
+                       COUNT(temperature), TOTAL(temperature), MIN(temperature), MAX(temperature),
+                       COUNT(humidity), TOTAL(humidity), MIN(humidity), MAX(humidity)
+                FROM (
+                    SELECT city, temperature, humidity,
+                           COALESCE(json_extract(payload, '$.timestamp'), loaded_at) AS observed_at
+                    FROM weather
+                    WHERE city IS NOT NULL
+                )
+                WHERE bucket IS NOT NULL
+                GROUP BY city, bucket
+            """, (resolution,))
+    
+    def get_weather_trend(self, city=None, start=None, end=None, resolution=None, max_points=500):
+        """
+        Temperature and humidity over time per city, read from the rollups
+        
+        resolution is 'hour', 'day' or a bucket size in seconds. Without one,
+        the bucket is sized so the range returns about max_points points per city.
+        The coarsest rollup not coarser than the bucket is read, and re-bucketed
+        in SQL when the bucket is larger than the rollup.
+        """
+        with self.connect() as conn:
+            if resolution is None:
+                first, last = conn.execute(
+                    "SELECT MIN(bucket), MAX(bucket) FROM weather_rollups WHERE resolution = 'hour'"
+                ).fetchone()
+                if first is None:
+                    return pd.DataFrame()
+                range_start = pd.Timestamp(start or first)
+                range_end = pd.Timestamp(end or last)
+                # Whole hours, so automatic buckets line up with the rollups
+                hours = math.ceil((range_end - range_start).total_seconds() / max(max_points, 1) / 3600)
+                resolution = max(hours, 1) * 3600
+            elif isinstance(resolution, str):
+                resolution = ROLLUP_RESOLUTIONS[resolution][0]
             
-            # Map columns to warehouse schema
-            mapped_df = self.map_columns(data_df, dataset_name)
+            bucket_seconds = int(resolution)
+            rollup = 'hour'
+            for name, (seconds, _) in ROLLUP_RESOLUTIONS.items():
+                if seconds <= bucket_seconds:
+                    rollup = name
+            bucket_seconds = max(bucket_seconds, ROLLUP_RESOLUTIONS[rollup][0])
             
-            if mapped_df.empty:
-                logger.warning(f"No valid columns found for {dataset_name}, skipping storage")
-                return 0
+            filters = ["resolution = ?"]
+            params = [bucket_seconds, bucket_seconds, rollup]
+            if city:
+                filters.append("city = ?")
+                params.append(city)
+            if start:
+                filters.append("bucket >= ?")
+                params.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+            if end:
+                filters.append("bucket <= ?")
+                params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
             
-            with sqlite3.connect(self.db_path) as conn:
-                # Add loading timestamp
-                mapped_df = mapped_df.copy()
-                mapped_df['loaded_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Store data based on dataset type
-                if dataset_name == 'students':
-                    mapped_df.to_sql('students', conn, if_exists='append', index=False)
-                elif dataset_name == 'weather':
-                    mapped_df.to_sql('weather', conn, if_exists='append', index=False)
-                elif dataset_name == 'news':
-                    mapped_df.to_sql('news', conn, if_exists='append', index=False)
-                elif dataset_name == 'scores':
-                    mapped_df.to_sql('scores', conn, if_exists='append', index=False)
-                else:
-                    logger.warning(f"Unknown dataset type: {dataset_name}")
-                    return 0
-                
-                records_stored = len(mapped_df)
-                logger.info(f"Stored {records_stored} records for {dataset_name}")
-                return records_stored
-                
-        except Exception as e:
-            logger.error(f"Failed to store {dataset_name}: {e}")
-            raise
+            query = f"""
+                SELECT city,
+                       datetime((CAST(strftime('%s', bucket) AS INTEGER) / ?) * ?, 'unixepoch') AS bucket,
+                       SUM(readings) AS readings,
+                       SUM(temperature_sum) / NULLIF(SUM(temperature_count), 0) AS avg_temperature,
+                       MIN(temperature_min) AS min_temperature,
+                       MAX(temperature_max) AS max_temperature,
+                       SUM(humidity_sum) / NULLIF(SUM(humidity_count), 0) AS avg_humidity,
+                       MIN(humidity_min) AS min_humidity,
+                       MAX(humidity_max) AS max_humidity
+                FROM weather_rollups
+                WHERE {' AND '.join(filters)}
+                GROUP BY city, 2
+                ORDER BY city, 2
+            """
+            return pd.read_sql(query, conn, params=params)
+    
+    def get_table_columns(self, table_name):
+        """Return the column names of a queryable table, cached per manager"""
+        if table_name not in QUERYABLE_TABLES:
+            raise QueryError(f"Unknown warehouse table '{table_name}'")
+        
+        cached = table_name in self.table_columns
+        record_cache_lookup('table_columns', cached)
+        if not cached:
+            with self.connect() as conn:
+                # table_xinfo also lists generated columns; hidden == 1 marks virtual table internals
+                rows = conn.execute(f"PRAGMA table_xinfo({table_name})").fetchall()
+            self.table_columns[table_name] = [row[1] for row in rows if row[6] != 1]
+        
+        return self.table_columns[table_name]
     
-    def get_data(self, table_name, limit=100):
-        """Retrieve data from warehouse"""
+    def query(self, table_name, columns=None, filters=None, group_by=None,
+              aggregates=None, order_by=None, limit=None, offset=None, snapshot=False):
+        """
+        Run a filtered/grouped/aggregated query inside SQLite and return the result
+        
+        With snapshot=True the query reads the latest snapshot file instead of the
+        live database, so heavy reads never touch the file being loaded.
+        
+        Example:
+            warehouse.query('weather', group_by=['city'],
+                            aggregates={'avg_temp': ('avg', 'temperature'), 'readings': ('count', '*')},
+                            filters=[('temperature', '>', 20)], order_by=['-avg_temp'], limit=5)
+        """
+        sql, params = build_query(
+            table_name, self.get_table_columns(table_name),
+            columns=columns, filters=filters, group_by=group_by,
+            aggregates=aggregates, order_by=order_by, limit=limit, offset=offset
+        )
+        conn = self.connect_snapshot() if snapshot else self.connect()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                query = f"SELECT * FROM {table_name} ORDER BY loaded_at DESC LIMIT {limit}"
-                df = pd.read_sql(query, conn)
-                return df
-        except Exception as e:
-            logger.error(f"Failed to retrieve data from {table_name}: {e}")
-            return pd.DataFrame()
+            return pd.read_sql(sql, conn, params=params)
+        finally:
+            conn.close()
     
     def get_warehouse_summary(self):
-        """Get summary statistics from warehouse"""
+        """Get summary statistics from warehouse in constant time from the counter table"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
                 
+                cursor.execute("SELECT table_name, row_count, last_row_id FROM table_counters")
+                counters = {table: (count, last_row_id) for table, count, last_row_id in cursor.fetchall()}
+                
                 summary = {}
-                tables = ['students', 'weather', 'news', 'scores']
+                for table in WAREHOUSE_TABLES:
+                    summary[table] = counters.get(table, (0, None))[0]
                 
-                for table in tables:
-                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                    count = cursor.fetchone()[0]
-                    summary[table] = count
-                
-                # Get latest run info
-                cursor.execute("""
-                    SELECT run_id, start_time, end_time, status, records_processed 
-                    FROM pipeline_runs 
-                    ORDER BY start_time DESC 
-                    LIMIT 1
-                """)
-                latest_run = cursor.fetchone()
+                # Get latest run info through the pointer kept by the insert trigger
+                latest_run = None
+                latest_run_id = counters.get('pipeline_runs', (0, None))[1]
+                if latest_run_id is not None:
+                    cursor.execute("""
+                        SELECT run_id, start_time, end_time, status, records_processed 
+                        FROM pipeline_runs 
+                        WHERE id = ?
+                    """, (latest_run_id,))
+                    latest_run = cursor.fetchone()
                 
                 if latest_run:
                     summary['latest_run'] = {
@@ -292,79 +824,103 @@ class WarehouseManager:
             return {}
     
     def log_pipeline_run(self, run_id, start_time, end_time, status, records_processed, error_message=None):
-        """Log pipeline execution metadata"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
+        """Log pipeline execution metadata, completing the run's row if checkpointing created one"""
+        def write(conn):
+            updated = conn.execute("""
+                UPDATE pipeline_runs
+                SET start_time = ?, end_time = ?, status = ?, records_processed = ?, error_message = ?
+                WHERE id = (SELECT MAX(id) FROM pipeline_runs WHERE run_id = ?)
+            """, (start_time, end_time, status, records_processed, error_message, run_id)).rowcount
+            if not updated:
+                conn.execute("""
                     INSERT INTO pipeline_runs (run_id, start_time, end_time, status, records_processed, error_message)
                     VALUES (?, ?, ?, ?, ?, ?)
                 """, (run_id, start_time, end_time, status, records_processed, error_message))
-                conn.commit()
-                logger.info(f"Pipeline run logged: {run_id} - {status}")
+        
+        try:
+            self.writer.submit(write).result()
+            logger.info(f"Pipeline run logged: {run_id} - {status}")
         except Exception as e:
             logger.error(f"Failed to log pipeline run: {e}")
     
+    def log_stage_metrics(self, run_id, metrics):
+        """Store per-stage, per-dataset metrics of a run; metrics is a list of dicts with STAGE_METRIC_FIELDS"""
+        rows = [(run_id,) + tuple(entry.get(field) for field in STAGE_METRIC_FIELDS) for entry in metrics]
+        
+        def write(conn):
+            conn.executemany(f"""
+                INSERT INTO pipeline_stage_metrics (run_id, {', '.join(STAGE_METRIC_FIELDS)})
+                VALUES ({', '.join('?' for _ in range(len(STAGE_METRIC_FIELDS) + 1))})
+            """, rows)
+        
+        try:
+            self.writer.submit(write).result()
+        except Exception as e:
+            logger.error(f"Failed to log stage metrics: {e}")
+    
+    def save_checkpoint_state(self, run_id, start_time, state):
+        """Record which stages of a run are checkpointed, marking the run as RUNNING"""
+        state_json = json.dumps(state)
+        
+        def write(conn):
+            updated = conn.execute("""
+                UPDATE pipeline_runs SET status = 'RUNNING', checkpoint_state = ?
+                WHERE id = (SELECT MAX(id) FROM pipeline_runs WHERE run_id = ?)
+            """, (state_json, run_id)).rowcount
+            if not updated:
+                conn.execute("""
+                    INSERT INTO pipeline_runs (run_id, start_time, status, records_processed, checkpoint_state)
+                    VALUES (?, ?, 'RUNNING', 0, ?)
+                """, (run_id, start_time, state_json))
+        
+        self.writer.submit(write).result()
+    
+    def get_checkpoint_state(self, run_id):
+        """Return {'status', 'start_time', 'state'} for a run, or None if the run is unknown"""
+        with self.connect() as conn:
+            row = conn.execute("""
+                SELECT status, start_time, checkpoint_state FROM pipeline_runs
+                WHERE run_id = ? ORDER BY id DESC LIMIT 1
+            """, (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'start_time': row[1], 'state': json.loads(row[2]) if row[2] else {}}
+    
     def run_analytics(self):
-        """Run basic analytics on warehouse data"""
+        """Run analytics over the whole warehouse from the materialized aggregates"""
         try:
-            analytics = {}
-            
-            # Student analytics
-            students_df = self.get_data('students')
-            if not students_df.empty:
-                # Only use columns that actually exist
-                student_analytics = {
-                    'total_count': len(students_df)
-                }
-                
-                # Add available columns only
-                if 'Score' in students_df.columns:
-                    student_analytics['avg_score'] = float(students_df['Score'].mean())
-                if 'Attendance_Percentage' in students_df.columns:
-                    student_analytics['avg_attendance'] = float(students_df['Attendance_Percentage'].mean())
-                if 'Hours_Studied' in students_df.columns:
-                    student_analytics['avg_hours_studied'] = float(students_df['Hours_Studied'].mean())
-                if 'Course' in students_df.columns:
-                    student_analytics['courses'] = students_df['Course'].value_counts().to_dict()
-                if 'Grade' in students_df.columns:
-                    student_analytics['grade_distribution'] = students_df['Grade'].value_counts().to_dict()
-                if 'County' in students_df.columns:
-                    student_analytics['county_distribution'] = students_df['County'].value_counts().to_dict()
-                
-                analytics['students'] = student_analytics
-            
-            # Weather analytics
-            weather_df = self.get_data('weather')
-            if not weather_df.empty:
-                weather_analytics = {
-                    'total_records': len(weather_df)
-                }
-                
-                if 'temperature' in weather_df.columns:
-                    weather_analytics['avg_temperature'] = float(weather_df['temperature'].mean())
-                if 'city' in weather_df.columns:
-                    weather_analytics['cities'] = weather_df['city'].value_counts().to_dict()
-                if 'humidity' in weather_df.columns:
-                    weather_analytics['avg_humidity'] = float(weather_df['humidity'].mean())
-                if 'pressure' in weather_df.columns:
-                    weather_analytics['avg_pressure'] = float(weather_df['pressure'].mean())
-                
-                analytics['weather'] = weather_analytics
+            with self.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT table_name, column_name, value_count, value_sum FROM agg_measures")
+                measures = {(table, column): (count, total) for table, column, count, total in cursor.fetchall()}
+                
+                cursor.execute("""
+                    SELECT table_name, column_name, value, value_count FROM agg_value_counts
+                    WHERE value_count > 0
+                    ORDER BY value_count DESC, value
+                """)
+                value_counts = {}
+                for table, column, value, count in cursor.fetchall():
+                    value_counts.setdefault((table, column), {})[value] = count
             
-            # News analytics
-            news_df = self.get_data('news')
-            if not news_df.empty:
-                news_analytics = {
-                    'total_records': len(news_df)
-                }
-                
-                if 'source' in news_df.columns:
-                    news_analytics['sources'] = news_df['source'].value_counts().to_dict()
-                if 'category' in news_df.columns:
-                    news_analytics['categories'] = news_df['category'].value_counts().to_dict()
-                
-                analytics['news'] = news_analytics
+            analytics = {}
+            for table_name, spec in ANALYTICS_SPEC.items():
+                row_count = measures.get((table_name, ROW_COUNT_COLUMN), (0, 0))[0]
+                if not row_count:
+                    continue
+                
+                table_analytics = {spec['count_key']: row_count}
+                
+                for column, key in spec['averages'].items():
+                    count, total = measures.get((table_name, column), (0, 0))
+                    if count:
+                        table_analytics[key] = float(total / count)
+                
+                for column, key in spec['distributions'].items():
+                    if (table_name, column) in value_counts:
+                        table_analytics[key] = value_counts[(table_name, column)]
+                
+                analytics[table_name] = table_analytics
             
             return analytics
             
@@ -374,17 +930,268 @@ class WarehouseManager:
     
     def clear_warehouse(self):
         """Clear all data from warehouse (for testing/reset)"""
+        def write(conn):
+            tables = WAREHOUSE_TABLES + ['pipeline_runs', 'pipeline_stage_metrics', 'agg_measures',
+                                         'agg_value_counts', 'weather_rollups']
+            for table in tables:
+                conn.execute(f"DELETE FROM {table}")
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                tables = ['students', 'weather', 'news', 'scores', 'pipeline_runs']
-                
-                for table in tables:
-                    cursor.execute(f"DELETE FROM {table}")
-                
-                conn.commit()
-                logger.info("Warehouse cleared successfully")
+            self.writer.submit(write).result()
+            logger.info("Warehouse cleared successfully")
                 
         except Exception as e:
             logger.error(f"Failed to clear warehouse: {e}")
             raise
+        
+        self.reclaim_space()
+    
+    def archive_expired(self, now=None):
+        """
+        Move rows older than each table's retention window into monthly archive databases
+        
+        Rows go to <warehouse dir>/archive/<table>_<YYYY_MM>.db, which can be
+        opened directly or ATTACHed to query archived history. Aggregates keep
+        counting archived rows; table counters only count the hot rows.
+        Returns {table: rows archived}.
+        """
+        now = now or datetime.now()
+        archived = {}
+        
+        for table, days in self.retention_days.items():
+            if not days or table not in WAREHOUSE_TABLES:
+                continue
+            cutoff = (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+            
+            with self.connect() as conn:
+                months = [row[0] for row in conn.execute(
+                    f"SELECT DISTINCT substr(loaded_at, 1, 7) FROM {table} WHERE loaded_at < ?", (cutoff,)
+                ).fetchall()]
+            
+            for month in months:
+                archive_path = os.path.join(self.archive_dir, f"{table}_{month.replace('-', '_')}.db")
+                moved = self.writer.submit(
+                    lambda conn, table=table, month=month, path=archive_path:
+                        self.move_to_archive(conn, table, month, cutoff, path),
+                    transactional=False
+                ).result()
+                archived[table] = archived.get(table, 0) + moved
+                logger.info(f"Archived {moved} {table} rows from {month} to {archive_path}")
+        
+        return archived
+    
+    def move_to_archive(self, conn, table, month, cutoff, archive_path):
+        """Copy one month of expired rows into its archive database and delete them from the hot table"""
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        column_list = ', '.join(columns)
+        predicate = "substr(loaded_at, 1, 7) = ? AND loaded_at < ?"
+        
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT {column_list} FROM main.{table} WHERE 0")
+            archived_columns = {row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})").fetchall()}
+            for column in columns:
+                if column not in archived_columns:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+            
+            conn.execute(
+                f"INSERT INTO archive.{table} ({column_list}) SELECT {column_list} FROM main.{table} WHERE {predicate}",
+                (month, cutoff)
+            )
+            conn.execute(f"""
+                INSERT OR IGNORE INTO main.archived_runs (table_name, run_id, archive_path)
+                SELECT DISTINCT ?, run_id, ? FROM main.{table} WHERE {predicate} AND run_id IS NOT NULL
+            """, (table, archive_path, month, cutoff))
+            moved = conn.execute(f"DELETE FROM main.{table} WHERE {predicate}", (month, cutoff)).rowcount
+            conn.execute("COMMIT")
+            return moved
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+    
+    def enable_incremental_vacuum(self):
+        """Switch an existing warehouse to incremental auto-vacuum (rewrites the file once)"""
+        def vacuum(conn):
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        
+        self.writer.submit(vacuum, transactional=False).result()
+        logger.info("Incremental vacuum enabled")
+    
+    def reclaim_space(self, max_pages=None, step_pages=256, pause=0.05):
+        """
+        Return free pages to the filesystem in small incremental-vacuum steps
+        
+        Each step is a short write request, so loads queued on the writer run
+        between steps. Returns the number of pages released.
+        """
+        with self.connect() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.warning("Incremental vacuum is not enabled; call enable_incremental_vacuum() once")
+                return 0
+        
+        def vacuum_step(conn):
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({int(step_pages)})").fetchall()
+            return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        
+        released = 0
+        while max_pages is None or released < max_pages:
+            pages = self.writer.submit(vacuum_step).result()
+            if pages <= 0:
+                break
+            released += pages
+            time.sleep(pause)
+        
+        if released:
+            logger.info(f"Reclaimed {released} free pages from {self.db_path}")
+        return released
+    
+    def rebuild_news_index(self, optimize=True):
+        """Rebuild the headline search index from the news table, e.g. after bulk loads"""
+        def rebuild(conn):
+            conn.execute("INSERT INTO news_fts (news_fts) VALUES ('rebuild')")
+            if optimize:
+                conn.execute("INSERT INTO news_fts (news_fts) VALUES ('optimize')")
+        
+        self.writer.submit(rebuild).result()
+        logger.info("News search index rebuilt")
+    
+    def search_news(self, text, page=1, per_page=20):
+        """
+        Full-text search over news headlines, best matches first (BM25)
+        
+        Every word in `text` must match; end a word with '*' for a prefix
+        match. Returns the page of results plus the total number of matches.
+        """
+        match = build_match_query(text)
+        page = max(int(page), 1)
+        per_page = max(1, min(int(per_page), 100))
+        result = {'query': text, 'page': page, 'per_page': per_page, 'total': 0, 'results': []}
+        if not match:
+            return result
+        
+        with self.connect() as conn:
+            result['total'] = conn.execute(
+                "SELECT COUNT(*) FROM news_fts WHERE news_fts MATCH ?", (match,)
+            ).fetchone()[0]
+            
+            rows = conn.execute("""
+                SELECT news.id, news.headline, news.source, news.scraped_at, news.loaded_at,
+                       highlight(news_fts, 0, '<mark>', '</mark>'), bm25(news_fts) AS rank
+                FROM news_fts
+                JOIN news ON news.id = news_fts.rowid
+                WHERE news_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            """, (match, per_page, (page - 1) * per_page)).fetchall()
+        
+        columns = ['id', 'headline', 'source', 'scraped_at', 'loaded_at', 'highlighted', 'rank']
+        result['results'] = [dict(zip(columns, row)) for row in rows]
+        return result
+    
+    def backup(self, dest_path, pages=1024, sleep=0.005):
+        """
+        Copy a consistent image of the warehouse to dest_path with the online backup API
+        
+        The copy runs in steps of `pages` pages inside one read transaction, so
+        it neither blocks nor restarts because of concurrent loads. The file is
+        written under a temporary name and renamed into place when complete.
+        """
+        os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+        temp_path = dest_path + '.partial'
+        
+        source = self.connect()
+        dest = sqlite3.connect(temp_path)
+        try:
+            # Pin the read snapshot for the whole copy
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM table_counters LIMIT 1").fetchall()
+            source.backup(dest, pages=pages, sleep=sleep)
+            source.execute("COMMIT")
+            
+            # Snapshots are opened immutable, so they must not depend on a WAL file
+            dest.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dest.close()
+            source.close()
+        
+        os.replace(temp_path, dest_path)
+        logger.info(f"Warehouse backed up to {dest_path}")
+        return dest_path
+    
+    def create_snapshot(self, keep=3, pages=1024, sleep=0.005):
+        """Write a new snapshot for read-only readers and delete all but this database's newest `keep`"""
+        timestamp = datetime.now().strftime(SNAPSHOT_TIMESTAMP)
+        path = self.backup(os.path.join(self.snapshot_dir, f"{self.db_stem()}-{timestamp}.db"),
+                           pages=pages, sleep=sleep)
+        
+        for old_path in self.list_snapshots()[keep:]:
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                logger.warning(f"Could not remove old snapshot {old_path}: {e}")
+        return path
+    
+    def db_stem(self):
+        return os.path.splitext(os.path.basename(self.db_path))[0]
+    
+    def list_snapshots(self):
+        """Return this database's snapshot files, newest first; other databases may share the directory"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        stem = self.db_stem()
+        names = [name for name in os.listdir(self.snapshot_dir)
+                 if name.startswith(f"{stem}-") and SNAPSHOT_SUFFIX.fullmatch(name[len(stem):])]
+        return [os.path.join(self.snapshot_dir, name) for name in sorted(names, reverse=True)]
+    
+    def connect_snapshot(self):
+        """Open a read-only connection to the latest snapshot, creating one if none exists"""
+        snapshots = self.list_snapshots()
+        path = snapshots[0] if snapshots else self.create_snapshot()
+        # immutable=1 skips all locking: snapshot files never change once renamed into place
+        uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro&immutable=1"
+        return instrumented_connect(uri, self.query_stats, uri=True)
+    
+    def get_query_stats(self):
+        """Per-statement counts, latencies and histograms for every SQL statement issued"""
+        return self.query_stats.summary()
+    
+    def get_slow_queries(self):
+        """Recent statements over the slow-query threshold, with their EXPLAIN QUERY PLAN output"""
+        return list(self.query_stats.slow_queries)
+    
+    def run_maintenance(self, now=None, max_pages=None):
+        """Archive expired rows and reclaim the space they used; meant for idle periods"""
+        archived = self.archive_expired(now)
+        released = self.reclaim_space(max_pages=max_pages)
+        return {'archived': archived, 'pages_released': released}
+
+def create_warehouse(backend=None, db_path=None, sample=False):
+    """
+    Create the configured warehouse backend
+    
+    The backend is taken from the argument or the WAREHOUSE_BACKEND environment
+    variable: 'sqlite' (default, row store) or 'duckdb' (columnar). sample=True
+    opens the scratch warehouse used by sampled runs (SAMPLE_WAREHOUSE_DB_PATH).
+    It lives in a directory of its own, because the archive, snapshots and
+    change feed are kept next to the database file.
+    """
+    backend = (backend or os.getenv('WAREHOUSE_BACKEND', 'sqlite')).lower()
+    path_variable = 'SAMPLE_WAREHOUSE_DB_PATH' if sample else 'WAREHOUSE_DB_PATH'
+    default_path = 'warehouse/sample/sample_warehouse' if sample else 'warehouse/etl_warehouse'
+    
+    if backend == 'sqlite':
+        warehouse = WarehouseManager(db_path or os.getenv(path_variable, f'{default_path}.db'))
+    elif backend == 'duckdb':
+        from warehouse.duckdb_warehouse import DuckDBWarehouse
+        warehouse = DuckDBWarehouse(db_path or os.getenv(path_variable, f'{default_path}.duckdb'))
+    else:
+        raise ValueError(f"Unknown warehouse backend: {backend}")
+    warehouse.scratch = sample
+    return warehouse
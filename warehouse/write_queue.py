@@ -0,0 +1,196 @@
+import os
+import queue
+import sqlite3
+import threading
+import logging
+from concurrent.futures import Future, InvalidStateError
+from warehouse.query_stats import get_query_stats, instrumented_connect
+
+logger = logging.getLogger(__name__)
+
+# Seconds a connection waits on a locked database before raising
+BUSY_TIMEOUT = 30
+
+def fail(future, error):
+    """Set error on a future unless it was cancelled or already resolved"""
+    try:
+        future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+class WarehouseWriter:
+    """
+    Single writer thread for a SQLite warehouse file
+    
+    Producers submit write operations (callables that take a connection) and
+    get a Future back. The writer drains the queue, runs everything it has
+    collected in one transaction with a savepoint per request, and resolves
+    the futures once the transaction commits. A failing request is rolled
+    back to its savepoint without affecting the rest of the batch.
+    
+    Errors outside a request, such as a failed COMMIT or ROLLBACK, fail the
+    requests of the batch and the writer carries on with a rolled back or
+    reopened connection. If the connection cannot be reopened the writer
+    is broken: it fails every request from then on instead of leaving
+    callers waiting on futures nobody will resolve.
+    """
+    
+    def __init__(self, db_path, max_batch=64, max_wait=0.01):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.deferred = None
+        self.broken = None
+        # Opened here so a bad path fails the caller instead of the writer thread
+        self.conn = self.open_connection()
+        self.thread = threading.Thread(target=self.run, name=f"warehouse-writer-{os.path.basename(db_path)}", daemon=True)
+        self.thread.start()
+    
+    def open_connection(self):
+        return instrumented_connect(self.db_path, get_query_stats(self.db_path), timeout=BUSY_TIMEOUT,
+                                    isolation_level=None, check_same_thread=False)
+    
+    def submit(self, operation, transactional=True):
+        """
+        Queue operation(conn) for the writer thread and return a Future with its result
+        
+        Non-transactional operations run alone, outside any transaction, for
+        statements such as ATTACH or VACUUM that manage transactions themselves.
+        """
+        future = Future()
+        self.requests.put((operation, future, transactional))
+        return future
+    
+    def close(self):
+        """Finish queued writes and stop the writer thread"""
+        self.requests.put(None)
+        self.thread.join()
+    
+    def next_batch(self):
+        """Block for one request, then collect whatever else arrives within max_wait"""
+        if self.deferred is not None:
+            first, self.deferred = self.deferred, None
+        else:
+            first = self.requests.get()
+        if first is None:
+            return None
+        if not first[2]:
+            return [first]
+        
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                request = self.requests.get(timeout=self.max_wait)
+            except queue.Empty:
+                break
+            if request is None or not request[2]:
+                # Stop markers and non-transactional requests run after this batch
+                self.deferred = request
+                break
+            batch.append(request)
+        return batch
+    
+    def run(self):
+        """Writer thread main loop"""
+        try:
+            while True:
+                batch = self.next_batch()
+                if batch is None:
+                    break
+                if self.broken is not None:
+                    for _, future, _ in batch:
+                        fail(future, self.broken)
+                    continue
+                try:
+                    if batch[0][2]:
+                        self.execute_batch(self.conn, batch)
+                    else:
+                        self.execute_alone(self.conn, batch[0])
+                except Exception as e:
+                    # Resolve every future of the batch; callers wait on them without a timeout
+                    logger.error(f"Warehouse writer failed a batch of {len(batch)} requests: {e}")
+                    for _, future, _ in batch:
+                        fail(future, e)
+                    self.recover()
+        finally:
+            self.conn.close()
+    
+    def recover(self):
+        """Roll back after a failure outside a request, reopening the connection if that fails too"""
+        try:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            return
+        except Exception as e:
+            logger.error(f"Warehouse writer rollback failed, reopening its connection: {e}")
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        try:
+            self.conn = self.open_connection()
+        except Exception as e:
+            logger.error(f"Warehouse writer for {self.db_path} is broken: {e}")
+            self.broken = e
+    
+    def execute_alone(self, conn, request):
+        """Run a non-transactional request on the writer connection"""
+        operation, future, _ = request
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(operation(conn))
+        except Exception as e:
+            fail(future, e)
+            self.recover()
+    
+    def execute_batch(self, conn, batch):
+        """Run a batch of write requests in a single transaction"""
+        completed = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for _, future, _ in batch:
+                fail(future, e)
+            return
+        
+        for operation, future, _ in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT write_request")
+            try:
+                result = operation(conn)
+                conn.execute("RELEASE write_request")
+                completed.append((future, result))
+            except Exception as e:
+                conn.execute("ROLLBACK TO write_request")
+                conn.execute("RELEASE write_request")
+                fail(future, e)
+        
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Warehouse write batch failed to commit: {e}")
+            for future, _ in completed:
+                fail(future, e)
+            self.recover()
+            return
+        
+        if len(batch) > 1:
+            logger.info(f"Committed {len(batch)} warehouse write requests in one transaction")
+        for future, result in completed:
+            future.set_result(result)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(db_path):
+    """Return the shared writer for a database file, starting it on first use"""
+    key = os.path.abspath(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or not writer.thread.is_alive():
+            writer = WarehouseWriter(db_path)
+            _writers[key] = writer
+        return writer